@@ -0,0 +1,86 @@
+"""Attachment paths, byte ranges and content types.
+
+Attachments are served at '/_files' + article url + '/' + file name, e.g.
+'/_files/kittens/diagram.png'; files of the root article are at
+'/_files/diagram.png'.
+"""
+import mimetypes
+import re
+# Internal project imports
+from routing import article_url
+
+
+FILES_PREFIX = '/_files'
+FILE_NAME_RE = re.compile(r'[a-zA-Z0-9_-][a-zA-Z0-9_.-]{0,99}\Z')
+BYTE_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)\Z')
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+# Types, that browsers don't execute scripts in; others are downloaded rather
+# than displayed.
+INLINE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'application/pdf',
+                'text/plain')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadOffsetMismatch(UploadError):
+    """Chunk was sent for a wrong offset; args[0] is the number of bytes
+    received so far."""
+    @property
+    def offset(self):
+        return self.args[0]
+
+
+def attachment_path(path):
+    """Returns a tuple (article url, file name) for paths like
+    '/kittens/diagram.png' (without FILES_PREFIX), or None."""
+    head, _, name = path.rpartition('/')
+    if not FILE_NAME_RE.match(name):
+        return None
+    url = article_url(head or '/')
+    if url is None or (head and url != head):
+        return None
+    return url, name
+
+
+def file_url(article_url, name):
+    return FILES_PREFIX + article_url.rstrip('/') + '/' + name
+
+
+def content_type(name):
+    return mimetypes.guess_type(name)[0] or DEFAULT_CONTENT_TYPE
+
+
+def is_inline(content_type):
+    return content_type in INLINE_TYPES
+
+
+def parse_range(header, size):
+    """Returns a tuple (start, stop) of the byte range, that header asks for,
+    or None, if the whole content is to be sent. Only single ranges are
+    supported; for others the whole content is sent, as HTTP allows. Raises
+    RangeNotSatisfiable, if the range lies outside of the content."""
+    match = BYTE_RANGE_RE.match((header or '').replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last bytes.
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size
+    start = int(first)
+    stop = int(last) + 1 if last else None
+    if stop is not None and stop <= start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(stop or size, size)
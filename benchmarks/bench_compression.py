@@ -0,0 +1,70 @@
+"""Measures CPU cost and bytes saved by compressing rendered article pages of
+typical sizes with gzip at different levels.
+
+Usage:
+    python benchmarks/bench_compression.py [--sizes-kb 2,20,200,1000,5000]
+"""
+import argparse
+import datetime as dt
+import os
+import random
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from compression import compress
+from tools.snapshot import SnapshotArticle, SnapshotVersion
+
+WORDS = ('wiki article version history kitten edit link page user body head '
+         'lorem ipsum dolor sit amet consectetur adipiscing elit').split()
+LEVELS = (1, 6, 9)
+
+
+def article_body(size):
+    rnd = random.Random(size)
+    parts, length = [], 0
+    while length < size:
+        words = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 80)))
+        link = '<a href="/{0}">{0}</a>'.format(rnd.choice(WORDS))
+        part = u'<p>{} {}.</p>\n'.format(words, link)
+        parts.append(part)
+        length += len(part)
+    return u''.join(parts)
+
+
+def rendered_page(size):
+    from jinjacfg import get_template
+
+    article = SnapshotArticle(
+        u'/bench', u'Bench', dt.datetime(2015, 1, 1),
+        SnapshotVersion(1, article_body(size), True))
+    return get_template('wiki/view_page.html').render(
+        mode='view', article=article, user=None,
+        title=u'MyWiki').encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes-kb', default='2,20,200,1000,5000')
+    args = parser.parse_args()
+
+    print('{:>9} {:>6} {:>11} {:>8} {:>10}'.format(
+        'page, KB', 'level', 'gzip, KB', 'saved', 'cpu, ms'))
+    for size_kb in [int(s) for s in args.sizes_kb.split(',')]:
+        page = rendered_page(size_kb * 1024)
+        for level in LEVELS:
+            runs = max(1, 2000 // size_kb)
+            start = time.clock()
+            for _ in range(runs):
+                compressed = compress(page, 'gzip', level)
+            cpu = (time.clock() - start) / runs
+            print('{:9.0f} {:6d} {:11.1f} {:7.1f}% {:10.3f}'.format(
+                len(page) / 1024.0, level, len(compressed) / 1024.0,
+                100.0 * (1 - float(len(compressed)) / len(page)), cpu * 1000))
+
+
+if __name__ == '__main__':
+    main()
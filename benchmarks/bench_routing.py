@@ -0,0 +1,65 @@
+"""Compares matching of article paths by the former list of ARTICLE_RE based
+regexp routes and by routing.ArticleRoute, including pathological paths.
+
+Usage:
+    python benchmarks/bench_routing.py [--repeat 5] [--number 200]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from routing import ArticleRoute
+
+ARTICLE_RE = r'((?:/[a-zA-Z0-9_-]*)+?)/?'
+REGEXP_ROUTES = [re.compile('^' + regex + '$') for regex in [
+    r'/_delete' + ARTICLE_RE + r'_version/' + r'(\d+)',
+    r'/_edit' + ARTICLE_RE + r'_version/' + r'(\d+)',
+    r'/_edit' + ARTICLE_RE,
+    r'/_history' + ARTICLE_RE,
+    ARTICLE_RE + r'_version/' + r'(\d+)',
+    ARTICLE_RE,
+]]
+
+PATHS = [
+    ('short', '/kittens'),
+    ('versioned', '/kittens/black/_version/1234'),
+    ('deep, 200 levels', '/a' * 200),
+    ('long, 2000 chars', '/' + 'a' * 2000),
+    ('many slashes, 2000', '/' * 2000),
+    ('deep, invalid tail', '/ab' * 300 + '!'),
+    ('deep, bad version', '/a_' * 300 + '_version/x'),
+]
+
+
+def regexp_match(path):
+    for regex in REGEXP_ROUTES:
+        match = regex.match(path)
+        if match:
+            return match.groups()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    route = ArticleRoute('view', 'edit', 'history', 'delete')
+    print('{:<22} {:>14} {:>14}'.format('path', 'regexps, us', 'router, us'))
+    for name, path in PATHS:
+        timings = []
+        for fn in (regexp_match, route.match_path):
+            timer = timeit.Timer(lambda: fn(path))
+            best = min(timer.repeat(args.repeat, args.number)) / args.number
+            timings.append(best * 1e6)
+        print('{:<22} {:>14.1f} {:>14.1f}'.format(name, *timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Measures time spent importing the application (main.py) in a fresh
+process, with a per-module breakdown.
+
+Usage:
+    python benchmarks/import_time.py [--module main] [--top 25]
+
+App Engine SDK (and its bundled webapp2, jinja2 and webob) must be on
+PYTHONPATH.
+"""
+import __builtin__
+import argparse
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+class ImportTimer(object):
+    """Wraps __import__ and records inclusive and self time of every module
+    imported for the first time."""
+    def __init__(self):
+        self.inclusive = {}
+        self.own = {}
+        self._stack = []
+        self._original_import = None
+
+    def __enter__(self):
+        self._original_import = __builtin__.__import__
+        __builtin__.__import__ = self._import
+        return self
+
+    def __exit__(self, *exc_info):
+        __builtin__.__import__ = self._original_import
+
+    def _import(self, name, *args, **kwargs):
+        if name in sys.modules:
+            return self._original_import(name, *args, **kwargs)
+        self._stack.append(0.0)
+        start = time.time()
+        try:
+            return self._original_import(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            if name not in self.inclusive:
+                self.inclusive[name] = elapsed
+                self.own[name] = elapsed - children
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args()
+
+    os.environ.setdefault('APPLICATION_ID', 'udacity-webdev-final')
+    with ImportTimer() as timer:
+        start = time.time()
+        __import__(args.module)
+        total = time.time() - start
+
+    print('Importing {}: {:.1f} ms total\n'.format(args.module, total * 1000))
+    print('{:>10} {:>10}  module'.format('self, ms', 'incl., ms'))
+    rows = sorted(timer.own.items(), key=lambda r: r[1], reverse=True)
+    for name, own in rows[:args.top]:
+        print('{:10.1f} {:10.1f}  {}'.format(
+            own * 1000, timer.inclusive[name] * 1000, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Measures throughput and latency of the wiki handlers on a synthetic corpus
+of articles, served through the same testbed and webtest setup, as the tests
+use. Results are written as JSON, so that runs on different commits can be
+compared.
+
+Optional --rpc-latency delays every datastore call, which makes the effect of
+batching visible on the local stubs.
+
+Usage:
+    python benchmarks/load.py [--articles 50] [--versions 10] \\
+        [--body-size 2000 20000] [--requests 100] [--rpc-latency 0] \\
+        [--output results.json]
+
+App Engine SDK and webtest must be importable, like for the tests.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.join(PROJECT_ROOT, 'tests')
+for path in (PROJECT_ROOT, TESTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from google.appengine.api import apiproxy_stub_map
+
+from base import BaseTestCase
+
+PASSWORD = 'test123'
+PARAGRAPH = (u'<p>Lorem ipsum dolor sit amet, see <a href="/article_{0}">'
+             u'article {0}</a> and <a href="/missing_{0}">a missing one</a>.'
+             u'</p>\n')
+
+
+class LoadBenchmark(BaseTestCase):
+    def runTest(self):
+        pass
+
+
+def make_body(size, seed):
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = PARAGRAPH.format(seed + len(paragraphs))
+        paragraphs.append(paragraph)
+        length += len(paragraph)
+    return u''.join(paragraphs)
+
+
+def create_corpus(articles, versions, body_size):
+    """Creates articles directly through the models and returns a list of
+    (url, version ids) tuples."""
+    from model import Article
+
+    corpus = []
+    for i in range(articles):
+        url = '/article_{0}'.format(i)
+        Article.new(url, u'Article {0}'.format(i), make_body(body_size, i))
+        article = Article.by_url(url)
+        for j in range(1, versions):
+            article.new_version(u'Article {0}'.format(i),
+                                make_body(body_size, i + j))
+        corpus.append((url, [v.id for v in article.all_versions()]))
+    return corpus
+
+
+def delay_rpcs(latency):
+    def delay(service, call, request, response):
+        time.sleep(latency)
+
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'benchmark_latency', delay, 'datastore_v3')
+
+
+def percentile(timings, p):
+    index = int(round(p / 100.0 * (len(timings) - 1)))
+    return timings[index]
+
+
+def measure(request, count):
+    timings = []
+    start = time.time()
+    for i in range(count):
+        request_start = time.time()
+        request(i)
+        timings.append((time.time() - request_start) * 1000)
+    total = time.time() - start
+    timings.sort()
+    return {
+        'requests': count,
+        'throughput': count / total,
+        'mean_ms': sum(timings) / count,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'max_ms': timings[-1],
+    }
+
+
+def run_scenarios(bench, corpus, count, body_size):
+    app = bench.testapp
+    pick = random.Random(0).choice
+
+    def view(i):
+        app.get(pick(corpus)[0])
+
+    def versioned_view(i):
+        url, version_ids = pick(corpus)
+        app.get('{0}/_version/{1}'.format(url, pick(version_ids)))
+
+    def history(i):
+        app.get('/_history' + pick(corpus)[0])
+
+    def edit(i):
+        url = pick(corpus)[0]
+        app.post('/_edit' + url, {
+            'head': u'Edited {0}'.format(i),
+            'body': make_body(body_size, i)}, status=302)
+
+    def login(i):
+        app.post('/login', {'username': 'bench', 'password': PASSWORD},
+                 status=302)
+
+    def signup(i):
+        app.post('/signup', {
+            'username': 'user_{0}'.format(i), 'password': PASSWORD,
+            'verify': PASSWORD}, status=302)
+
+    bench.sign_up(username='bench', password=PASSWORD, verify=PASSWORD)
+    results = {}
+    for name, request in [('view', view), ('versioned_view', versioned_view),
+                          ('history', history), ('edit', edit),
+                          ('login', login), ('signup', signup)]:
+        results[name] = measure(request, count)
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=PROJECT_ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=50)
+    parser.add_argument('--versions', type=int, default=10)
+    parser.add_argument('--body-size', type=int, nargs='+',
+                        default=[2000, 20000], help='characters')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--rpc-latency', type=float, default=0,
+                        help='milliseconds added to every datastore call')
+    parser.add_argument('--output', help='JSON file; stdout by default')
+    args = parser.parse_args()
+
+    runs = []
+    for body_size in args.body_size:
+        bench = LoadBenchmark()
+        bench.setUp()
+        try:
+            import counters
+            counters.reset()
+            corpus = create_corpus(args.articles, args.versions, body_size)
+            if args.rpc_latency:
+                delay_rpcs(args.rpc_latency / 1000.0)
+            results = run_scenarios(bench, corpus, args.requests, body_size)
+        finally:
+            bench.tearDown()
+        runs.append({'body_size': body_size, 'results': results})
+
+    report = json.dumps({
+        'commit': current_commit(),
+        'articles': args.articles,
+        'versions': args.versions,
+        'rpc_latency_ms': args.rpc_latency,
+        'runs': runs,
+    }, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Reports peak and retained memory of wiki handlers depending on the number of
+versions and body size of an article, and checks peaks against BUDGETS
+(tests/memory_budget_tests.py fails, when they are exceeded).
+
+Every measurement runs in a fresh process on the testbed datastore stub: an
+article is created, a small article is requested first (to import modules and
+compile templates), then the handler is requested for the big one. Peak memory
+is measured with tracemalloc, if it is importable (Python 2 only has it as
+pytracemalloc on a patched interpreter); otherwise with resident set size from
+/proc (Linux), whose peak is reset before the request. Resident set size does
+not shrink, when memory is freed, so retained memory is counted in objects,
+tracked by gc, that outlive the request; tracemalloc reports retained bytes as
+well. Objects, retained by views, are mostly memcache entries and RPCs, held by
+the SDK's service stubs.
+
+Usage:
+    python benchmarks/memory.py [--versions 1 50] [--body-size 10000 500000] \\
+        [--handlers view history] [--check]
+
+With --check exits with status 1, if any measurement exceeds its budget.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+HANDLERS = ('view', 'versioned_view', 'history', 'edit')
+MB = 1024.0 * 1024
+# Allowed peak growth per handler: (constant MB, bytes per character of
+# article data, that the handler reads). View and edit read one body, history
+# reads all versions. Set about 25% above measured values; lower them, when
+# memory use improves. Both views check every link of the body, when its link
+# status is not cached, which takes most of their peak for link-heavy bodies.
+BUDGETS = {
+    'view': (4, 65),
+    'versioned_view': (4, 65),
+    'history': (10, 4),
+    'edit': (4, 22),
+}
+
+
+def data_size(handler, versions, body_size):
+    if handler == 'history':
+        return versions * body_size
+    return body_size
+
+
+def budget_mb(handler, versions, body_size):
+    constant, factor = BUDGETS[handler]
+    return constant + factor * data_size(handler, versions, body_size) / MB
+
+
+class RSSMeter(object):
+    libc = ctypes.CDLL(ctypes.util.find_library('c'))
+
+    @staticmethod
+    def _status(field):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+
+    def start(self):
+        gc.collect()
+        self.objects = len(gc.get_objects())
+        # Memory, freed after creating the corpus, is returned to the system,
+        # otherwise the request would reuse it unnoticed.
+        self.libc.malloc_trim(0)
+        # Writing 5 to clear_refs resets VmHWM, the peak resident set size.
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        self.before = self._status('VmRSS')
+
+    def stop(self):
+        """Returns a dict of results."""
+        peak = self._status('VmHWM') - self.before
+        gc.collect()
+        return {'peak_mb': peak / MB,
+                'retained_objects': len(gc.get_objects()) - self.objects}
+
+
+class TracemallocMeter(object):
+    def start(self):
+        gc.collect()
+        self.objects = len(gc.get_objects())
+        tracemalloc.start()
+
+    def stop(self):
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'peak_mb': peak / MB, 'retained_mb': current / MB,
+                'retained_objects': len(gc.get_objects()) - self.objects}
+
+
+def measure(handler, versions, body_size):
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'tests'))
+    from benchmarks.load import LoadBenchmark, create_corpus, make_body
+
+    bench = LoadBenchmark()
+    bench.setUp()
+    try:
+        bench.sign_up()
+        (url, version_ids), = create_corpus(1, versions, body_size)
+        from model import Article
+        warmup = Article.new('/warmup', u'Warm-up', make_body(100, 0))
+        paths = {
+            'view': '{0}',
+            'versioned_view': '{0}/_version/{1}',
+            'history': '/_history{0}',
+            'edit': '/_edit{0}',
+        }
+        # The warm-up article is requested with its own version: a version of
+        # the big article would fill its link status cache.
+        bench.testapp.get(paths[handler].format('/warmup', warmup.version.id))
+
+        meter = TracemallocMeter() if tracemalloc else RSSMeter()
+        path = paths[handler].format(url, version_ids[-1])
+        meter.start()
+        bench.testapp.get(path, status=200)
+        result = meter.stop()
+    finally:
+        bench.tearDown()
+    result['meter'] = 'tracemalloc' if tracemalloc else 'rss'
+    return result
+
+
+def run(handlers, versions_counts, body_sizes):
+    """Measures every combination in a fresh process; yields result dicts."""
+    # Child processes find modules, where this one does.
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    for handler in handlers:
+        for versions in versions_counts:
+            for body_size in body_sizes:
+                output = subprocess.check_output([
+                    sys.executable, os.path.abspath(__file__), '--measure',
+                    handler, str(versions), str(body_size)], env=env)
+                result = json.loads(output.splitlines()[-1])
+                result.update({
+                    'handler': handler, 'versions': versions,
+                    'body_size': body_size,
+                    'budget_mb': budget_mb(handler, versions, body_size)})
+                yield result
+
+
+def over_budget(results):
+    return [r for r in results if r['peak_mb'] > r['budget_mb']]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--handlers', nargs='+', default=HANDLERS,
+                        choices=HANDLERS)
+    parser.add_argument('--versions', type=int, nargs='+', default=[1, 50])
+    parser.add_argument('--body-size', type=int, nargs='+',
+                        default=[10000, 500000], help='characters')
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--measure', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        handler, versions, body_size = args.measure
+        print(json.dumps(measure(handler, int(versions), int(body_size))))
+        return
+
+    results = []
+    for result in run(args.handlers, args.versions, args.body_size):
+        results.append(result)
+        print('{handler:<15} versions {versions:>5} body {body_size:>8}'
+              '  peak {peak_mb:7.1f} MB  retained {retained_objects:>6} objects'
+              '  budget {budget_mb:7.1f} MB'.format(**result))
+
+    over = over_budget(results)
+    for r in over:
+        print('Over budget: {handler}, {versions} versions, body {body_size}'
+              .format(**r))
+    if args.check and over:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Compares peak memory of rendering a page as one string (Template.render)
+and in chunks (jinjacfg.render_chunks), for a large article and a long
+history. Every measurement runs in a fresh process and reports the growth of
+its maximum resident set size.
+
+Usage:
+    python benchmarks/render_memory.py [--body-mb 5] [--versions 10000]
+"""
+import argparse
+import datetime as dt
+import os
+import resource
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from tools.snapshot import SnapshotArticle, SnapshotVersion
+
+
+class FakeKey(object):
+    def __init__(self, version_id):
+        self.version_id = version_id
+
+    def __eq__(self, other):
+        return self.version_id == other.version_id
+
+
+class FakeVersion(object):
+    def __init__(self, version_id):
+        self.id = version_id
+        self.created = dt.datetime(2015, 1, 1)
+
+    def key(self):
+        return FakeKey(self.id)
+
+
+class FakeHistoryArticle(SnapshotArticle):
+    def __init__(self, versions):
+        version = SnapshotVersion(versions, u'', False)
+        super(FakeHistoryArticle, self).__init__(
+            u'/history', u'History', dt.datetime(2015, 1, 1), version)
+        self.versions = versions
+
+    def first_version_key(self):
+        return FakeKey(1)
+
+    def has_single_version(self):
+        return False
+
+    def all_versions(self):
+        # Lazy, like a datastore query.
+        return (FakeVersion(i) for i in xrange(self.versions, 0, -1))
+
+
+def page(name, body_mb, versions):
+    if name == 'view':
+        paragraph = u'<p>{}</p>\n'.format(u'Lorem ipsum dolor sit amet. ' * 20)
+        body = paragraph * (body_mb * 1024 * 1024 // len(paragraph))
+        article = SnapshotArticle(u'/big', u'Big', dt.datetime(2015, 1, 1),
+                                  SnapshotVersion(1, body, True))
+        return 'wiki/view_page.html', article
+    return 'wiki/history.html', FakeHistoryArticle(versions)
+
+
+def measure(name, mode, body_mb, versions):
+    from jinjacfg import get_template, render_chunks
+
+    template, article = page(name, body_mb, versions)
+    context = {'mode': name, 'article': article, 'user': True, 'title': u'T'}
+    get_template(template)
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Response keeps written pieces until the request ends, encoded.
+    response = []
+    if mode == 'string':
+        response.append(get_template(template).render(
+            context).encode('utf-8'))
+    else:
+        for chunk in render_chunks(template, context):
+            response.append(chunk.encode('utf-8'))
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (after - before) / 1024.0  # ru_maxrss is in KB on Linux
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--body-mb', type=int, default=5)
+    parser.add_argument('--versions', type=int, default=10000)
+    parser.add_argument('--measure', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(repr(measure(*(args.measure + [args.body_mb, args.versions]))))
+        return
+
+    for name in ('view', 'history'):
+        for mode in ('string', 'chunks'):
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                '--body-mb', str(args.body_mb),
+                '--versions', str(args.versions), '--measure', name, mode])
+            print('{:<8} {:<7} peak growth {:7.1f} MB'.format(
+                name, mode, float(output)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Measures cold start cost of templates: time to import jinjacfg and to load
+every template for the first time in a fresh process.
+
+Usage:
+    python benchmarks/template_cold_start.py [--runs N]
+
+Modes:
+    source    - FileSystemLoader without bytecode cache (the old setup);
+    bytecode  - FileSystemLoader with a warm file system bytecode cache;
+    compiled  - ModuleLoader over templates built by
+                tools/compile_templates.py.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+MODES = ('source', 'bytecode', 'compiled')
+
+
+def measure(mode, cache_dir, compiled_dir):
+    """Runs in a fresh process; returns seconds spent to load all templates."""
+    start = time.time()
+    import jinja2
+    import jinjacfg
+
+    if mode == 'source':
+        loader, bytecode_cache = jinja2.FileSystemLoader(
+            jinjacfg.TEMPLATES_DIR), None
+    elif mode == 'bytecode':
+        loader = jinja2.FileSystemLoader(jinjacfg.TEMPLATES_DIR)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+    else:
+        loader, bytecode_cache = jinja2.ModuleLoader(compiled_dir), None
+    environment = jinjacfg.make_environment(loader, bytecode_cache)
+    for name in jinja2.FileSystemLoader(
+            jinjacfg.TEMPLATES_DIR).list_templates():
+        environment.get_template(name)
+    return time.time() - start
+
+
+def run_in_subprocess(mode, cache_dir, compiled_dir):
+    output = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__), '--measure', mode,
+        cache_dir, compiled_dir])
+    return float(output)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--measure', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(repr(measure(*args.measure)))
+        return
+
+    from tools.compile_templates import compile_templates
+    cache_dir = tempfile.mkdtemp()
+    compiled_dir = tempfile.mkdtemp()
+    try:
+        compile_templates(compiled_dir)
+        # Warm up bytecode cache.
+        run_in_subprocess('bytecode', cache_dir, compiled_dir)
+        for mode in MODES:
+            timings = sorted(run_in_subprocess(mode, cache_dir, compiled_dir)
+                             for _ in range(args.runs))
+            print('{:<10} median {:7.1f} ms   min {:7.1f} ms'.format(
+                mode, timings[len(timings) // 2] * 1000, timings[0] * 1000))
+    finally:
+        shutil.rmtree(cache_dir)
+        shutil.rmtree(compiled_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import types
+import zlib
+
+
+COMPRESSIBLE_TYPES = ('text/', 'application/atom+xml', 'application/json',
+                      'application/javascript', 'application/xml')
+# Encodings in order of preference.
+ENCODINGS = ('gzip', 'deflate')
+COMPRESSION_LEVEL = 6
+# Above this size level 1 is used: it costs about 5 times less CPU and saves
+# only about 7% less bytes (see benchmarks/bench_compression.py).
+LARGE_BODY_SIZE = 512 * 1024  # bytes
+LARGE_BODY_COMPRESSION_LEVEL = 1
+MIN_SIZE = 512  # bytes; smaller responses don't win anything
+# Memcache refuses values bigger than 1 MB.
+MAX_CACHED_SIZE = 1000 * 1000
+# Bigger responses are passed through as they are, not to hold them in memory.
+MAX_COMPRESSED_SIZE = MAX_CACHED_SIZE  # bytes
+CACHE_PREFIX = 'compressed:'
+
+
+def parse_accept_encoding(header):
+    """Returns a dict of content codings to their q-values."""
+    accepted = {}
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = parse_accept_encoding(header or '')
+    best, best_q = None, 0.0
+    for coding in ENCODINGS:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding, level=None):
+    if level is None:
+        level = (COMPRESSION_LEVEL if len(body) < LARGE_BODY_SIZE else
+                 LARGE_BODY_COMPRESSION_LEVEL)
+    # 16 + MAX_WBITS makes zlib write gzip header and trailer.
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    return compressor.compress(body) + compressor.flush()
+
+
+def etag_suffix(encoding):
+    return '-' + encoding
+
+
+def add_etag_suffix(etag, encoding):
+    # '"abc"' -> '"abc-gzip"', 'W/"abc"' -> 'W/"abc-gzip"'
+    if etag.endswith('"'):
+        return etag[:-1] + etag_suffix(encoding) + '"'
+    return etag + etag_suffix(encoding)
+
+
+def strip_etag_suffixes(header):
+    # Compressed representations have their own ETags; application knows only
+    # the ETag of the uncompressed one.
+    for encoding in ENCODINGS:
+        header = header.replace(etag_suffix(encoding) + '"', '"')
+    return header
+
+
+def get_header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+
+
+def set_header(headers, name, value):
+    lower = name.lower()
+    headers = [(k, v) for k, v in headers if k.lower() != lower]
+    headers.append((name, value))
+    return headers
+
+
+def passthrough(written, app_iter, rest=None):
+    """Yields written chunks and then app_iter or rest, an iterator over it,
+    that has been partly consumed."""
+    try:
+        for chunk in written:
+            yield chunk
+        for chunk in rest or app_iter:
+            yield chunk
+    finally:
+        close(app_iter)
+
+
+def close(app_iter):
+    if hasattr(app_iter, 'close'):
+        app_iter.close()
+
+
+def is_streamed(headers, app_iter):
+    """Tells, if the response is sent as it is produced (e.g. a file, read
+    chunk by chunk) or is a part of a resource; such responses are never
+    buffered."""
+    return (isinstance(app_iter, types.GeneratorType) or
+            get_header(headers, 'Accept-Ranges') is not None or
+            get_header(headers, 'Content-Range') is not None)
+
+
+class CompressionMiddleware(object):
+    """Compresses responses with gzip or deflate, as negotiated by
+    Accept-Encoding.
+
+    If cache (an object with memcache-like get and set) is given, compressed
+    bytes of responses, that have an ETag, are stored there, so that the same
+    representation is never compressed twice.
+    """
+    def __init__(self, app, cache=None):
+        self.app = app
+        self.cache = cache
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            environ['HTTP_IF_NONE_MATCH'] = strip_etag_suffixes(if_none_match)
+
+        captured = {}
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            return written.append
+
+        app_iter = self.app(environ, capture)
+        status, headers = captured['status'], captured['headers']
+        content_type = get_header(headers, 'Content-Type') or ''
+        streamed = is_streamed(headers, app_iter)
+        if content_type.startswith(COMPRESSIBLE_TYPES) and not streamed:
+            headers = set_header(headers, 'Vary', self.vary(headers))
+
+        if status.startswith('304'):
+            headers = self.not_modified_etag(headers, encoding, if_none_match)
+
+        content_length = get_header(headers, 'Content-Length')
+        if (encoding is None or streamed or not status.startswith('200') or
+                not content_type.startswith(COMPRESSIBLE_TYPES) or
+                get_header(headers, 'Content-Encoding') or
+                int(content_length or 0) > MAX_COMPRESSED_SIZE):
+            start_response(status, headers, captured['exc_info'])
+            return passthrough(written, app_iter)
+
+        # Responses without Content-Length are buffered up to the limit only.
+        chunks, size = list(written), sum(len(chunk) for chunk in written)
+        rest = iter(app_iter)
+        try:
+            for chunk in rest:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > MAX_COMPRESSED_SIZE:
+                    start_response(status, headers, captured['exc_info'])
+                    return passthrough(chunks, app_iter, rest)
+        except Exception:
+            close(app_iter)
+            raise
+        close(app_iter)
+        body = ''.join(chunks)
+        if len(body) < MIN_SIZE:
+            start_response(status, headers, captured['exc_info'])
+            return [body]
+
+        etag = get_header(headers, 'ETag')
+        body = self.compressed(body, encoding, etag, self.url(environ))
+        if etag is not None:
+            headers = set_header(
+                headers, 'ETag', add_etag_suffix(etag, encoding))
+        headers = set_header(headers, 'Content-Encoding', encoding)
+        headers = set_header(headers, 'Content-Length', str(len(body)))
+        start_response(status, headers, captured['exc_info'])
+        return [body]
+
+    @staticmethod
+    def vary(headers):
+        vary = get_header(headers, 'Vary')
+        if not vary:
+            return 'Accept-Encoding'
+        if 'accept-encoding' in vary.lower():
+            return vary
+        return vary + ', Accept-Encoding'
+
+    @staticmethod
+    def not_modified_etag(headers, encoding, if_none_match):
+        """Returns headers of a 304 response with the ETag, the client has
+        matched: the compressed representation has its own one."""
+        etag = get_header(headers, 'ETag')
+        if etag is None or encoding is None:
+            return headers
+        compressed_etag = add_etag_suffix(etag, encoding)
+        if compressed_etag in if_none_match:
+            headers = set_header(headers, 'ETag', compressed_etag)
+        return headers
+
+    @staticmethod
+    def url(environ):
+        url = environ.get('PATH_INFO', '')
+        if environ.get('QUERY_STRING'):
+            url += '?' + environ['QUERY_STRING']
+        return url
+
+    def compressed(self, body, encoding, etag, url):
+        if self.cache is None or etag is None:
+            return compress(body, encoding)
+        # ETag identifies a representation of one resource only.
+        key = '{}{}:{}:{}'.format(CACHE_PREFIX, encoding, url, etag)
+        data = self.cache.get(key)
+        if data is None:
+            data = compress(body, encoding)
+            if len(data) <= MAX_CACHED_SIZE:
+                self.cache.set(key, data)
+        return data
@@ -0,0 +1,61 @@
+import collections
+import logging
+import threading
+import time
+# Third-party imports
+from google.appengine.ext import deferred
+# Internal project imports
+from model import PageViewCounter
+
+
+# Views are aggregated in instance memory and written to the datastore at most
+# once per FLUSH_INTERVAL, or earlier, if too many articles are pending. Views
+# are written by a task, so that no page view waits for the datastore.
+FLUSH_INTERVAL = 10  # seconds
+MAX_PENDING_URLS = 500
+
+_lock = threading.Lock()
+_pending = collections.Counter()
+_last_flush = time.time()
+
+
+def count_view(url):
+    global _pending, _last_flush
+    with _lock:
+        _pending[url] += 1
+        now = time.time()
+        if (now - _last_flush < FLUSH_INTERVAL and
+                len(_pending) < MAX_PENDING_URLS):
+            return
+        views, _pending, _last_flush = _pending, collections.Counter(), now
+    try:
+        deferred.defer(PageViewCounter.add_views, dict(views))
+    except Exception:
+        # Views are kept for the next flush; the page is shown anyway.
+        logging.exception('Failed to enqueue %d view count(s)', len(views))
+        _restore(views)
+
+
+def flush():
+    """Writes pending views right away."""
+    global _pending, _last_flush
+    with _lock:
+        views, _pending, _last_flush = (
+            _pending, collections.Counter(), time.time())
+    try:
+        PageViewCounter.add_views(views)
+    except Exception:
+        _restore(views)
+        raise
+
+
+def _restore(views):
+    with _lock:
+        _pending.update(views)
+
+
+def reset():
+    """Drops views, that have not been flushed yet."""
+    global _pending, _last_flush
+    with _lock:
+        _pending, _last_flush = collections.Counter(), time.time()
@@ -1,8 +1,8 @@
 import re
 # Third-party imports
 from wtforms import (
-    Form, StringField, PasswordField, TextAreaField, validators,
-    ValidationError, SubmitField)
+    Form, StringField, PasswordField, TextAreaField, HiddenField, SelectField,
+    validators, ValidationError, SubmitField)
 # Internal project imports
 from hashutils import check_against_hash
 from model import User
@@ -11,9 +11,13 @@ USERNAME_RE = re.compile(r"^[a-zA-Z0-9_-]+$")
 
 
 # Custom validators.
+def user_exists_message(name):
+    return 'User "{}" already exists!'.format(name)
+
+
 def user_exists(form, field):
-    if User.by_prop('name', field.data):
-        raise ValidationError('User "{}" already exists!'.format(field.data))
+    if User.by_name(field.data):
+        raise ValidationError(user_exists_message(field.data))
 
 
 def length(min, max):
@@ -73,11 +77,12 @@ class LoginForm(Form):
     def validate_password(form, field):
         message = 'Something is wrong with your username or password'
 
-        form._user = User.by_prop('name', form.username.data)
+        form._user = User.by_name(form.username.data)
         if not form._user:
             raise ValidationError(message)
+        # Hash is made of the name as it was given at signup.
         pwd_hash = form._user.password_hash
-        if not check_against_hash(form.username.data + field.data, pwd_hash):
+        if not check_against_hash(form._user.name + field.data, pwd_hash):
             raise ValidationError(message)
 
 
@@ -91,4 +96,16 @@ class EditForm(Form):
                     "characters")],
         id='wiki-head')
     body = TextAreaField('Article body', id='wiki-body')
+    markup = SelectField(
+        'Markup', choices=[('html', 'HTML'), ('markdown', 'Markdown')],
+        default='html', id='wiki-markup')
     submit = SubmitField('Save')
+
+
+class SectionEditForm(EditForm):
+    # Body holds only the section; the rest of the body is taken from the
+    # base version on save.
+    section = HiddenField()
+    base_version = HiddenField()
+    # Sections are saved in the markup of the latest version.
+    markup = HiddenField()
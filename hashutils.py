@@ -1,9 +1,23 @@
 import hashlib
+import hmac
+import os
 import random
 import string
+import threading
 
 
 HASH_DELIM = '|'
+# Current format is "pbkdf2_sha256$<iterations>$<salt>$<hash>"; hashes in the
+# legacy format "<sha256>|<salt>" are replaced on login.
+PBKDF2_ALGORITHM = 'pbkdf2_sha256'
+PBKDF2_DELIM = '$'
+# Pick with tools/calibrate_hash.py.
+PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', '20000'))
+# Hashing releases the GIL, so it doesn't stop other requests of the instance,
+# but too many concurrent hashes would take all of its CPU.
+MAX_CONCURRENT_HASHES = 4
+
+_hash_slots = threading.BoundedSemaphore(MAX_CONCURRENT_HASHES)
 
 
 def make_salt():
@@ -14,12 +28,36 @@ def encrypt(s):
     return hashlib.sha256(s).hexdigest()
 
 
-def make_hash(s):
+def _encode(s):
+    return s.encode('utf-8') if isinstance(s, unicode) else s
+
+
+def pbkdf2(s, salt, iterations):
+    with _hash_slots:
+        return hashlib.pbkdf2_hmac(
+            'sha256', _encode(s), _encode(salt), iterations).encode('hex')
+
+
+def make_hash(s, iterations=None):
+    iterations = iterations or PBKDF2_ITERATIONS
     salt = make_salt()
-    h = encrypt(s + salt)
-    return h + HASH_DELIM + salt
+    return PBKDF2_DELIM.join([PBKDF2_ALGORITHM, str(iterations), salt,
+                              pbkdf2(s, salt, iterations)])
 
 
 def check_against_hash(s, h):
+    if h.startswith(PBKDF2_ALGORITHM + PBKDF2_DELIM):
+        _, iterations, salt, hashed = h.split(PBKDF2_DELIM)
+        return hmac.compare_digest(
+            str(hashed), pbkdf2(s, salt, int(iterations)))
     hashed, salt = h.split(HASH_DELIM)
-    return hashed == encrypt(s + salt)
\ No newline at end of file
+    return hmac.compare_digest(
+        str(hashed), encrypt(_encode(s) + _encode(salt)))
+
+
+def needs_rehash(h):
+    """Tells if h was made in legacy format or with other number of
+    iterations, than currently configured."""
+    parts = h.split(PBKDF2_DELIM)
+    return parts[0] != PBKDF2_ALGORITHM or int(parts[1]) != PBKDF2_ITERATIONS
+
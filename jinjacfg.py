@@ -1,3 +1,4 @@
+import hashlib
 import os
 # Third-party imports
 import jinja2
@@ -31,22 +32,125 @@ def resolve_msg_from_errtype(error_type):
     return error_messages[error_type]
 
 
-jinja_environment = jinja2.Environment(
-    autoescape=True, loader=jinja2.FileSystemLoader(
-        os.path.join(os.path.dirname(__file__), 'templates')))
-jinja_environment.lstrip_blocks = True
-jinja_environment.trim_blocks = True
-
-detailed_error_messages = jinja_environment.get_template(
-    'wiki/detailed_error_messages.html').module
-
-jinja_environment.filters['timestampformat'] = timestamp_format
-
-jinja_environment.globals.update({
-    'view_version_url': view_version_url,
-    'edit_version_url': edit_version_url,
-    'delete_version_url': delete_version_url,
-    'resolve_msg_from_errtype': resolve_msg_from_errtype,
-    'getattr': getattr
-})
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+# Built by tools/compile_templates.py before deployment.
+COMPILED_TEMPLATES_DIR = os.path.join(
+    os.path.dirname(__file__), 'compiled_templates')
+# Hash of the sources, the templates were compiled from.
+SOURCES_HASH_FILE = 'SOURCES_HASH'
+BYTECODE_CACHE_PREFIX = 'jinja2/bytecode/'
+RENDER_CHUNK_SIZE = 32 * 1024  # characters
 
+
+def running_in_production():
+    return os.environ.get('SERVER_SOFTWARE', '').startswith(
+        'Google App Engine')
+
+
+def sources_hash(templates_dir=TEMPLATES_DIR):
+    """Returns a hash of names and contents of all templates."""
+    digest = hashlib.md5()
+    for name in jinja2.FileSystemLoader(templates_dir).list_templates():
+        with open(os.path.join(templates_dir, name), 'rb') as f:
+            digest.update(name + '\0' + f.read() + '\0')
+    return digest.hexdigest()
+
+
+def compiled_templates_are_current(compiled_dir=COMPILED_TEMPLATES_DIR,
+                                   templates_dir=TEMPLATES_DIR):
+    try:
+        with open(os.path.join(compiled_dir, SOURCES_HASH_FILE)) as f:
+            compiled_hash = f.read().strip()
+    except IOError:
+        return False
+    return compiled_hash == sources_hash(templates_dir)
+
+
+def make_loader():
+    # Precompiled templates are never checked against their sources, once
+    # loaded, so they are only used in production, where sources can't
+    # change, and only if they were compiled from the deployed sources.
+    if running_in_production() and compiled_templates_are_current():
+        return jinja2.ModuleLoader(COMPILED_TEMPLATES_DIR)
+    return jinja2.FileSystemLoader(TEMPLATES_DIR)
+
+
+def make_bytecode_cache():
+    if 'SERVER_SOFTWARE' in os.environ:
+        # File system of an instance is read-only, so bytecode is shared
+        # between instances via memcache.
+        from google.appengine.api import memcache
+        return jinja2.MemcachedBytecodeCache(
+            memcache, prefix=BYTECODE_CACHE_PREFIX)
+    return jinja2.FileSystemBytecodeCache()
+
+
+def make_environment(loader, bytecode_cache=None):
+    environment = jinja2.Environment(
+        autoescape=True, loader=loader, bytecode_cache=bytecode_cache)
+    environment.lstrip_blocks = True
+    environment.trim_blocks = True
+
+    environment.filters['timestampformat'] = timestamp_format
+
+    environment.globals.update({
+        'view_version_url': view_version_url,
+        'edit_version_url': edit_version_url,
+        'delete_version_url': delete_version_url,
+        'resolve_msg_from_errtype': resolve_msg_from_errtype,
+        'getattr': getattr
+    })
+
+    return environment
+
+
+_environment = None
+
+
+def get_environment():
+    """Returns the environment, creating it on first use."""
+    global _environment
+    if _environment is None:
+        loader = make_loader()
+        # Precompiled templates don't need bytecode cache.
+        bytecode_cache = None
+        if not isinstance(loader, jinja2.ModuleLoader):
+            bytecode_cache = make_bytecode_cache()
+        _environment = make_environment(loader, bytecode_cache)
+    return _environment
+
+
+def get_template(name):
+    return get_environment().get_template(name)
+
+
+def preload_templates():
+    # ModuleLoader can't list templates, so names are taken from sources.
+    names = jinja2.FileSystemLoader(TEMPLATES_DIR).list_templates()
+    for name in names:
+        get_template(name)
+    return names
+
+
+def render_chunks(template_name, context, chunk_size=RENDER_CHUNK_SIZE):
+    """Renders template incrementally. Template yields lots of tiny pieces;
+    they are joined into chunks of about chunk_size characters, so that the
+    page is never built as a whole."""
+    t = get_template(template_name)
+    buf, size = [], 0
+    for piece in t.generate(context):
+        if len(piece) >= chunk_size:
+            # Big pieces (e.g. article body) are passed through as is, not to
+            # copy them once more.
+            if buf:
+                yield u''.join(buf)
+                buf, size = [], 0
+            yield piece
+            continue
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield u''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield u''.join(buf)
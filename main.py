@@ -1,16 +1,50 @@
 # --coding:utf-8--
+import hashlib
+import logging
+import json
+import os
 import re
+import time
+import urllib
 # Third-party imports
+from google.appengine.api import memcache
+from google.appengine.ext import db
 import webapp2
 # Project-specific imports
-from forms import EditForm, LoginForm, SignupForm
-from hashutils import encrypt, make_hash, make_salt
-from jinjacfg import jinja_environment, resolve_msg_from_errtype
-from model import GLOBAL_PARENT, User, Session, Article, Version
+import counters
+import perfstats
+import pipeline
+import profiling
+from attachments import (
+    RangeNotSatisfiable, UploadError, UploadOffsetMismatch, attachment_path,
+    file_url, is_inline, parse_range)
+from compression import CompressionMiddleware
+from hashutils import encrypt, make_hash, make_salt, needs_rehash
+from jinjacfg import (
+    get_template, preload_templates, render_chunks, resolve_msg_from_errtype)
+from model import (
+    User, Session, SessionCleanup, Article, Version, HistoryCompaction,
+    RecentChanges, PopularPages, PopularPagesComputation, RequestProfile,
+    Attachment, AttachmentUpload, Reprocessing, UploadCleanup,
+    ATTACHMENT_CHUNK_SIZE, fits_key_name, global_parent)
+from routing import ArticleRoute
+from sections import SectionConflict, merge_section, split_sections
+
+# Forms are imported inside handlers, that use them, because importing
+# wtforms takes a noticeable part of instance startup.
 
 # Setup logging
-import logging
-logging.getLogger().setLevel(logging.DEBUG)
+if os.environ.get('SERVER_SOFTWARE', '').startswith('Development'):
+    logging.getLogger().setLevel(logging.DEBUG)
+
+SECTION_CONFLICT_MESSAGE = (
+    'This section has been changed by somebody else since you started '
+    'editing. Save again to replace their changes.')
+
+# Cron requests are stopped after 10 minutes.
+CRON_TIME_BUDGET = 8 * 60  # seconds
+PREVIEW_CACHE_TIME = 60 * 60  # seconds
+PREVIEW_CACHE_PREFIX = 'preview:'
 
 
 # Handlers
@@ -33,6 +67,13 @@ class BaseHandler(webapp2.RequestHandler):
                 return True
 
     def dispatch(self):
+        if profiling.is_requested(self.request):
+            profiling.run(self._dispatch, self.request, self.response,
+                          type(self).__name__)
+        else:
+            self._dispatch()
+
+    def _dispatch(self):
         super(BaseHandler, self).dispatch()
         # logout_url must be initially set in overriding class; it may change
         # inside handling method.
@@ -72,6 +113,8 @@ class BaseHandler(webapp2.RequestHandler):
     def set_title(self):
         mode_to_title = {
             'new': 'New Article', 'signup': 'Sign Up', 'login': 'Login',
+            'recent': 'Recent Changes', 'index': 'All Articles',
+            'popular': 'Most Popular',
             'view': lambda c: c['article'].head,
             'edit': lambda c: '{} (edit)'.format(c['article'].head),
             'history': lambda c: '{} (history)'.format(c['article'].head),
@@ -95,16 +138,29 @@ class BaseHandler(webapp2.RequestHandler):
 
     @staticmethod
     def render_str(template, **context):
-        t = jinja_environment.get_template(template)
-        return t.render(context)
+        t = get_template(template)
+        with perfstats.timing_render():
+            return t.render(context)
 
     def render(self):
         self.set_title()
-        self.write(self.render_str(self.template, **self.context))
+        with perfstats.timing_render():
+            for chunk in render_chunks(self.template, self.context):
+                self.write(chunk)
 
     def write(self, *args, **kwargs):
         self.response.out.write(*args, **kwargs)
 
+    def is_not_modified(self, etag):
+        # Sets ETag on response; if client already has the same representation,
+        # response is turned into 304 and True is returned.
+        self.response.etag = etag
+        if etag in self.request.if_none_match:
+            self.response.set_status(304)
+            self.response.headers.pop('Content-Type', None)
+            return True
+        return False
+
     def redirect_with_cookie(self, path, new_cookies):
         for k in self.request.cookies:
             if k not in new_cookies:
@@ -131,8 +187,7 @@ class AuthPageHandler(BaseHandler):
     @staticmethod
     def get_new_session_cookie(user):
         sid = encrypt(user.name + user.password_hash + make_salt())
-        session = Session(sid=sid, user=user, parent=GLOBAL_PARENT)
-        session.put()
+        Session.start(sid, user)
         return {'sid': sid}
 
 
@@ -150,6 +205,8 @@ class SignupPage(AuthPageHandler):
         super(SignupPage, self).dispatch()
 
     def _get(self):
+        from forms import SignupForm
+
         return_to = self.request.get('return_to')
         if return_to:
             self.response.set_cookie('referrer', return_to)
@@ -158,20 +215,23 @@ class SignupPage(AuthPageHandler):
         self.render()
 
     def _post(self):
+        from forms import SignupForm, user_exists_message
+
         form = SignupForm(self.request.params)
         redirect_path = self.request.cookies.get('referrer', '/')
 
+        user = None
         if form.validate():
             username = form.username.data
             pwd = form.password.data
             pwd_hash = make_hash(username + pwd)
 
-            user = User(name=username, password_hash=pwd_hash,
-                        parent=GLOBAL_PARENT)
-            if form.email.data:
-                user.email = form.email.data
-            user.put()
+            # The name might have been taken after validation.
+            user = User.create(username, pwd_hash, form.email.data)
+            if user is None:
+                form.username.errors.append(user_exists_message(username))
 
+        if user is not None:
             self.redirect_with_cookie(
                 redirect_path, self.get_new_session_cookie(user))
         else:
@@ -189,6 +249,8 @@ class LoginPage(AuthPageHandler):
         super(LoginPage, self).dispatch()
 
     def _get(self):
+        from forms import LoginForm
+
         return_to = self.request.get('return_to')
         if return_to:
             self.response.set_cookie('referrer', return_to)
@@ -197,12 +259,20 @@ class LoginPage(AuthPageHandler):
         self.render()
 
     def _post(self):
+        from forms import LoginForm
+
         form = LoginForm(self.request.params)
         redirect_path = self.request.cookies.get('referrer', '/')
 
         if form.validate():
+            user = form._user
+            # Hashes of old format or strength are replaced, while the
+            # password is known.
+            if needs_rehash(user.password_hash):
+                user.password_hash = make_hash(user.name + form.password.data)
+                user.put()
             self.redirect_with_cookie(
-                redirect_path, self.get_new_session_cookie(form._user))
+                redirect_path, self.get_new_session_cookie(user))
         else:
             form.password.data = ''
             self.context['form'] = form
@@ -240,13 +310,16 @@ class ViewPage(BaseHandler):
                 default_body = (
                     '<p>You are free to create new articles and edit existing '
                     'ones.</p>')
+                # Another request may have created it meanwhile.
                 article = Article.new(
-                    url='/', body=default_body, head='Welcome to MyWiki!')
+                    url='/', body=default_body,
+                    head='Welcome to MyWiki!') or Article.by_url('/')
             elif self.user is None:
                 self.context['url'] = url
                 self.abort(404)
             else:
                 self.redirect('/_edit' + url, abort=True)
+        counters.count_view(url)
         self.context.update({'article': article, 'user': self.user})
 
         self.render()
@@ -292,9 +365,21 @@ class EditPage(BaseHandler):
         words = path.strip('/').split('_')
         return ' '.join([w.capitalize() for w in words])
 
+    def section_index(self):
+        # Sections are addressed with ?section=N; None means the whole body.
+        section = self.request.get('section')
+        if not section:
+            return None
+        if not section.isdigit():
+            self.abort(400)
+        return int(section)
+
     def _get(self, url, version=None):
         if self.user is None:
             self.redirect_with_cookie('/login', {'referrer': self.request.url})
+        from forms import EditForm, SectionEditForm
+
+        section = self.section_index()
         form = EditForm()
         if version is None:
             article = Article.by_url(url)
@@ -306,14 +391,28 @@ class EditPage(BaseHandler):
                 default_body = (
                     '<p>You are free to create new articles and edit existing '
                     'ones.</p>')
+                # Another request may have created it meanwhile.
                 article = Article.new(
-                    url='/', body=default_body, head='Welcome to MyWiki!')
+                    url='/', body=default_body,
+                    head='Welcome to MyWiki!') or Article.by_url('/')
+            elif not fits_key_name(url):
+                # Such articles can't be stored.
+                self.abort(400)
             else:
                 self.context.update({'mode': 'new', 'logout_url': '/'})
                 form.head.data = self.form_head_from_path(url)
-        else:
+        elif section is None:
             form.head.data = article.head
             form.body.data = article.body
+            form.markup.data = article.version.body_markup()
+        else:
+            markup = article.version.body_markup()
+            sections = split_sections(article.body, markup)
+            if section >= len(sections):
+                self.abort(404)
+            form = SectionEditForm(
+                head=article.head, body=sections[section], section=section,
+                base_version=article.version.id, markup=markup)
 
         self.context.update(
             {'form': form, 'article': article, 'user': self.user})
@@ -322,6 +421,10 @@ class EditPage(BaseHandler):
     def _post(self, url, version=None):
         if self.user is None:
             self.redirect('/login', abort=True)
+        from forms import EditForm
+
+        if self.section_index() is not None:
+            return self.post_section(url, version)
 
         form = EditForm(self.request.params)
         if version is None:
@@ -330,19 +433,100 @@ class EditPage(BaseHandler):
             article = Article.by_url(url, version)
 
         if article is None:
+            if not fits_key_name(url):
+                self.abort(400)
             self.context['mode'] = 'new'
 
         if form.validate():
             if self.context['mode'] == 'new':
-                Article.new(url, form.head.data, form.body.data)
+                created = Article.new(url, form.head.data, form.body.data,
+                                      self.user, form.markup.data)
+                if created is None:
+                    # Somebody has created it meanwhile; the save becomes an
+                    # edit, so that no version is lost.
+                    article = Article.by_url(url, project_with_version=False)
+                    article.new_version(form.head.data, form.body.data,
+                                        self.user, form.markup.data)
             else:
-                article.new_version(form.head.data, form.body.data)
+                article.new_version(form.head.data, form.body.data,
+                                    self.user, form.markup.data)
             self.redirect(url)
         else:
             self.context.update(
                 {'user': self.user, 'form': form, 'article': article})
             self.render()
 
+    def post_section(self, url, version=None):
+        # Section is put into the latest version, unless it has changed
+        # there since the base version, that the user has edited.
+        from forms import SectionEditForm
+
+        form = SectionEditForm(self.request.params)
+        article = Article.by_url(url, version)
+        if article is None:
+            self.abort(404)
+
+        if form.validate():
+            latest = article.latest_version
+            base = None
+            if form.base_version.data.isdigit():
+                base = Version.by_id(int(form.base_version.data))
+            markup = latest.body_markup()
+            try:
+                if (base is None or not base.belongs_to_article(article) or
+                        base.body_markup() != markup):
+                    raise SectionConflict(form.section.data)
+                body = merge_section(base.body, latest.body,
+                                     self.section_index(), form.body.data,
+                                     markup)
+            except SectionConflict:
+                form.body.errors.append(SECTION_CONFLICT_MESSAGE)
+                # Saving again overwrites the section of the latest version.
+                form.base_version.data = latest.id
+                form.markup.data = markup
+            else:
+                article.new_version(form.head.data, body, self.user, markup)
+                self.redirect(url)
+                return
+
+        self.context.update(
+            {'user': self.user, 'form': form, 'article': article})
+        self.render()
+
+
+class PreviewPage(BaseHandler):
+    """Processes a body, that is being edited, block by block. Processed
+    blocks are cached by hash, so that only changed blocks are processed
+    again. Blocks, whose hashes the client lists in known, are sent without
+    HTML."""
+    def _post(self):
+        if self.user is None:
+            self.abort(403)
+        markup = self.request.get('markup') or pipeline.DEFAULT_MARKUP
+        if markup not in pipeline.CONVERTERS:
+            self.abort(400)
+
+        blocks = pipeline.blocks(self.request.get('body'), markup)
+        # Blocks, that clients know from an older pipeline, are sent again.
+        hashes = [hashlib.sha1(u'{}\n{}\n{}'.format(
+            pipeline.PIPELINE_ID, markup, block).encode('utf-8')).hexdigest()
+            for block in blocks]
+        known = set(self.request.get('known').split(','))
+        html = memcache.get_multi(
+            [h for h in set(hashes) if h not in known],
+            key_prefix=PREVIEW_CACHE_PREFIX)
+        processed = {}
+        for block, h in zip(blocks, hashes):
+            if h not in known and h not in html:
+                html[h] = processed[h] = pipeline.process(block, markup)
+        if processed:
+            memcache.set_multi(processed, key_prefix=PREVIEW_CACHE_PREFIX,
+                               time=PREVIEW_CACHE_TIME)
+
+        self.response.content_type = 'application/json'
+        self.write(json.dumps({'blocks': [
+            {'hash': h, 'html': html.get(h)} for h in hashes]}))
+
 
 class DeleteVersion(BaseHandler):
     def _handle_exception(self, exception, debug):
@@ -392,16 +576,298 @@ class DeleteVersion(BaseHandler):
             self.redirect(url)
 
 
-ARTICLE_RE = r'((?:/[a-zA-Z0-9_-]*)+?)/?'
+class RecentChangesPage(BaseHandler):
+    template = "wiki/recent.html"
+
+    def dispatch(self):
+        self.context.update({'mode': 'recent', 'logout_url': '/_recent'})
+        super(RecentChangesPage, self).dispatch()
+
+    def _get(self):
+        changes, etag = RecentChanges.fetch()
+        # Page differs for signed in users, so is the ETag.
+        if self.user is not None:
+            etag = '{}-{}'.format(etag, self.user.key().id_or_name())
+        if self.is_not_modified(etag):
+            return
+        self.context.update({'changes': changes, 'user': self.user})
+        self.render()
+
+
+class RecentChangesFeed(BaseHandler):
+    template = "wiki/recent.atom"
+
+    def _get(self):
+        changes, etag = RecentChanges.fetch()
+        if self.is_not_modified(etag):
+            return
+        self.response.content_type = 'application/atom+xml'
+        self.write(self.render_str(
+            self.template, changes=changes, host_url=self.request.host_url))
+
+
+class IndexPage(BaseHandler):
+    template = "wiki/index.html"
+
+    def dispatch(self):
+        self.context.update({'mode': 'index', 'logout_url': '/_index'})
+        super(IndexPage, self).dispatch()
+
+    def _get(self):
+        cursor = self.request.get('cursor') or None
+        try:
+            urls, next_cursor = Article.index_page(cursor)
+        except (db.BadValueError, db.BadRequestError):
+            self.abort(400)
+
+        next_url = None
+        if next_cursor is not None:
+            next_url = '/_index?' + urllib.urlencode({'cursor': next_cursor})
+        self.context.update(
+            {'urls': urls, 'next_url': next_url, 'user': self.user})
+        self.render()
+
+
+class PopularPage(BaseHandler):
+    template = "wiki/popular.html"
+
+    def dispatch(self):
+        self.context.update({'mode': 'popular', 'logout_url': '/_popular'})
+        super(PopularPage, self).dispatch()
+
+    def _get(self):
+        self.context.update({'pages': PopularPages.fetch(), 'user': self.user})
+        self.render()
+
+
+class AttachmentPage(BaseHandler):
+    """Serves and uploads files, attached to articles. An upload takes
+    several POST requests to the file url:
+
+        (no parameters)                   starts an upload
+        ?upload=<id>&offset=<n>           appends the request body as a chunk
+        ?upload=<id>&finish=1             makes the attachment
+
+    Every chunk but the last one is chunk_size bytes long. Responses are JSON
+    with upload id, offset (bytes received so far) and chunk_size; after an
+    error an upload is resumed from offset.
+    """
+    def target(self, path):
+        target = attachment_path(path)
+        if target is None:
+            self.abort(404)
+        return target
+
+    def get(self, path):
+        # Downloads don't depend on the user.
+        self._get(path)
+
+    def _get(self, path):
+        attachment = Attachment.by_name(*self.target(path))
+        if attachment is None:
+            self.abort(404)
+
+        self.response.headers['Accept-Ranges'] = 'bytes'
+        if self.is_not_modified(attachment.sha256):
+            return
+        size = attachment.size
+        byte_range = None
+        # Range applies only to the representation, the client has a part of.
+        if_range = self.request.headers.get('If-Range')
+        if if_range is None or if_range == self.response.headers['ETag']:
+            try:
+                byte_range = parse_range(
+                    self.request.headers.get('Range'), size)
+            except RangeNotSatisfiable:
+                self.response.set_status(416)
+                self.response.headers['Content-Range'] = 'bytes */{}'.format(
+                    size)
+                return
+
+        content_type = str(attachment.content_type)
+        self.response.content_type = content_type
+        self.response.headers['X-Content-Type-Options'] = 'nosniff'
+        disposition = 'inline' if is_inline(content_type) else 'attachment'
+        self.response.headers['Content-Disposition'] = (
+            '{}; filename="{}"'.format(disposition, attachment.name))
+        start, stop = byte_range or (0, size)
+        if byte_range is not None:
+            self.response.set_status(206)
+            self.response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, stop - 1, size)
+        self.response.app_iter = attachment.read(start, stop)
+        self.response.content_length = stop - start
+
+    def _post(self, path):
+        url, name = self.target(path)
+        if self.user is None:
+            self.abort(403)
+        # Parameters are taken from the query only, so that chunks aren't
+        # parsed as forms.
+        params = self.request.GET
+        if 'upload' not in params:
+            article = Article.by_url(url, project_with_version=False)
+            if article is None:
+                self.abort(404)
+            self.response.set_status(201)
+            # Files of articles, that are not yet keyed by url, are attached
+            # under the key, that tools/rekey_articles.py moves them to.
+            return self.write_upload(AttachmentUpload.start(
+                Article.key_for_url(url), name, self.user))
+
+        upload = AttachmentUpload.get_by_key_name(params['upload'][:64])
+        if (upload is None or upload.name != name or
+                upload.article_key().name() != url or
+                upload.author_key() != self.user.key()):
+            self.abort(404)
+
+        if params.get('finish'):
+            attachment = upload.finish()
+            if attachment is None:
+                self.abort(404)
+            self.response.set_status(201)
+            return self.write_json(
+                {'url': file_url(url, name), 'size': attachment.size,
+                 'sha256': attachment.sha256})
+
+        offset = params.get('offset', '')
+        if not offset.isdigit():
+            self.abort(400)
+        if self.request.content_length > ATTACHMENT_CHUNK_SIZE:
+            self.abort(413)
+        try:
+            upload.append(int(offset), self.request.body)
+        except UploadOffsetMismatch as e:
+            self.response.set_status(409)
+            upload.size = e.offset
+        except UploadError as e:
+            self.response.set_status(400)
+            return self.write_json({'error': str(e), 'offset': upload.size})
+        self.write_upload(upload)
+
+    def write_upload(self, upload):
+        self.write_json({'upload': upload.upload_id, 'offset': upload.size,
+                         'chunk_size': ATTACHMENT_CHUNK_SIZE})
+
+    def write_json(self, data):
+        self.response.content_type = 'application/json'
+        self.write(json.dumps(data))
+
+
+class Warmup(webapp2.RequestHandler):
+    # Called by App Engine before an instance starts serving traffic.
+    def get(self):
+        import forms  # imports wtforms as well
+
+        preload_templates()
+        global_parent()
+        Article.index_page()
+
+
+# Cron jobs; access is restricted to admins in app.yaml.
+class PopularPagesJob(webapp2.RequestHandler):
+    def get(self):
+        counters.flush()
+        deadline = time.time() + CRON_TIME_BUDGET
+        counted, finished = PopularPagesComputation.run(deadline=deadline)
+        logging.info('Counted %d view counter shard(s)%s', counted,
+                     '' if finished else ', to be continued')
+
+
+class SessionCleanupJob(webapp2.RequestHandler):
+    def get(self):
+        # Unfinished cleanup is resumed by the next run.
+        deadline = time.time() + CRON_TIME_BUDGET
+        deleted, finished = SessionCleanup.run(deadline=deadline)
+        logging.info('Deleted %d expired session(s)%s', deleted,
+                     '' if finished else ', to be continued')
+
+
+class UploadCleanupJob(webapp2.RequestHandler):
+    def get(self):
+        deadline = time.time() + CRON_TIME_BUDGET
+        deleted, finished = UploadCleanup.run(deadline=deadline)
+        logging.info('Deleted %d abandoned upload(s)%s', deleted,
+                     '' if finished else ', to be continued')
+
+
+class HistoryCompactionJob(webapp2.RequestHandler):
+    def get(self):
+        deadline = time.time() + CRON_TIME_BUDGET
+        deleted, finished = HistoryCompaction.run(deadline=deadline)
+        logging.info('Deleted %d version(s)%s', deleted,
+                     '' if finished else ', to be continued')
+
+
+class ReprocessingJob(webapp2.RequestHandler):
+    def get(self):
+        deadline = time.time() + CRON_TIME_BUDGET
+        processed, finished = Reprocessing.run(deadline=deadline)
+        if processed:
+            logging.info('Reprocessed %d version(s)%s', processed,
+                         '' if finished else ', to be continued')
+
+
+# Admin pages; access is restricted to admins in app.yaml.
+class StatsPage(webapp2.RequestHandler):
+    def get(self):
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(
+            {'sample_rate': perfstats.SAMPLE_RATE,
+             'handlers': perfstats.summary()}, indent=2, sort_keys=True))
+
+
+class ProfileList(webapp2.RequestHandler):
+    def get(self):
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps([
+            {'id': p.key().id(), 'path': p.path, 'handler': p.handler,
+             'created': p.created.isoformat(), 'duration_ms': p.duration_ms}
+            for p in RequestProfile.recent()], indent=2))
+
+
+class ProfilePage(webapp2.RequestHandler):
+    def get(self, profile_id):
+        profile = RequestProfile.get_by_id(int(profile_id))
+        if profile is None:
+            self.abort(404)
+        # Raw pstats data is loaded with pstats.Stats(filename).
+        if self.request.get('format') == 'pstats':
+            # Too big to be stored.
+            if profile.stats is None:
+                self.abort(404)
+            self.response.content_type = 'application/octet-stream'
+            self.response.headers['Content-Disposition'] = (
+                'attachment; filename="profile-{0}.pstats"'.format(profile_id))
+            self.response.write(profile.stats)
+        else:
+            self.response.content_type = 'text/plain'
+            self.response.write(profile.report)
+
+
 handlers = [
     (r'/signup', SignupPage),
     (r'/login', LoginPage),
     (r'/logout', Logout),
-    (r'/_delete' + ARTICLE_RE + r'_version/' + r'(\d+)', DeleteVersion),
-    (r'/_edit' + ARTICLE_RE + r'_version/' + r'(\d+)', EditPage),
-    (r'/_edit' + ARTICLE_RE, EditPage),
-    (r'/_history' + ARTICLE_RE, HistoryPage),
-    (ARTICLE_RE + r'_version/' + r'(\d+)', ViewPage),
-    (ARTICLE_RE, ViewPage)
+    (r'/_recent', RecentChangesPage),
+    (r'/_recent\.atom', RecentChangesFeed),
+    (r'/_index', IndexPage),
+    (r'/_popular', PopularPage),
+    (r'/_preview', PreviewPage),
+    (r'/_cron/popular', PopularPagesJob),
+    (r'/_cron/sessions', SessionCleanupJob),
+    (r'/_cron/uploads', UploadCleanupJob),
+    (r'/_cron/compact', HistoryCompactionJob),
+    (r'/_cron/reprocess', ReprocessingJob),
+    (r'/_ah/warmup', Warmup),
+    (r'/_stats', StatsPage),
+    (r'/_profile', ProfileList),
+    (r'/_profile/(\d+)', ProfilePage),
+    (r'/_files(/.*)', AttachmentPage),
+    ArticleRoute(view=ViewPage, edit=EditPage, history=HistoryPage,
+                 delete=DeleteVersion)
 ]
-app = webapp2.WSGIApplication(handlers, debug=True)
\ No newline at end of file
+wsgi_app = webapp2.WSGIApplication(handlers, debug=True)
+wsgi_app.router.set_dispatcher(perfstats.dispatcher)
+app = perfstats.StatsMiddleware(
+    CompressionMiddleware(wsgi_app, cache=memcache))
\ No newline at end of file
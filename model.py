@@ -1,11 +1,129 @@
+import binascii
+import calendar
 import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import random
+import time
 # Third-party imports
+from google.appengine.api import datastore
+from google.appengine.api import memcache
 from google.appengine.api.app_identity import get_application_id
 from google.appengine.ext import db
+# Internal project imports
+import attachments
+import pipeline
+import wikilinks
+from attachments import UploadError, UploadOffsetMismatch
+from retention import RetentionPolicy
 
 
 SESSION_LIFETIME = 1  # day
-GLOBAL_PARENT = db.Key.from_path('app', get_application_id())
+# Sessions live for SESSION_LIFETIME full days.
+SESSION_DURATION = dt.timedelta(days=SESSION_LIFETIME + 1)
+MAX_KEY_NAME_BYTES = 1500
+SESSION_CLEANUP_BATCH_SIZE = 500
+# Default retention policy of versions, see retention; unset keeps all.
+VERSION_RETENTION = os.environ.get('VERSION_RETENTION')
+HISTORY_COMPACTION_BATCH_SIZE = 500
+# Saves by the same user within this time overwrite the version, they have
+# created, instead of adding a new one; 0 disables that.
+EDIT_COALESCE_WINDOW = int(os.environ.get('EDIT_COALESCE_WINDOW', '0'))
+LINK_STATUS_CACHE_TIME = 60 * 60  # seconds
+# Links are checked, and missing ones remembered, in batches of this size, so
+# that a body with thousands of links doesn't build one huge RPC.
+LINK_CHECK_BATCH_SIZE = 500
+BODY_CHUNK_SIZE = 32 * 1024  # characters
+# Longer text is stored in chunks; up to 3 bytes per character in UTF-8 keep a
+# chunk below the entity size limit.
+STORED_CHUNK_SIZE = 256 * 1024  # characters
+# Versions store two texts, body and its HTML.
+MAX_INLINE_TEXT_SIZE = STORED_CHUNK_SIZE // 2  # characters
+# Memcache refuses values bigger than 1 MB; up to 3 bytes per character in
+# UTF-8.
+MAX_CACHED_HTML_SIZE = 300 * 1000  # characters
+PROCESSED_HTML_CACHE_TIME = 60 * 60  # seconds
+# Versions may be up to 1 MB each.
+REPROCESSING_BATCH_SIZE = 20
+# Attachments are uploaded and stored in chunks of this size; only the last one
+# may be shorter.
+ATTACHMENT_CHUNK_SIZE = 512 * 1024  # bytes
+MAX_ATTACHMENT_SIZE = 100 * 1024 * 1024  # bytes
+ATTACHMENT_DELETE_BATCH_SIZE = 500
+# Uploads, unfinished for this long, are deleted with their chunks.
+UPLOAD_LIFETIME = dt.timedelta(days=1)
+UPLOAD_CLEANUP_BATCH_SIZE = 50
+RECENT_CHANGES_SHARDS = 4
+RECENT_CHANGES_PER_SHARD = 50
+RECENT_CHANGES_SHOWN = 50
+ARTICLE_INDEX_PAGE_SIZE = 100
+PAGE_VIEW_SHARDS = 20
+POPULAR_PAGES_SHOWN = 20
+POPULAR_PAGES_BATCH_SIZE = 500
+ARTICLE_INDEX_GENERATION_KEY = 'article_index_generation'
+_global_parent = None
+
+
+def global_parent():
+    """Returns the key, all entities of the wiki are grouped under. It is
+    built on first use, not to call app_identity at import time."""
+    global _global_parent
+    if _global_parent is None:
+        _global_parent = db.Key.from_path('app', get_application_id())
+    return _global_parent
+
+
+def fits_key_name(name):
+    return len(name.encode('utf-8')) < MAX_KEY_NAME_BYTES
+
+
+def link_status_cache_key(version_id):
+    return 'link_status:{}'.format(version_id)
+
+
+def missing_link_refs_cache_key(url):
+    return 'missing_link_refs:{}'.format(url)
+
+
+def remember_missing_links(version_id, urls):
+    # Versions, that link to a missing article, are remembered, so that their
+    # cached link status could be dropped, when the article is created. This is
+    # not atomic: a lost reference only means, that a red link lives until its
+    # cache entry expires.
+    for i in range(0, len(urls), LINK_CHECK_BATCH_SIZE):
+        keys = [missing_link_refs_cache_key(url)
+                for url in urls[i:i + LINK_CHECK_BATCH_SIZE]]
+        refs = memcache.get_multi(keys)
+        updated = {}
+        for key in keys:
+            version_ids = refs.get(key, [])
+            if version_id not in version_ids:
+                updated[key] = version_ids + [version_id]
+        memcache.set_multi(updated)
+
+
+def article_index_generation():
+    generation = memcache.get(ARTICLE_INDEX_GENERATION_KEY)
+    if generation is None:
+        # Time based initial value guarantees, that pages cached before the
+        # counter was evicted are not picked up again.
+        memcache.add(ARTICLE_INDEX_GENERATION_KEY, int(time.time()))
+        generation = memcache.get(ARTICLE_INDEX_GENERATION_KEY)
+    return generation
+
+
+def invalidate_article_index():
+    memcache.incr(ARTICLE_INDEX_GENERATION_KEY,
+                  initial_value=int(time.time()))
+
+
+def forget_missing_link(url):
+    key = missing_link_refs_cache_key(url)
+    version_ids = memcache.get(key) or []
+    memcache.delete_multi(
+        [link_status_cache_key(vid) for vid in version_ids] + [key])
 
 
 class SimpleProjection(object):
@@ -19,6 +137,13 @@ class SimpleProjection(object):
         return '[Projection of {}]'.format(repr(self.entity))
 
 
+class VersionProjection(SimpleProjection):
+    # Long bodies are stored in chunks, so body is read only when needed.
+    @property
+    def body(self):
+        return self.version.body
+
+
 class BaseModel(db.Model):
     def __getattr__(self, item):
         if item == 'id':
@@ -26,27 +151,132 @@ class BaseModel(db.Model):
         raise AttributeError(item)
 
     @classmethod
-    def by_prop(cls, prop_name, value, ancestor=GLOBAL_PARENT):
-        q = cls.all().ancestor(ancestor).filter('{} ='.format(prop_name), value)
+    def by_prop(cls, prop_name, value, ancestor=None):
+        q = cls.all().ancestor(ancestor or global_parent()).filter(
+            '{} ='.format(prop_name), value)
 
         return q.get()
 
 
 class User(BaseModel):
-    name = db.StringProperty(required=True)
+    # Users are keyed by normalized name, so that they are found and created
+    # without queries.
+    name = db.StringProperty(required=True, indexed=False)
     password_hash = db.StringProperty(required=True, indexed=False)
     email = db.EmailProperty(required=False)
 
+    @staticmethod
+    def key_name_for(name):
+        return name.lower()
+
+    @classmethod
+    def by_name(cls, name):
+        key_name = cls.key_name_for(name or u'')
+        # Such names can't be keys, hence no user has them.
+        if not key_name or not fits_key_name(key_name):
+            return None
+        user = cls.get_by_key_name(key_name, parent=global_parent())
+        if user is None:
+            # Users, stored before they were keyed by name, are queried,
+            # until tools/rekey_users.py has moved them. Only they have
+            # names indexed; db refuses to filter on unindexed properties,
+            # hence the low level query.
+            q = datastore.Query(cls.kind(), {'name =': name})
+            q.Ancestor(global_parent())
+            entities = q.Get(1)
+            if entities:
+                user = cls.from_entity(entities[0])
+        return user
+
+    @classmethod
+    @db.transactional
+    def create(cls, name, password_hash, email=None):
+        """Returns a new user or None, if the name is already taken."""
+        if cls.by_name(name) is not None:
+            return None
+        user = cls(key_name=cls.key_name_for(name), name=name,
+                   password_hash=password_hash, email=email or None,
+                   parent=global_parent())
+        user.put()
+        return user
+
 
 class Session(BaseModel):
     sid = db.StringProperty(required=True)
     user = db.ReferenceProperty(User, collection_name="Sessions")
     created = db.DateTimeProperty(auto_now_add=True)
+    # Indexed, so that expired sessions are found by SessionCleanup. Sessions,
+    # stored before it was introduced, don't have it until put again.
+    expires = db.DateTimeProperty()
     logout_url = db.StringProperty(default='/')
 
+    @classmethod
+    def start(cls, sid, user):
+        session = cls(sid=sid, user=user, parent=global_parent())
+        session.put()
+        return session
+
+    def put(self, **kwargs):
+        # Otherwise None would be stored, which is less than any date.
+        if self.expires is None:
+            self.expires = self.created + SESSION_DURATION
+        return super(Session, self).put(**kwargs)
+
     def has_expired(self):
-        delta = dt.datetime.now() - self.created
-        return delta.days > SESSION_LIFETIME
+        return dt.datetime.now() >= (
+            self.expires or self.created + SESSION_DURATION)
+
+
+class SessionCleanup(db.Model):
+    """Deletes expired sessions in batches. Progress is stored in a singleton
+    checkpoint, so that an interrupted run is resumed by the next one."""
+    phase = db.StringProperty(indexed=False)
+    cutoff = db.DateTimeProperty(indexed=False)
+    cursor = db.TextProperty()
+    deleted = db.IntegerProperty(default=0, indexed=False)
+
+    KEY_NAME = 'checkpoint'
+    # Sessions are found by expiry time; ones without it - by creation time.
+    PHASES = ('expires', 'created')
+
+    def query(self):
+        cutoff = self.cutoff
+        if self.phase == 'created':
+            cutoff -= SESSION_DURATION
+        q = Session.all(keys_only=True).filter(
+            '{} <'.format(self.phase), cutoff)
+        if self.cursor:
+            q.with_cursor(self.cursor)
+        return q
+
+    @classmethod
+    def run(cls, batch_size=SESSION_CLEANUP_BATCH_SIZE, deadline=None):
+        """Deletes expired sessions until there are none left, or until
+        deadline (a timestamp) passes. Returns a tuple (number of sessions,
+        deleted by this and interrupted runs, whether the run has finished).
+        """
+        checkpoint = cls.get_by_key_name(cls.KEY_NAME)
+        if checkpoint is None:
+            checkpoint = cls(key_name=cls.KEY_NAME, phase=cls.PHASES[0],
+                             cutoff=dt.datetime.now())
+        while True:
+            q = checkpoint.query()
+            keys = q.fetch(batch_size)
+            db.delete(keys)
+            checkpoint.deleted += len(keys)
+            if len(keys) < batch_size:
+                phase = cls.PHASES.index(checkpoint.phase) + 1
+                if phase == len(cls.PHASES):
+                    if checkpoint.is_saved():
+                        checkpoint.delete()
+                    return checkpoint.deleted, True
+                checkpoint.phase = cls.PHASES[phase]
+                checkpoint.cursor = None
+            else:
+                checkpoint.cursor = q.cursor()
+            checkpoint.put()
+            if deadline is not None and time.time() >= deadline:
+                return checkpoint.deleted, False
 
 
 class Article(BaseModel):
@@ -58,24 +288,58 @@ class Article(BaseModel):
     # Collection name won't be used; this is to suppress DuplicatePropertyError.
     latest_version = db.ReferenceProperty(collection_name='_')
     url = db.StringProperty(required=True)
+    # Overrides VERSION_RETENTION for this article.
+    retention_policy = db.StringProperty(indexed=False)
 
     def all_versions(self):
         q = self.version_set
         return q.order('-created')
 
-    def new_version(self, head, body):
-        version = Version(
-            article=self, head=head, body=body, parent=GLOBAL_PARENT)
+    def retention(self):
+        """Returns RetentionPolicy of the article or None, if all versions are
+        kept. Raises ValueError, if the policy is malformed."""
+        value = self.retention_policy or VERSION_RETENTION
+        return RetentionPolicy.parse(value) if value else None
+
+    # Key getters don't fetch referenced versions.
+    def first_version_key(self):
+        return Article.first_version.get_value_for_datastore(self)
+
+    def latest_version_key(self):
+        return Article.latest_version.get_value_for_datastore(self)
+
+    def has_single_version(self):
+        return self.first_version_key() == self.latest_version_key()
+
+    def new_version(self, head, body, author=None,
+                    markup=pipeline.DEFAULT_MARKUP):
+        latest = self.latest_version
+        if latest.coalesces_with(author):
+            # Rapid successive saves by the same user overwrite their version.
+            latest.head, latest.body, latest.markup = head, body, markup
+            latest.saved = dt.datetime.now()
+            latest.process()
+            latest.put()
+            memcache.delete(link_status_cache_key(latest.id))
+            RecentChanges.record('edit', self.url, head, latest.id,
+                                 latest.saved, coalesced=True)
+            return
+
+        version = Version(article=self, head=head, body=body, author=author,
+                          markup=markup, saved=dt.datetime.now(),
+                          parent=global_parent())
+        version.process()
         version.put()
 
         self.latest_version = version
         self.put()
+        RecentChanges.record('edit', self.url, head, version.id,
+                             version.created)
 
     def project(self, version):
-        projection = SimpleProjection(self)
+        projection = VersionProjection(self)
         projection.url = self.url
         projection.head = version.head
-        projection.body = version.body
         projection.modified = version.created
         projection.version = version
 
@@ -85,13 +349,64 @@ class Article(BaseModel):
         return self.project(self.latest_version)
 
     def version_by_id(self, version_id):
-        version = Version.get_by_id(int(version_id), parent=GLOBAL_PARENT)
+        version = Version.get_by_id(int(version_id), parent=global_parent())
         if version is not None:
             return self.project(version)
 
+    @classmethod
+    def key_for_url(cls, url):
+        return db.Key.from_path(cls.kind(), url, parent=global_parent())
+
+    @classmethod
+    def existing_urls(cls, urls):
+        # Checks urls with one batch get per LINK_CHECK_BATCH_SIZE of them.
+        existing = {}
+        for i in range(0, len(urls), LINK_CHECK_BATCH_SIZE):
+            batch = urls[i:i + LINK_CHECK_BATCH_SIZE]
+            articles = db.get([cls.key_for_url(url) for url in batch])
+            existing.update(
+                (url, article is not None)
+                for url, article in zip(batch, articles))
+        return existing
+
+    @classmethod
+    def index_page(cls, cursor=None, page_size=None):
+        """Returns a tuple of article urls, sorted alphabetically, and a
+        cursor for the next page (None for the last page).
+
+        Only keys are queried, so no versions are loaded. Pages are cached
+        until an article is created or removed."""
+        page_size = page_size or ARTICLE_INDEX_PAGE_SIZE
+        cache_key = 'article_index:{}:{}:{}'.format(
+            article_index_generation(), page_size, cursor or '')
+        page = memcache.get(cache_key)
+        if page is None:
+            # Articles are keyed by url, so key order is url order.
+            q = cls.all(keys_only=True).ancestor(global_parent())
+            q.order('__key__')
+            if cursor:
+                q.with_cursor(cursor)
+            keys = q.fetch(page_size)
+            # A full page may be followed by an empty one; this is cheaper, than
+            # looking one result ahead.
+            next_cursor = q.cursor() if len(keys) == page_size else None
+            # Articles, that are not yet keyed by url, are left out.
+            page = ([k.name() for k in keys if k.name() is not None],
+                    next_cursor)
+            memcache.set(cache_key, page)
+        return page
+
     @classmethod
     def by_url(cls, url, version=None, project_with_version=True):
-        article = cls.by_prop('url', url)
+        # Such urls can't be keys, hence no article has them.
+        if not fits_key_name(url):
+            return None
+        article = cls.get_by_key_name(url, parent=global_parent())
+        if article is None:
+            # Articles, created before they were keyed by url, are queried,
+            # until tools/rekey_articles.py has moved them.
+            article = cls.all().ancestor(global_parent()).filter(
+                'url =', url).get()
         if article is not None:
             if version is None:
                 if project_with_version:
@@ -101,32 +416,268 @@ class Article(BaseModel):
                 p = article.version_by_id(version)
                 return p if p is not None else article.get_latest_version()
 
+    @classmethod
+    def new(cls, url, head, body, author=None,
+            markup=pipeline.DEFAULT_MARKUP):
+        """Returns projection of the new article with its first version, or
+        None, if an article with the url already exists."""
+        projection = cls._create(url, head, body, author, markup)
+        if projection is None:
+            return None
+        invalidate_article_index()
+        # Recent changes live outside of the global entity group, so they are
+        # recorded after the transaction.
+        RecentChanges.record(
+            'create', url, head, projection.version.id, projection.modified)
+
+        return projection
+
     @classmethod
     @db.transactional
-    def new(cls, url, head, body):
-        article = cls(url=url, parent=GLOBAL_PARENT)
+    def _create(cls, url, head, body, author, markup):
+        # Articles are keyed by url, so that existence of many articles can be
+        # checked with one batch get.
+        if not fits_key_name(url):
+            raise ValueError('Url is too long: {!r}'.format(url[:100]))
+        # Another request may have created it since it was looked up.
+        if cls.by_url(url, project_with_version=False) is not None:
+            return None
+        article = cls(key_name=url, url=url, parent=global_parent())
         article.put()
 
-        first_version = Version(
-            article=article, head=head, body=body, parent=GLOBAL_PARENT)
+        first_version = Version(article=article, head=head, body=body,
+                                author=author, markup=markup,
+                                saved=dt.datetime.now(),
+                                parent=global_parent())
+        first_version.process()
         first_version.put()
 
         article.first_version = first_version
         article.latest_version = first_version
         article.put()
+        forget_missing_link(url)
 
         return article.project(first_version)
 
 
+class VersionChunk(db.Model):
+    """A piece of a long text field of a Version. Chunks are children of their
+    version, keyed by field name and index, so that all chunks of a field are
+    fetched with one batch get."""
+    # Lets compaction find chunks of deleted versions with one query.
+    article = db.ReferenceProperty(Article, collection_name='chunks')
+    text = db.TextProperty()
+
+    @staticmethod
+    def keys(version_key, field, count):
+        return [db.Key.from_path(
+                    'VersionChunk', '{}-{}'.format(field, i), parent=version_key)
+                for i in range(count)]
+
+    @classmethod
+    def store(cls, version, field, text):
+        """Stores text in chunks; returns their number."""
+        pieces = list(wikilinks.split_at_tags(
+            text, STORED_CHUNK_SIZE, at_most=True))
+        keys = cls.keys(version.key(), field, len(pieces))
+        article_key = Version.article.get_value_for_datastore(version)
+        db.put([cls(key=key, article=article_key, text=piece)
+                for key, piece in zip(keys, pieces)])
+        return len(pieces)
+
+    @classmethod
+    def load(cls, version_key, field, count):
+        """Yields texts of chunks in order; they are fetched with one batch
+        get."""
+        for chunk in db.get(cls.keys(version_key, field, count)):
+            yield chunk.text
+
+
 class Version(BaseModel):
     article = db.ReferenceProperty(Article, required=True)
     created = db.DateTimeProperty(auto_now_add=True)
     head = db.StringProperty(required=True)
-    body = db.TextProperty()
+    # Text fields, that may not fit the entity: texts longer than
+    # MAX_INLINE_TEXT_SIZE are stored in VersionChunk entities instead of
+    # stored_<field>. Access them through <field> or text_pieces().
+    TEXT_FIELDS = ('body', 'html')
+    stored_body = db.TextProperty(name='body')
+    body_chunks = db.IntegerProperty(default=0, indexed=False)
+    # Markup of the body; versions, stored before markups, are in HTML.
+    markup = db.StringProperty(
+        indexed=False, choices=pipeline.CONVERTERS.keys())
+    # Body, processed by pipeline; it is what readers are shown.
+    stored_html = db.TextProperty(name='html')
+    html_chunks = db.IntegerProperty(default=0, indexed=False)
+    pipeline_id = db.IntegerProperty()
+    author = db.ReferenceProperty(User, collection_name='versions')
+    # Changes, when the version is overwritten by a coalesced save. It is set
+    # explicitly, so that system writes (reprocessing, chunk rewrites) don't
+    # move it.
+    saved = db.DateTimeProperty()
+
+    def __init__(self, *args, **kwargs):
+        super(Version, self).__init__(*args, **kwargs)
+        # Texts, joined from chunks, and numbers of chunks to replace on put,
+        # by field.
+        self._loaded_texts = {}
+        self._stale_chunks = {}
 
     @classmethod
     def by_id(cls, version_id):
-        return cls.get_by_id(version_id, parent=GLOBAL_PARENT)
+        return cls.get_by_id(version_id, parent=global_parent())
+
+    @property
+    def body(self):
+        return self.text('body')
+
+    @body.setter
+    def body(self, value):
+        self.set_text('body', value)
+
+    @property
+    def html(self):
+        return self.text('html')
+
+    @html.setter
+    def html(self, value):
+        self.set_text('html', value)
+
+    def text(self, field):
+        if not getattr(self, field + '_chunks'):
+            return getattr(self, 'stored_' + field)
+        if field not in self._loaded_texts:
+            self._loaded_texts[field] = u''.join(self.text_pieces(field))
+        return self._loaded_texts[field]
+
+    def set_text(self, field, value):
+        # Chunks are replaced on put.
+        chunks = getattr(self, field + '_chunks')
+        self._stale_chunks[field] = max(
+            self._stale_chunks.get(field, 0), chunks)
+        setattr(self, 'stored_' + field, value)
+        setattr(self, field + '_chunks', 0)
+        self._loaded_texts.pop(field, None)
+
+    def text_pieces(self, field):
+        """Yields the text in consecutive pieces, without joining chunks."""
+        chunks = getattr(self, field + '_chunks')
+        if not chunks:
+            yield getattr(self, 'stored_' + field) or u''
+        elif field in self._loaded_texts:
+            yield self._loaded_texts[field]
+        else:
+            for text in VersionChunk.load(self.key(), field, chunks):
+                yield text
+
+    def body_pieces(self):
+        return self.text_pieces('body')
+
+    def body_markup(self):
+        return self.markup or pipeline.DEFAULT_MARKUP
+
+    def process(self):
+        """Processes the body into HTML, that readers are shown."""
+        self.html = pipeline.process(self.body, self.body_markup())
+        self.pipeline_id = pipeline.PIPELINE_ID
+
+    def html_pieces(self):
+        if self.pipeline_id != pipeline.PIPELINE_ID:
+            # Not yet reprocessed by ReprocessingJob.
+            return iter([self.processed_html()])
+        return self.text_pieces('html')
+
+    def processed_html(self):
+        """Processes the body; results are cached, so that views of versions,
+        that wait for reprocessing, don't process them every time."""
+        if not self.is_saved():
+            return pipeline.process(self.body, self.body_markup())
+        cache_key = 'processed_html:{}:{}'.format(
+            pipeline.PIPELINE_ID, self.id)
+        html = memcache.get(cache_key)
+        if html is None:
+            html = pipeline.process(self.body, self.body_markup())
+            if len(html) <= MAX_CACHED_HTML_SIZE:
+                memcache.set(cache_key, html, time=PROCESSED_HTML_CACHE_TIME)
+        return html
+
+    def put(self, **kwargs):
+        texts = dict((field, getattr(self, 'stored_' + field) or u'')
+                     for field in self.TEXT_FIELDS)
+        if (not any(self._stale_chunks.values()) and
+                max(len(text) for text in texts.values()) <=
+                MAX_INLINE_TEXT_SIZE):
+            return super(Version, self).put(**kwargs)
+        # Version and its chunks are written together.
+        if db.is_in_transaction():
+            return self._put_with_chunks(texts, **kwargs)
+        return db.run_in_transaction(self._put_with_chunks, texts, **kwargs)
+
+    def _put_with_chunks(self, texts, **kwargs):
+        long_texts = [(field, text) for field, text in texts.items()
+                      if len(text) > MAX_INLINE_TEXT_SIZE]
+        for field, text in long_texts:
+            setattr(self, 'stored_' + field, None)
+        # Chunks need the version key.
+        if long_texts and not self.is_saved():
+            super(Version, self).put(**kwargs)
+        for field, text in long_texts:
+            setattr(self, field + '_chunks',
+                    VersionChunk.store(self, field, text))
+            self._loaded_texts[field] = text
+        key = super(Version, self).put(**kwargs)
+        for field, stale in self._stale_chunks.items():
+            chunks = getattr(self, field + '_chunks')
+            if stale > chunks:
+                db.delete(VersionChunk.keys(key, field, stale)[chunks:])
+        self._stale_chunks = {}
+        return key
+
+    def chunk_keys(self):
+        keys = []
+        for field in self.TEXT_FIELDS:
+            keys.extend(VersionChunk.keys(
+                self.key(), field, getattr(self, field + '_chunks')))
+        return keys
+
+    def coalesces_with(self, author):
+        """Tells if a save by author is to overwrite this version, rather
+        than to create a new one."""
+        if author is None or not EDIT_COALESCE_WINDOW:
+            return False
+        if Version.author.get_value_for_datastore(self) != author.key():
+            return False
+        age = dt.datetime.now() - (self.saved or self.created)
+        return age < dt.timedelta(seconds=EDIT_COALESCE_WINDOW)
+
+    def link_status(self):
+        """Maps urls of articles, linked from version's body, to their
+        existence. Cached per version."""
+        cache_key = link_status_cache_key(self.id)
+        status = memcache.get(cache_key)
+        if status is None:
+            urls, seen = [], set()
+            for piece in self.html_pieces():
+                for url in wikilinks.internal_urls(piece):
+                    if url not in seen:
+                        seen.add(url)
+                        urls.append(url)
+            status = Article.existing_urls(urls) if urls else {}
+            memcache.set(cache_key, status, time=LINK_STATUS_CACHE_TIME)
+            remember_missing_links(
+                self.id, [url for url in urls if not status[url]])
+        return status
+
+    def annotated_body(self):
+        return u''.join(self.annotated_body_chunks())
+
+    def annotated_body_chunks(self):
+        # Big body, emitted by a template as a single piece, is copied several
+        # times; slices are copied one at a time.
+        status = self.link_status()
+        for body_piece in self.html_pieces():
+            for piece in wikilinks.split_at_tags(body_piece, BODY_CHUNK_SIZE):
+                yield wikilinks.annotate_links(piece, status)
 
     def belongs_to_article(self, article):
         return self.article.key() == article.key()
@@ -135,15 +686,22 @@ class Version(BaseModel):
         article = self.article
         is_latest = self.is_latest()
         is_first = self.is_first()
+        version_id = self.id
+        chunk_keys = self.chunk_keys()
+        if chunk_keys:
+            db.delete(chunk_keys)
         super(Version, self).delete()
+        memcache.delete(link_status_cache_key(version_id))
+        RecentChanges.record(
+            'delete', article.url, self.head, version_id, dt.datetime.utcnow())
         if is_latest:
             new_latest = article.version_set.ancestor(
-                GLOBAL_PARENT).order('-created').get()
+                global_parent()).order('-created').get()
             self.article.latest_version = new_latest
             self.article.put()
         elif is_first:
             new_first = article.version_set.ancestor(
-                GLOBAL_PARENT).order('created').get()
+                global_parent()).order('created').get()
             self.article.first_version = new_first
             self.article.put()
 
@@ -151,4 +709,541 @@ class Version(BaseModel):
         return self.key() == self.article.first_version.key()
 
     def is_latest(self):
-        return self.key() == self.article.latest_version.key()
\ No newline at end of file
+        return self.key() == self.article.latest_version.key()
+
+
+class AttachmentChunk(db.Model):
+    """A piece of attachment content; child of the upload, it was sent with."""
+    data = db.BlobProperty()
+
+    @staticmethod
+    def key_for(upload_id, index):
+        return db.Key.from_path('AttachmentUpload', upload_id,
+                                'AttachmentChunk', 'c{}'.format(index))
+
+
+class AttachmentUpload(db.Model):
+    """An upload in progress. Content is sent in chunks, one per request, so
+    that the whole file is never held in memory; an interrupted upload is
+    resumed from size."""
+    article = db.ReferenceProperty(Article, collection_name='uploads')
+    name = db.StringProperty(indexed=False)
+    author = db.ReferenceProperty(User, collection_name='uploads')
+    size = db.IntegerProperty(default=0, indexed=False)
+    # SHA-256 of every chunk received so far.
+    digests = db.StringListProperty(indexed=False)
+    created = db.DateTimeProperty(auto_now_add=True)
+
+    @classmethod
+    def start(cls, article, name, author=None):
+        upload = cls(key_name=binascii.hexlify(os.urandom(16)),
+                     article=article, name=name, author=author)
+        upload.put()
+        return upload
+
+    @property
+    def upload_id(self):
+        return self.key().name()
+
+    # Key getters don't fetch referenced entities.
+    def article_key(self):
+        return AttachmentUpload.article.get_value_for_datastore(self)
+
+    def author_key(self):
+        return AttachmentUpload.author.get_value_for_datastore(self)
+
+    def chunk_keys(self):
+        return [AttachmentChunk.key_for(self.upload_id, i)
+                for i in range(len(self.digests))]
+
+    def delete_with_chunks(self):
+        """Deletes an abandoned upload; returns False, if it has been finished
+        or deleted meanwhile."""
+        def txn():
+            if AttachmentUpload.get(self.key()) is None:
+                return False
+            db.delete(self.key())
+            return True
+
+        if not db.run_in_transaction(txn):
+            return False
+        keys = self.chunk_keys()
+        for i in range(0, len(keys), ATTACHMENT_DELETE_BATCH_SIZE):
+            db.delete(keys[i:i + ATTACHMENT_DELETE_BATCH_SIZE])
+        return True
+
+    def append(self, offset, data):
+        """Stores data as the next chunk. Raises UploadOffsetMismatch, unless
+        offset is the number of bytes received so far, and UploadError, if
+        the chunk is not allowed."""
+        if offset != self.size:
+            raise UploadOffsetMismatch(self.size)
+        if not data or len(data) > ATTACHMENT_CHUNK_SIZE:
+            raise UploadError('Chunk is empty or too big')
+        if self.size % ATTACHMENT_CHUNK_SIZE:
+            raise UploadError('Only the last chunk may be shorter')
+        if self.size + len(data) > MAX_ATTACHMENT_SIZE:
+            raise UploadError('File is too big')
+        digest = hashlib.sha256(data).hexdigest()
+
+        # Concurrent retries of the same chunk are applied once.
+        def txn():
+            upload = AttachmentUpload.get(self.key())
+            if upload.size != offset:
+                raise UploadOffsetMismatch(upload.size)
+            chunk_key = AttachmentChunk.key_for(
+                self.upload_id, len(upload.digests))
+            upload.size += len(data)
+            upload.digests.append(digest)
+            db.put([AttachmentChunk(key=chunk_key, data=data), upload])
+            return upload
+
+        upload = db.run_in_transaction(txn)
+        self.size, self.digests = upload.size, upload.digests
+
+    def finish(self):
+        """Makes an attachment of the upload, replacing one with the same name,
+        and returns it. Finishing again (e.g. a retry) returns the same
+        attachment, or None, if it has been replaced since."""
+        attachment = Attachment(
+            key_name=self.name, parent=self.article_key(),
+            upload_id=self.upload_id,
+            size=self.size, chunk_count=len(self.digests),
+            # Chunk size is fixed, so equal files have equal hashes.
+            sha256=hashlib.sha256(''.join(self.digests)).hexdigest(),
+            content_type=attachments.content_type(self.name),
+            author=self.author_key())
+
+        # The upload is deleted along with the attachment put, so that only
+        # one of concurrent finishes makes the attachment. Chunks stay, their
+        # keys don't need the upload entity.
+        def txn():
+            replaced = Attachment.get(attachment.key())
+            if AttachmentUpload.get(self.key()) is None:
+                return False, replaced
+            db.put(attachment)
+            db.delete(self.key())
+            return True, replaced
+
+        finished, replaced = db.run_in_transaction_options(
+            db.create_transaction_options(xg=True), txn)
+        if not finished:
+            if replaced is not None and replaced.upload_id == self.upload_id:
+                return replaced
+            return None
+        # Chunks, that the attachment itself uses, are never deleted.
+        if replaced is not None and replaced.upload_id != self.upload_id:
+            replaced.delete_chunks()
+        return attachment
+
+
+class UploadCleanup(db.Model):
+    """Deletes uploads, that were started UPLOAD_LIFETIME ago and never
+    finished, along with their chunks. Progress is stored in a singleton
+    checkpoint, so that an interrupted run is resumed by the next one."""
+    cutoff = db.DateTimeProperty(indexed=False)
+    cursor = db.TextProperty()
+    deleted = db.IntegerProperty(default=0, indexed=False)
+
+    KEY_NAME = 'checkpoint'
+
+    @classmethod
+    def run(cls, batch_size=UPLOAD_CLEANUP_BATCH_SIZE, deadline=None):
+        """Deletes abandoned uploads until there are none left, or until
+        deadline (a timestamp) passes. Returns a tuple (number of uploads,
+        deleted by this and interrupted runs, whether the run has finished).
+        """
+        checkpoint = cls.get_by_key_name(cls.KEY_NAME)
+        if checkpoint is None:
+            checkpoint = cls(key_name=cls.KEY_NAME,
+                             cutoff=dt.datetime.now() - UPLOAD_LIFETIME)
+        while True:
+            q = AttachmentUpload.all().filter('created <', checkpoint.cutoff)
+            if checkpoint.cursor:
+                q.with_cursor(checkpoint.cursor)
+            uploads = q.fetch(batch_size)
+            for upload in uploads:
+                if upload.delete_with_chunks():
+                    checkpoint.deleted += 1
+            if len(uploads) < batch_size:
+                if checkpoint.is_saved():
+                    checkpoint.delete()
+                return checkpoint.deleted, True
+            checkpoint.cursor = q.cursor()
+            checkpoint.put()
+            if deadline is not None and time.time() >= deadline:
+                return checkpoint.deleted, False
+
+
+class Attachment(db.Model):
+    """A file attached to an article; child of the article, keyed by file
+    name. Content is stored in AttachmentChunk entities."""
+    upload_id = db.StringProperty(indexed=False)
+    size = db.IntegerProperty(indexed=False)
+    chunk_count = db.IntegerProperty(indexed=False)
+    # Hash of the chunk hashes; serves as the ETag.
+    sha256 = db.StringProperty(indexed=False)
+    content_type = db.StringProperty(indexed=False)
+    author = db.ReferenceProperty(User, collection_name='attachments')
+    created = db.DateTimeProperty(auto_now_add=True)
+
+    @classmethod
+    def by_name(cls, url, name):
+        if not fits_key_name(url):
+            return None
+        article_key = db.Key.from_path('Article', url, parent=global_parent())
+        return cls.get_by_key_name(name, parent=article_key)
+
+    @property
+    def name(self):
+        return self.key().name()
+
+    def chunk_keys(self, first=0, last=None):
+        last = self.chunk_count - 1 if last is None else last
+        return [AttachmentChunk.key_for(self.upload_id, i)
+                for i in range(first, last + 1)]
+
+    def read(self, start=0, stop=None):
+        """Yields content from byte start to stop, a chunk at a time; the next
+        chunk is fetched, while the current one is sent."""
+        stop = self.size if stop is None else stop
+        if start >= stop:
+            return
+        first = start // ATTACHMENT_CHUNK_SIZE
+        keys = self.chunk_keys(first, (stop - 1) // ATTACHMENT_CHUNK_SIZE)
+        rpc = db.get_async(keys[0])
+        for i in range(len(keys)):
+            chunk = rpc.get_result()
+            if i + 1 < len(keys):
+                rpc = db.get_async(keys[i + 1])
+            offset = (first + i) * ATTACHMENT_CHUNK_SIZE
+            yield chunk.data[max(start - offset, 0):stop - offset]
+
+    def delete_chunks(self):
+        keys = self.chunk_keys()
+        for i in range(0, len(keys), ATTACHMENT_DELETE_BATCH_SIZE):
+            db.delete(keys[i:i + ATTACHMENT_DELETE_BATCH_SIZE])
+
+
+class RecentChanges(db.Model):
+    """A shard of the recent changes ring buffer.
+
+    Every shard is a root entity, that keeps no more than
+    RECENT_CHANGES_PER_SHARD latest changes as a JSON list, so that the whole
+    feed is read with one batch get regardless of wiki's size, and writes do
+    not contend for a single entity. Changes of a version go to the same
+    shard, so that a coalesced save finds the entry of the version it
+    overwrites.
+    """
+    entries = db.TextProperty(default='[]')
+
+    @classmethod
+    def shard_keys(cls):
+        return [db.Key.from_path(cls.kind(), 'shard-{}'.format(i))
+                for i in range(RECENT_CHANGES_SHARDS)]
+
+    @classmethod
+    def record(cls, action, url, head, version_id, timestamp,
+               coalesced=False):
+        """Appends a change. If coalesced is set, the version was overwritten:
+        its creation or edit entry is moved to the top with the new head,
+        keeping its action; 'edit' is recorded, if there is no such entry."""
+        entry = {
+            'action': action, 'url': url, 'head': head,
+            'version_id': version_id,
+            'timestamp': calendar.timegm(timestamp.utctimetuple()) +
+            timestamp.microsecond / 1e6
+        }
+        key = cls.shard_keys()[version_id % RECENT_CHANGES_SHARDS]
+
+        def append():
+            shard = cls.get(key) or cls(key_name=key.name())
+            entries = json.loads(shard.entries)
+            if coalesced:
+                for i, e in enumerate(entries):
+                    if (e['version_id'] == version_id and
+                            e['action'] in ('create', 'edit')):
+                        entry['action'] = entries.pop(i)['action']
+                        break
+            entries.append(entry)
+            shard.entries = json.dumps(entries[-RECENT_CHANGES_PER_SHARD:])
+            shard.put()
+
+        db.run_in_transaction(append)
+
+    @classmethod
+    def fetch(cls, limit=RECENT_CHANGES_SHOWN):
+        """Returns a tuple of the latest changes (newest first) and an ETag,
+        identifying them."""
+        entries = []
+        for shard in cls.get(cls.shard_keys()):
+            if shard is not None:
+                entries.extend(json.loads(shard.entries))
+        entries.sort(key=lambda e: e['timestamp'], reverse=True)
+        entries = entries[:limit]
+
+        etag = hashlib.md5(json.dumps(entries, sort_keys=True)).hexdigest()
+        for e in entries:
+            e['created'] = dt.datetime.utcfromtimestamp(e['timestamp'])
+
+        return entries, etag
+
+
+class PageViewCounter(db.Model):
+    """A shard of article's view counter. Root entity, keyed
+    '<shard number>:<article url>'."""
+    url = db.StringProperty(required=True)
+    count = db.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def add_views(cls, views):
+        """Adds views, a mapping of article urls to view counts, to a random
+        shard of every counter with one batch get and one batch put.
+
+        Updates are not transactional: two instances, flushing to the same
+        shard at the same moment, may lose some views. This is accepted for
+        the sake of flush latency."""
+        if not views:
+            return
+        shard = random.randrange(PAGE_VIEW_SHARDS)
+        urls = list(views)
+        key_names = ['{}:{}'.format(shard, url) for url in urls]
+        counters = cls.get_by_key_name(key_names)
+        for i, url in enumerate(urls):
+            if counters[i] is None:
+                counters[i] = cls(key_name=key_names[i], url=url)
+            counters[i].count += views[url]
+        db.put(counters)
+
+
+class PopularPages(db.Model):
+    """Precomputed list of the most viewed articles. Singleton."""
+    entries = db.TextProperty(default='[]')
+    updated = db.DateTimeProperty(auto_now=True)
+
+    KEY_NAME = 'top'
+
+    @classmethod
+    def fetch(cls):
+        popular = cls.get_by_key_name(cls.KEY_NAME)
+        if popular is None:
+            return []
+        return json.loads(popular.entries)
+
+
+class PopularPagesComputation(db.Model):
+    """Sums shards of view counters into PopularPages. Counters are scanned in
+    url order, so that shards of an article come one after another and only
+    the most viewed articles are to be kept. Progress is stored in a singleton
+    checkpoint, so that an interrupted run is resumed by the next one."""
+    # JSON list of [url, views] of the most viewed articles so far.
+    top = db.TextProperty(default='[]')
+    # Article, whose shards are being summed, and its views so far.
+    url = db.StringProperty(indexed=False)
+    views = db.IntegerProperty(default=0, indexed=False)
+    cursor = db.TextProperty()
+    counted = db.IntegerProperty(default=0, indexed=False)
+
+    KEY_NAME = 'checkpoint'
+
+    def add_current(self, top, limit):
+        if self.url is not None:
+            top.append([self.url, self.views])
+            top.sort(key=lambda t: (-t[1], t[0]))
+            del top[limit:]
+
+    @classmethod
+    def run(cls, limit=POPULAR_PAGES_SHOWN,
+            batch_size=POPULAR_PAGES_BATCH_SIZE, deadline=None):
+        """Sums counters until all of them are counted and PopularPages is
+        stored, or until deadline (a timestamp) passes. Returns a tuple
+        (number of counter shards, counted by this and interrupted runs,
+        whether the run has finished)."""
+        checkpoint = (cls.get_by_key_name(cls.KEY_NAME) or
+                      cls(key_name=cls.KEY_NAME))
+        top = json.loads(checkpoint.top)
+        while True:
+            q = PageViewCounter.all().order('url')
+            if checkpoint.cursor:
+                q.with_cursor(checkpoint.cursor)
+            counters = q.fetch(batch_size)
+            for c in counters:
+                if c.url != checkpoint.url:
+                    checkpoint.add_current(top, limit)
+                    checkpoint.url, checkpoint.views = c.url, 0
+                checkpoint.views += c.count
+            checkpoint.counted += len(counters)
+            if len(counters) < batch_size:
+                checkpoint.add_current(top, limit)
+                entries = [{'url': url, 'views': views} for url, views in top]
+                PopularPages(key_name=PopularPages.KEY_NAME,
+                             entries=json.dumps(entries)).put()
+                if checkpoint.is_saved():
+                    checkpoint.delete()
+                return checkpoint.counted, True
+            checkpoint.top = json.dumps(top)
+            checkpoint.cursor = q.cursor()
+            checkpoint.put()
+            if deadline is not None and time.time() >= deadline:
+                return checkpoint.counted, False
+
+
+class RequestProfile(db.Model):
+    """cProfile capture of a single request, made on demand (see profiling)."""
+    path = db.StringProperty(required=True)
+    handler = db.StringProperty()
+    created = db.DateTimeProperty(auto_now_add=True)
+    duration_ms = db.FloatProperty()
+    # Marshalled pstats data, loadable with pstats.Stats(filename).
+    stats = db.BlobProperty()
+    report = db.TextProperty()
+
+    @classmethod
+    def recent(cls, limit=50):
+        return cls.all().order('-created').fetch(limit)
+
+
+class HistoryCompaction(db.Model):
+    """Deletes versions, that retention policies don't keep, article by
+    article. Progress is stored in a singleton checkpoint, so that an
+    interrupted run is resumed by the next one."""
+    cursor = db.TextProperty()
+    deleted = db.IntegerProperty(default=0, indexed=False)
+
+    KEY_NAME = 'checkpoint'
+
+    @staticmethod
+    def versions(article, batch_size):
+        """Yields (key, created) of article's versions, newest first."""
+        q = db.Query(Version, projection=('created',)).ancestor(
+            global_parent()).filter('article =', article).order('-created')
+        while True:
+            versions = q.fetch(batch_size)
+            for version in versions:
+                yield version.key(), version.created
+            if len(versions) < batch_size:
+                return
+            q.with_cursor(q.cursor())
+
+    @classmethod
+    def compact(cls, article, policy, now=None,
+                batch_size=HISTORY_COMPACTION_BATCH_SIZE):
+        """Deletes versions of article, that policy doesn't keep; returns their
+        number. Policy keeps the first and the latest versions, so pointers to
+        them stay valid."""
+        keys = policy.deletions(cls.versions(article, batch_size),
+                                article.first_version_key(),
+                                now or dt.datetime.now())
+        deleted = set()
+        batch = []
+        for key in keys:
+            batch.append(key)
+            if len(batch) == batch_size:
+                deleted.update(cls._delete(batch))
+                batch = []
+        deleted.update(cls._delete(batch))
+        if deleted:
+            cls._delete_chunks(article, deleted, batch_size)
+        return len(deleted)
+
+    @staticmethod
+    def _delete(keys):
+        db.delete(keys)
+        memcache.delete_multi([link_status_cache_key(k.id()) for k in keys])
+        return keys
+
+    @staticmethod
+    def _delete_chunks(article, version_keys, batch_size):
+        # Body chunks of deleted versions; one query per article.
+        q = VersionChunk.all(keys_only=True).ancestor(
+            global_parent()).filter('article =', article)
+        keys = [k for k in q.run(batch_size=batch_size)
+                if k.parent() in version_keys]
+        for i in range(0, len(keys), batch_size):
+            db.delete(keys[i:i + batch_size])
+
+    @classmethod
+    def run(cls, batch_size=HISTORY_COMPACTION_BATCH_SIZE, deadline=None):
+        """Compacts histories of all articles, until deadline (a timestamp)
+        passes. Returns a tuple (number of versions, deleted by this and
+        interrupted runs, whether the run has finished)."""
+        checkpoint = (cls.get_by_key_name(cls.KEY_NAME) or
+                      cls(key_name=cls.KEY_NAME))
+        q = Article.all().ancestor(global_parent())
+        if checkpoint.cursor:
+            q.with_cursor(checkpoint.cursor)
+        for article in q.run(batch_size=batch_size):
+            try:
+                policy = article.retention()
+            except ValueError:
+                logging.warning('Bad retention policy of %s: %r',
+                                article.url, article.retention_policy)
+                policy = None
+            deleted = cls.compact(article, policy) if policy else 0
+            checkpoint.deleted += deleted
+            # Progress is saved after every article, that took work, so that
+            # a run, killed at the request deadline, is not started over.
+            checkpoint.cursor = q.cursor()
+            out_of_time = deadline is not None and time.time() >= deadline
+            if deleted or out_of_time:
+                checkpoint.put()
+            if out_of_time:
+                return checkpoint.deleted, False
+        if checkpoint.is_saved():
+            checkpoint.delete()
+        return checkpoint.deleted, True
+
+
+class Reprocessing(db.Model):
+    """Processes bodies of versions, that were processed by an older pipeline
+    or stored before processing existed, scanning versions in key order.
+    Progress is stored in a singleton checkpoint, along with the id of the
+    pipeline, that all versions have been processed by, so that runs after
+    that cost a single get."""
+    cursor = db.TextProperty()
+    pipeline_id = db.IntegerProperty(indexed=False)
+    processed = db.IntegerProperty(default=0, indexed=False)
+
+    KEY_NAME = 'checkpoint'
+
+    @staticmethod
+    def reprocess(key):
+        """Processes the version anew, unless it has been processed by the
+        current pipeline meanwhile (e.g. by a coalesced save); to be run in a
+        transaction, so that concurrent saves are not overwritten."""
+        version = Version.get(key)
+        if version is None or version.pipeline_id == pipeline.PIPELINE_ID:
+            return False
+        version.process()
+        version.put()
+        return True
+
+    @classmethod
+    def run(cls, batch_size=REPROCESSING_BATCH_SIZE, deadline=None):
+        """Processes versions, until deadline (a timestamp) passes. Returns a
+        tuple (number of versions, processed by this and interrupted runs,
+        whether the run has finished)."""
+        checkpoint = (cls.get_by_key_name(cls.KEY_NAME) or
+                      cls(key_name=cls.KEY_NAME))
+        if checkpoint.pipeline_id == pipeline.PIPELINE_ID:
+            return 0, True
+        q = Version.all().ancestor(global_parent()).order('__key__')
+        while True:
+            if checkpoint.cursor:
+                q.with_cursor(checkpoint.cursor)
+            versions = q.fetch(batch_size)
+            for version in versions:
+                if (version.pipeline_id != pipeline.PIPELINE_ID and
+                        db.run_in_transaction(cls.reprocess, version.key())):
+                    checkpoint.processed += 1
+            if len(versions) < batch_size:
+                processed = checkpoint.processed
+                checkpoint.cursor = None
+                checkpoint.processed = 0
+                checkpoint.pipeline_id = pipeline.PIPELINE_ID
+                checkpoint.put()
+                return processed, True
+            checkpoint.cursor = q.cursor()
+            checkpoint.put()
+            if deadline is not None and time.time() >= deadline:
+                return checkpoint.processed, False
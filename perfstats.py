@@ -0,0 +1,184 @@
+"""Per-request performance statistics.
+
+StatsMiddleware samples requests and records, per handler class, wall time,
+number and latency of datastore RPCs (via apiproxy hooks), template render
+time and response size. Aggregates are kept in instance memory.
+"""
+import bisect
+import contextlib
+import os
+import random
+import threading
+import time
+# Third-party imports
+from google.appengine.api import apiproxy_stub_map
+
+
+# Share of requests to record, 0..1.
+SAMPLE_RATE = float(os.environ.get('PERFSTATS_SAMPLE_RATE', '0.1'))
+METRICS = ('wall_ms', 'rpc_count', 'rpc_ms', 'render_ms', 'response_bytes')
+HOOK_KEY = 'perfstats'
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+
+
+class Histogram(object):
+    """Counts values in exponentially growing buckets, so that percentiles are
+    estimated (within 20%) in constant memory."""
+    BOUNDS = [0.1 * 1.2 ** i for i in range(120)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                bound = self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+                return min(bound, self.max)
+        return 0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(50), 'p95': self.percentile(95),
+            'p99': self.percentile(99), 'max': self.max
+        }
+
+
+class RequestRecord(object):
+    def __init__(self):
+        self.handler = None
+        self.rpc_count = 0
+        self.rpc_ms = 0.0
+        self.render_ms = 0.0
+        self.rpc_starts = {}
+
+
+def current_record():
+    return getattr(_local, 'record', None)
+
+
+def _pre_call(service, call, request, response):
+    record = current_record()
+    if record is not None:
+        record.rpc_starts[id(request)] = time.time()
+
+
+def _post_call(service, call, request, response, rpc, error):
+    record = current_record()
+    if record is not None:
+        start = record.rpc_starts.pop(id(request), None)
+        record.rpc_count += 1
+        if start is not None:
+            record.rpc_ms += (time.time() - start) * 1000
+
+
+def install_hooks():
+    # Testbed replaces apiproxy, hence hooks are (idempotently) installed per
+    # request, not at import.
+    apiproxy = apiproxy_stub_map.apiproxy
+    apiproxy.GetPreCallHooks().Append(HOOK_KEY, _pre_call, 'datastore_v3')
+    apiproxy.GetPostCallHooks().Append(HOOK_KEY, _post_call, 'datastore_v3')
+
+
+def set_handler(name):
+    record = current_record()
+    if record is not None:
+        record.handler = name
+
+
+@contextlib.contextmanager
+def timing_render():
+    record = current_record()
+    start = time.time()
+    try:
+        yield
+    finally:
+        if record is not None:
+            record.render_ms += (time.time() - start) * 1000
+
+
+def dispatcher(router, request, response):
+    """webapp2 dispatcher, that notes handler class of the request."""
+    try:
+        return router.default_dispatcher(request, response)
+    finally:
+        route = getattr(request, 'route', None)
+        if route is not None:
+            set_handler(getattr(route.handler, '__name__', str(route.handler)))
+
+
+def add_sample(handler, values):
+    with _lock:
+        histograms = _stats.get(handler)
+        if histograms is None:
+            histograms = _stats[handler] = dict(
+                (metric, Histogram()) for metric in METRICS)
+        for metric in METRICS:
+            histograms[metric].add(values[metric])
+
+
+def summary():
+    with _lock:
+        return dict(
+            (handler, dict((metric, h.summary())
+                           for metric, h in histograms.items()))
+            for handler, histograms in _stats.items())
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+class StatsMiddleware(object):
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if random.random() >= SAMPLE_RATE:
+            return self.app(environ, start_response)
+
+        install_hooks()
+        record = _local.record = RequestRecord()
+        start = time.time()
+        try:
+            app_iter = self.app(environ, start_response)
+        except Exception:
+            _local.record = None
+            raise
+        return self.sampled(app_iter, record, start)
+
+    @staticmethod
+    def sampled(app_iter, record, start):
+        # Body is streamed; the sample is added, when it has been sent.
+        response_bytes = 0
+        try:
+            for chunk in app_iter:
+                response_bytes += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            _local.record = None
+        add_sample(record.handler or 'NotFound', {
+            'wall_ms': (time.time() - start) * 1000,
+            'rpc_count': record.rpc_count, 'rpc_ms': record.rpc_ms,
+            'render_ms': record.render_ms,
+            'response_bytes': response_bytes
+        })
@@ -0,0 +1,158 @@
+"""Processing of article bodies into HTML, that is served to readers.
+
+Bodies are processed once, when a version is stored: markup is converted
+into HTML, HTML is sanitized and links are rewritten. PIPELINE_ID is
+stored along with the result; it must be increased whenever processing
+changes, so that versions processed by an older pipeline are reprocessed.
+"""
+from cgi import escape
+from htmlentitydefs import name2codepoint
+from HTMLParser import HTMLParser, HTMLParseError
+import re
+import urlparse
+# Internal project imports
+import wikimarkup
+import wikilinks
+
+
+PIPELINE_ID = 1
+
+ALLOWED_TAGS = frozenset([
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'cite', 'code', 'dd',
+    'del', 'div', 'dl', 'dt', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr',
+    'i', 'img', 'ins', 'kbd', 'li', 'ol', 'p', 'pre', 'q', 's', 'small',
+    'span', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th',
+    'thead', 'tr', 'u', 'ul'])
+VOID_TAGS = frozenset(['br', 'hr', 'img'])
+# Content of these is dropped along with the tags.
+DROPPED_CONTENT_TAGS = frozenset(['script', 'style'])
+GLOBAL_ATTRIBUTES = frozenset(['class', 'id', 'title'])
+ALLOWED_ATTRIBUTES = {
+    'a': frozenset(['href', 'name']),
+    'img': frozenset(['src', 'alt', 'width', 'height']),
+    'td': frozenset(['colspan', 'rowspan']),
+    'th': frozenset(['colspan', 'rowspan']),
+}
+URL_ATTRIBUTES = frozenset(['href', 'src'])
+SCHEME_RE = re.compile(r'([a-zA-Z][a-zA-Z0-9+.-]*):')
+ALLOWED_SCHEMES = frozenset(['http', 'https', 'mailto'])
+EXTERNAL_LINK_REL = 'nofollow noopener'
+CHARREF_RE = re.compile(r'(?:[0-9]{1,7}|[xX][0-9a-fA-F]{1,6})\Z')
+# Markup converters by markup name; HTML is taken as it is.
+CONVERTERS = {'html': None, 'markdown': wikimarkup.to_html}
+# Markups, whose blocks are converted independently of each other.
+BLOCK_SPLITTERS = {'markdown': wikimarkup.split_blocks}
+DEFAULT_MARKUP = 'html'
+
+
+def is_safe_url(url):
+    # Browsers ignore whitespace and control characters inside schemes.
+    match = SCHEME_RE.match(re.sub(r'[\s\x00-\x1f]', '', url))
+    return match is None or match.group(1).lower() in ALLOWED_SCHEMES
+
+
+class Sanitizer(HTMLParser):
+    """Keeps allowed tags and attributes only, escapes the rest of the text
+    and closes tags, that are left open."""
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.out = []
+        self.open_tags = []
+        self.dropping = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping is not None:
+            return
+        if tag in DROPPED_CONTENT_TAGS:
+            self.dropping = tag
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed = GLOBAL_ATTRIBUTES | ALLOWED_ATTRIBUTES.get(tag, frozenset())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not is_safe_url(value):
+                continue
+            parts.append(u'{}="{}"'.format(name, escape(value, quote=True)))
+        self.out.append(u'<{}>'.format(u' '.join(parts)))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags[-1:] == [tag]:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.dropping is not None:
+            if tag == self.dropping:
+                self.dropping = None
+            return
+        if tag not in self.open_tags:
+            return
+        # Tags, opened inside this one, are closed as well.
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.out.append(u'</{}>'.format(open_tag))
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping is None:
+            self.out.append(escape(data))
+
+    def handle_entityref(self, name):
+        if self.dropping is None:
+            self.out.append(u'&{};'.format(name) if name in name2codepoint
+                            else u'&amp;' + name)
+
+    def handle_charref(self, name):
+        if self.dropping is None:
+            self.out.append(u'&#{};'.format(name) if CHARREF_RE.match(name)
+                            else u'&amp;#' + name)
+
+    def result(self):
+        self.close()
+        return u''.join(self.out + [u'</{}>'.format(tag)
+                                    for tag in reversed(self.open_tags)])
+
+
+def sanitize(html):
+    sanitizer = Sanitizer()
+    try:
+        sanitizer.feed(html or u'')
+        return sanitizer.result()
+    except HTMLParseError:
+        # Hopelessly broken markup is shown as text.
+        return escape(html)
+
+
+def _rewrite_link(match):
+    tag = match.group(0)
+    href = wikilinks.tag_href(tag)
+    if href is None or not urlparse.urlsplit(href).netloc:
+        return tag
+    # Sanitized tags end with '>' and have no rel attribute.
+    return u'{} rel="{}">'.format(tag[:-1], EXTERNAL_LINK_REL)
+
+
+def rewrite_links(html):
+    """Keeps search engines from crediting external links and linked pages
+    from accessing the wiki's window."""
+    return wikilinks.LINK_TAG_RE.sub(_rewrite_link, html)
+
+
+def process(body, markup=DEFAULT_MARKUP):
+    """Returns HTML, that body in markup is shown as."""
+    converter = CONVERTERS[markup]
+    html = converter(body or u'') if converter is not None else body or u''
+    return rewrite_links(sanitize(html))
+
+
+def blocks(body, markup=DEFAULT_MARKUP):
+    """Splits body into blocks, that are processed independently: processed
+    blocks, joined with newlines, make up the processed body."""
+    splitter = BLOCK_SPLITTERS.get(markup)
+    return splitter(body or u'') if splitter is not None else [body or u'']
@@ -0,0 +1,94 @@
+"""On-demand profiling of single requests.
+
+A request is run under cProfile, if it carries a valid token in X-Profile
+header or _profile query parameter. Token is signed with PROFILE_SECRET and
+is bound to request path and expiration time; see tools/profile_token.py.
+Without PROFILE_SECRET profiling is disabled.
+"""
+import cProfile
+import hashlib
+import hmac
+import logging
+import marshal
+import os
+import pstats
+import time
+from StringIO import StringIO
+
+
+SECRET = os.environ.get('PROFILE_SECRET')
+HEADER = 'X-Profile'
+QUERY_PARAM = '_profile'
+ID_HEADER = 'X-Profile-Id'
+TOKEN_LIFETIME = 60 * 60  # seconds
+REPORT_LINES = 60
+# Profiles must fit a single entity (1 MB); bigger parts are cut or dropped.
+MAX_STATS_SIZE = 800 * 1000  # bytes
+MAX_REPORT_SIZE = 50 * 1000  # characters
+
+
+def _signature(path, expires):
+    return hmac.new(
+        SECRET, '{0}:{1}'.format(expires, path), hashlib.sha256).hexdigest()
+
+
+def make_token(path, lifetime=TOKEN_LIFETIME):
+    expires = int(time.time()) + lifetime
+    return '{0}.{1}'.format(expires, _signature(path, expires))
+
+
+def token_is_valid(token, path):
+    if not SECRET or not token:
+        return False
+    expires, _, signature = token.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(str(signature), _signature(path, expires))
+
+
+def is_requested(request):
+    token = request.headers.get(HEADER) or request.GET.get(QUERY_PARAM)
+    return token_is_valid(token, request.path)
+
+
+def report(profiler, limit=REPORT_LINES):
+    stream = StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+def run(func, request, response, handler_name):
+    """Calls func under cProfile, stores the profile and returns its id in
+    response header."""
+    profiler = cProfile.Profile()
+    start = time.time()
+    try:
+        return profiler.runcall(func)
+    finally:
+        duration = (time.time() - start) * 1000
+        # Failing to store the profile must not fail the request or hide its
+        # exception.
+        try:
+            save(profiler, request, response, handler_name, duration)
+        except Exception:
+            logging.exception('Failed to store profile of %s', request.path)
+
+
+def save(profiler, request, response, handler_name, duration):
+    from model import RequestProfile
+
+    profiler.create_stats()
+    stats = marshal.dumps(profiler.stats)
+    text = report(profiler).decode('utf-8', 'replace')
+    if len(stats) > MAX_STATS_SIZE:
+        text = u'Raw stats of {} bytes are not stored.\n\n{}'.format(
+            len(stats), text)
+        stats = None
+    if len(text) > MAX_REPORT_SIZE:
+        text = text[:MAX_REPORT_SIZE] + u'\n[cut]'
+    profile = RequestProfile(
+        path=request.path, handler=handler_name, duration_ms=duration,
+        stats=stats, report=text)
+    profile.put()
+    response.headers[ID_HEADER] = str(profile.key().id())
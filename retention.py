@@ -0,0 +1,50 @@
+"""Version retention policy, applied when history of an article is compacted.
+
+The latest keep_last versions are kept. Of older versions, created within
+daily_days, the latest one of every day is kept; of versions created within
+weekly_weeks, the latest one of every week. Older versions are deleted, except
+the first one, which is always kept.
+"""
+import datetime as dt
+
+
+class RetentionPolicy(object):
+    def __init__(self, keep_last, daily_days=0, weekly_weeks=0):
+        if keep_last < 1 or daily_days < 0 or weekly_weeks < 0:
+            raise ValueError('Invalid retention policy')
+        self.keep_last = keep_last
+        self.daily_days = daily_days
+        self.weekly_weeks = weekly_weeks
+
+    @classmethod
+    def parse(cls, value):
+        """Parses "keep_last[,daily_days[,weekly_weeks]]", e.g. "100,30,52".
+        Raises ValueError, if value is malformed."""
+        return cls(*[int(part) for part in value.split(',')][:3])
+
+    def __str__(self):
+        return '{},{},{}'.format(
+            self.keep_last, self.daily_days, self.weekly_weeks)
+
+    def checkpoint(self, created, now):
+        """Returns the period, whose latest version is kept, or None, if
+        versions created so long ago are not kept."""
+        age = now - created
+        if age <= dt.timedelta(days=self.daily_days):
+            return 'day', created.date()
+        if age <= dt.timedelta(weeks=self.weekly_weeks):
+            return 'week', created.isocalendar()[:2]
+        return None
+
+    def deletions(self, versions, first_key, now):
+        """Yields keys of versions, that are not retained. versions is an
+        iterable of (key, created) tuples, newest first."""
+        last_checkpoint = None
+        for i, (key, created) in enumerate(versions):
+            checkpoint = self.checkpoint(created, now)
+            if i < self.keep_last or key == first_key:
+                last_checkpoint = checkpoint
+            elif checkpoint is None or checkpoint == last_checkpoint:
+                yield key
+            else:
+                last_checkpoint = checkpoint
@@ -0,0 +1,94 @@
+import re
+# Third-party imports
+import webapp2
+
+
+ARTICLE_PATH_RE = re.compile(r'/[a-zA-Z0-9_/-]*\Z')
+VERSION_ID_RE = re.compile(r'[0-9]+\Z')
+VERSION_MARKER = '_version/'
+
+
+def article_url(path):
+    """Returns url of the article path points to, or None, if path is not a
+    valid article path. Same as matching ARTICLE_RE against the whole path, but
+    never backtracks."""
+    if not ARTICLE_PATH_RE.match(path):
+        return None
+    if len(path) > 1 and path.endswith('/'):
+        return path[:-1]
+    return path
+
+
+def versioned_article_url(path):
+    """Returns a tuple (url, version_id) for paths like '/a/b/_version/5', or
+    None."""
+    i = path.rfind(VERSION_MARKER)
+    if i == -1:
+        return None
+    version_id = path[i + len(VERSION_MARKER):]
+    if not VERSION_ID_RE.match(version_id):
+        return None
+    url = article_url(path[:i])
+    if url is None:
+        return None
+    return url, version_id
+
+
+class ArticleRoute(webapp2.BaseRoute):
+    """Dispatches all article paths to view, edit, history and delete handlers
+    in a single linear pass. Produces the same arguments as the following
+    list of regexp routes, tried in order:
+
+        ARTICLE_RE = r'((?:/[a-zA-Z0-9_-]*)+?)/?'
+        '/_delete' + ARTICLE_RE + '_version/(\\d+)'    -> delete
+        '/_edit' + ARTICLE_RE + '_version/(\\d+)'      -> edit
+        '/_edit' + ARTICLE_RE                         -> edit
+        '/_history' + ARTICLE_RE                      -> history
+        ARTICLE_RE + '_version/(\\d+)'                 -> view
+        ARTICLE_RE                                    -> view
+    """
+    # Prefix, handler name and whether version suffix is optional; versioned
+    # match is always tried first.
+    PREFIXED_TARGETS = (
+        ('/_delete', 'delete', False),
+        ('/_edit', 'edit', True),
+        ('/_history', 'history', None),
+    )
+
+    def __init__(self, view, edit, history, delete, name=None):
+        super(ArticleRoute, self).__init__('<article>', name=name)
+        handlers = {
+            'view': view, 'edit': edit, 'history': history, 'delete': delete}
+        # Router caches handler adapter on the route it gets from match(),
+        # hence a separate route per handler.
+        self.targets = dict(
+            (target, webapp2.BaseRoute('<article>', handler))
+            for target, handler in handlers.items())
+
+    def match_path(self, path):
+        """Returns a tuple (handler name, args) or None."""
+        for prefix, target, unversioned in self.PREFIXED_TARGETS:
+            if not path.startswith(prefix):
+                continue
+            rest = path[len(prefix):]
+            if unversioned is not None:
+                match = versioned_article_url(rest)
+                if match is not None:
+                    return target, match
+            if unversioned is not False:
+                url = article_url(rest)
+                if url is not None:
+                    return target, (url,)
+
+        match = versioned_article_url(path)
+        if match is not None:
+            return 'view', match
+        url = article_url(path)
+        if url is not None:
+            return 'view', (url,)
+
+    def match(self, request):
+        match = self.match_path(request.path)
+        if match is not None:
+            target, args = match
+            return self.targets[target], args, {}
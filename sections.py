@@ -0,0 +1,39 @@
+"""Sections of article bodies, edited separately from the rest of the body.
+
+Section 0 is the part of the body before the first heading; section N starts
+with N-th heading (<h1>..<h6>, or a line starting with '#'..'######' in
+markdown) and lasts until the next one. Sections joined together make up the
+whole body.
+"""
+import re
+
+
+HEADING_RE = re.compile(r'<h[1-6]\b', re.IGNORECASE)
+# Lines inside fenced code are not told apart; sections still join back into
+# the same body.
+MARKDOWN_HEADING_RE = re.compile(r'^#{1,6}\s', re.MULTILINE)
+HEADING_RES = {'html': HEADING_RE, 'markdown': MARKDOWN_HEADING_RE}
+
+
+class SectionConflict(Exception):
+    pass
+
+
+def split_sections(body, markup='html'):
+    body = body or u''
+    starts = [m.start() for m in HEADING_RES[markup].finditer(body)]
+    bounds = [0] + starts + [len(body)]
+    return [body[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def merge_section(base_body, latest_body, index, text, markup='html'):
+    """Returns latest_body with section index replaced by text, that was
+    edited starting from base_body. Raises SectionConflict, if the section
+    has changed since base_body."""
+    base = split_sections(base_body, markup)
+    latest = split_sections(latest_body, markup)
+    if (index >= len(base) or index >= len(latest) or
+            base[index] != latest[index]):
+        raise SectionConflict(index)
+    latest[index] = text
+    return u''.join(latest)
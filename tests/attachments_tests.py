@@ -0,0 +1,194 @@
+import hashlib
+import os
+import unittest
+# Internal project imports
+from attachments import RangeNotSatisfiable, attachment_path, parse_range
+from base import BaseTestCase
+
+
+class AttachmentPathTest(unittest.TestCase):
+    def test_paths_are_split_into_article_url_and_file_name(self):
+        self.assertEqual(attachment_path('/kittens/diagram.png'),
+                         ('/kittens', 'diagram.png'))
+        self.assertEqual(attachment_path('/a/b/notes'), ('/a/b', 'notes'))
+        self.assertEqual(attachment_path('/diagram.png'), ('/', 'diagram.png'))
+
+    def test_invalid_paths_do_not_match(self):
+        for path in ['/', '/kittens/', '/kittens//a.png', '/kittens/.htaccess',
+                     '/kit.tens/a.png', '/kittens/a b.png', '']:
+            self.assertIsNone(attachment_path(path), path)
+
+
+class ParseRangeTest(unittest.TestCase):
+    def test_single_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 10))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 100))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 100))
+        self.assertEqual(parse_range('bytes=95-200', 100), (95, 100))
+        self.assertEqual(parse_range('bytes=-200', 100), (0, 100))
+
+    def test_whole_content_is_sent_for_other_headers(self):
+        for header in [None, '', 'bytes=0-9,20-29', 'bytes=9-0', 'items=0-9',
+                       'bytes=-']:
+            self.assertIsNone(parse_range(header, 100), header)
+
+    def test_ranges_outside_of_content_are_not_satisfiable(self):
+        for header in ['bytes=100-', 'bytes=200-300', 'bytes=-0']:
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, 100)
+
+
+class AttachmentTest(BaseTestCase):
+    def setUp(self):
+        super(AttachmentTest, self).setUp()
+        # Bob signs up and creates an article.
+        self.create_article('/kittens', body='<p>Meow!</p>')
+
+    def upload(self, url, data, chunk_size=None):
+        upload = self.testapp.post(url).json
+        chunk_size = chunk_size or upload['chunk_size']
+        for offset in range(0, len(data), chunk_size):
+            upload = self.post_chunk(
+                url, upload['upload'], offset,
+                data[offset:offset + chunk_size]).json
+        return self.finish(url, upload['upload'])
+
+    def finish(self, url, upload_id):
+        return self.testapp.post(
+            '{}?upload={}&finish=1'.format(url, upload_id)).json
+
+    def post_chunk(self, url, upload_id, offset, chunk, **kwargs):
+        return self.testapp.post(
+            '{}?upload={}&offset={}'.format(url, upload_id, offset), chunk,
+            content_type='application/octet-stream', **kwargs)
+
+    def test_uploaded_file_is_served_in_full_and_in_ranges(self):
+        from model import ATTACHMENT_CHUNK_SIZE, AttachmentChunk
+
+        data = os.urandom(2 * ATTACHMENT_CHUNK_SIZE + 1000)
+        attachment = self.upload('/_files/kittens/diagram.png', data)
+        self.assertEqual(attachment['url'], '/_files/kittens/diagram.png')
+        self.assertEqual(attachment['size'], len(data))
+        self.assertEqual(AttachmentChunk.all().count(), 3)
+
+        response = self.testapp.get('/_files/kittens/diagram.png')
+        self.assertEqual(response.body, data)
+        self.assertEqual(response.content_type, 'image/png')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        etag = response.headers['ETag']
+
+        # Alice's browser resumes the download across a chunk boundary.
+        start = ATTACHMENT_CHUNK_SIZE - 10
+        response = self.testapp.get(
+            '/_files/kittens/diagram.png', status=206,
+            headers={'Range': 'bytes={}-'.format(start), 'If-Range': etag})
+        self.assertEqual(response.body, data[start:])
+        self.assertEqual(response.headers['Content-Range'], 'bytes {}-{}/{}'
+                         .format(start, len(data) - 1, len(data)))
+
+        self.testapp.get('/_files/kittens/diagram.png', status=304,
+                         headers={'If-None-Match': etag})
+        self.testapp.get('/_files/kittens/diagram.png', status=416,
+                         headers={'Range': 'bytes=999999999-'})
+        # If-Range of another version of the file gets all of it.
+        response = self.testapp.get(
+            '/_files/kittens/diagram.png',
+            headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual(len(response.body), len(data))
+
+    def test_content_hash_does_not_depend_on_upload(self):
+        data = 'Purr ' * 1000
+        first = self.upload('/_files/kittens/a.txt', data)
+        second = self.upload('/_files/kittens/b.txt', data)
+        self.assertEqual(first['sha256'], second['sha256'])
+
+    def test_replaced_file_leaves_no_chunks(self):
+        from model import AttachmentChunk
+
+        self.upload('/_files/kittens/notes.txt', 'Old notes')
+        self.upload('/_files/kittens/notes.txt', 'New notes')
+        self.assertEqual(AttachmentChunk.all().count(), 1)
+        response = self.testapp.get('/_files/kittens/notes.txt')
+        self.assertEqual(response.body, 'New notes')
+
+    def test_finishing_twice_keeps_the_attachment(self):
+        from model import AttachmentUpload
+
+        url = '/_files/kittens/notes.txt'
+        upload_id = self.testapp.post(url).json['upload']
+        self.post_chunk(url, upload_id, 0, 'Purr')
+        # Both finish requests have loaded the upload, before either
+        # finished it.
+        upload = AttachmentUpload.get_by_key_name(upload_id)
+        first = upload.finish()
+        second = upload.finish()
+        self.assertEqual(second.key(), first.key())
+        self.assertEqual(self.testapp.get(url).body, 'Purr')
+        self.testapp.post('{}?upload={}&finish=1'.format(url, upload_id),
+                          status=404)
+
+    def test_interrupted_upload_is_resumed_from_offset(self):
+        from model import ATTACHMENT_CHUNK_SIZE
+
+        data = os.urandom(ATTACHMENT_CHUNK_SIZE + 10)
+        url = '/_files/kittens/diagram.png'
+        upload_id = self.testapp.post(url).json['upload']
+        self.post_chunk(url, upload_id, 0, data[:ATTACHMENT_CHUNK_SIZE])
+
+        # The response was lost, so Bob sends the same chunk again.
+        response = self.post_chunk(url, upload_id, 0,
+                                   data[:ATTACHMENT_CHUNK_SIZE], status=409)
+        self.assertEqual(response.json['offset'], ATTACHMENT_CHUNK_SIZE)
+
+        self.post_chunk(url, upload_id, ATTACHMENT_CHUNK_SIZE,
+                        data[ATTACHMENT_CHUNK_SIZE:])
+        attachment = self.finish(url, upload_id)
+        self.assertEqual(attachment['size'], len(data))
+        self.assertEqual(self.testapp.get(url).body, data)
+
+    def test_only_the_last_chunk_may_be_short(self):
+        url = '/_files/kittens/diagram.png'
+        upload_id = self.testapp.post(url).json['upload']
+        self.post_chunk(url, upload_id, 0, 'abc')
+        self.post_chunk(url, upload_id, 3, 'def', status=400)
+
+    def test_untrusted_types_are_downloaded(self):
+        self.upload('/_files/kittens/page.html', '<script>alert(1)</script>')
+        response = self.testapp.get('/_files/kittens/page.html')
+        self.assertTrue(
+            response.headers['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(response.headers['X-Content-Type-Options'], 'nosniff')
+
+    def test_anonymous_users_cannot_upload(self):
+        self.testapp.get('/logout')
+        self.testapp.post('/_files/kittens/diagram.png', status=403)
+
+    def test_files_of_missing_articles_or_names_are_not_found(self):
+        self.testapp.post('/_files/puppies/diagram.png', status=404)
+        self.testapp.get('/_files/kittens/diagram.png', status=404)
+        self.testapp.get('/_files/kittens/', status=404)
+
+    def test_file_content_hash_matches_chunk_hashes(self):
+        data = 'Meow' * 10
+        attachment = self.upload('/_files/kittens/meow.txt', data)
+        expected = hashlib.sha256(hashlib.sha256(data).hexdigest()).hexdigest()
+        self.assertEqual(attachment['sha256'], expected)
+
+    def test_abandoned_uploads_are_deleted_with_their_chunks(self):
+        from datetime import datetime, timedelta
+        from model import AttachmentChunk, AttachmentUpload
+
+        # Bob starts two uploads and never finishes them.
+        url = '/_files/kittens/diagram.png'
+        old_id = self.testapp.post(url).json['upload']
+        self.post_chunk(url, old_id, 0, 'abc')
+        new_id = self.testapp.post(url).json['upload']
+        self.post_chunk(url, new_id, 0, 'def')
+        old = AttachmentUpload.get_by_key_name(old_id)
+        old.created = datetime.now() - timedelta(days=2)
+        old.put()
+
+        self.testapp.get('/_cron/uploads')
+        self.assertIsNone(AttachmentUpload.get_by_key_name(old_id))
+        self.assertIsNotNone(AttachmentUpload.get_by_key_name(new_id))
+        self.assertEqual([c.data for c in AttachmentChunk.all()], ['def'])
@@ -1,6 +1,8 @@
+from contextlib import contextmanager
 from random import randint
 import unittest
 # Third-party imports
+from google.appengine.api import apiproxy_stub_map
 from google.appengine.ext import testbed
 from webtest import TestApp, TestResponse
 
@@ -10,6 +12,12 @@ class BaseTestCase(unittest.TestCase):
         self.testbed = testbed.Testbed()
         self.testbed.activate()
         self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        # Datastore calls are recorded here inside assertMaxDatastoreCalls.
+        self.datastore_calls = None
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'datastore_calls', self._record_datastore_call, 'datastore_v3')
         # This import is here, because another import inside starts using
         # datastore right away.
         from main import app
@@ -23,6 +31,10 @@ class BaseTestCase(unittest.TestCase):
     def tearDown(self):
         self.testbed.deactivate()
 
+    def _record_datastore_call(self, service, call, request, response):
+        if self.datastore_calls is not None:
+            self.datastore_calls.append(call)
+
     def create_article(self, url, sign_up=True, **fields):
         if sign_up:
             self.sign_up()
@@ -89,3 +101,16 @@ class BaseTestCase(unittest.TestCase):
 
     def assertTitleEqual(self, page, title_text):
         self.assertEqual(page.pyquery('title').text(), title_text)
+
+    @contextmanager
+    def assertMaxDatastoreCalls(self, n):
+        # Fails, if code inside the with-block makes more than n datastore
+        # RPCs.
+        self.datastore_calls = []
+        try:
+            yield self.datastore_calls
+        finally:
+            calls, self.datastore_calls = self.datastore_calls, None
+        if len(calls) > n:
+            self.fail('{0} datastore calls made, at most {1} expected: {2}'
+                      .format(len(calls), n, ', '.join(calls)))
@@ -0,0 +1,113 @@
+import unittest
+# Internal project imports
+from base import BaseTestCase
+import model
+from retention import RetentionPolicy
+from wikilinks import split_at_tags
+
+
+def make_body(paragraphs):
+    return u''.join(u'<p>Paragraph {0} about kittens.</p>'.format(i)
+                    for i in range(paragraphs))
+
+
+class SplitAtTagsTest(unittest.TestCase):
+    def test_pieces_are_cut_before_tags_and_fit_the_limit(self):
+        html = make_body(20)
+        pieces = list(split_at_tags(html, 100, at_most=True))
+        self.assertEqual(u''.join(pieces), html)
+        for piece in pieces:
+            self.assertLessEqual(len(piece), 100)
+            self.assertTrue(piece.startswith('<'))
+
+    def test_pieces_are_at_least_size_long_by_default(self):
+        html = make_body(20)
+        pieces = list(split_at_tags(html, 100))
+        self.assertEqual(u''.join(pieces), html)
+        for piece in pieces[:-1]:
+            self.assertGreaterEqual(len(piece), 100)
+            self.assertTrue(piece.startswith('<'))
+
+    def test_text_without_tags_is_cut_anyway(self):
+        pieces = list(split_at_tags(u'x' * 250, 100, at_most=True))
+        self.assertEqual([len(p) for p in pieces], [100, 100, 50])
+
+
+class ChunkedBodyTest(BaseTestCase):
+    def setUp(self):
+        super(ChunkedBodyTest, self).setUp()
+        self.sizes = model.STORED_CHUNK_SIZE, model.MAX_INLINE_TEXT_SIZE
+        model.STORED_CHUNK_SIZE, model.MAX_INLINE_TEXT_SIZE = 200, 100
+
+    def tearDown(self):
+        model.STORED_CHUNK_SIZE, model.MAX_INLINE_TEXT_SIZE = self.sizes
+        super(ChunkedBodyTest, self).tearDown()
+
+    def chunk_count(self):
+        return model.VersionChunk.all().count()
+
+    def version_chunk_count(self, version):
+        return version.body_chunks + version.html_chunks
+
+    def test_long_body_is_stored_in_chunks(self):
+        body = make_body(30)
+        article = self.article_model.new('/kittens', 'Kittens', body)
+        version = model.Version.by_id(article.version.id)
+        self.assertIsNone(version.stored_body)
+        self.assertGreater(version.body_chunks, 1)
+        self.assertGreater(version.html_chunks, 1)
+        self.assertEqual(self.chunk_count(), self.version_chunk_count(version))
+        self.assertEqual(version.body, body)
+        self.assertEqual(version.html, body)
+
+        # Bob views the article and sees all of it.
+        page = self.testapp.get('/kittens')
+        self.assertEqual(len(page.pyquery('#wiki-body p')), 30)
+
+    def test_short_body_is_stored_inline(self):
+        article = self.article_model.new('/kittens', 'Kittens', make_body(1))
+        version = model.Version.by_id(article.version.id)
+        self.assertEqual(version.body_chunks, 0)
+        self.assertEqual(self.chunk_count(), 0)
+
+    def test_links_are_annotated_across_chunks(self):
+        self.article_model.new('/puppies', 'Puppies', '')
+        body = (make_body(10) + u'<a href="/puppies">Puppies</a>' +
+                make_body(10) + u'<a href="/parrots">Parrots</a>')
+        article = self.article_model.new('/kittens', 'Kittens', body)
+        version = model.Version.by_id(article.version.id)
+        self.assertGreater(version.body_chunks, 1)
+        self.assertEqual(version.link_status(),
+                         {'/puppies': True, '/parrots': False})
+
+    def test_overwritten_body_leaves_no_stale_chunks(self):
+        self.article_model.new('/kittens', 'Kittens', make_body(30))
+        version = self.article_model.by_url('/kittens').version
+        version.body = make_body(10)
+        version.process()
+        version.put()
+        self.assertEqual(self.chunk_count(), self.version_chunk_count(version))
+
+        version.body = u'<p>Short</p>'
+        version.process()
+        version.put()
+        self.assertEqual(self.chunk_count(), 0)
+        self.assertEqual(model.Version.by_id(version.id).body, u'<p>Short</p>')
+
+    def test_deleted_versions_leave_no_chunks(self):
+        self.article_model.new('/kittens', 'Kittens', u'')
+        article = self.article_model.by_url(
+            '/kittens', project_with_version=False)
+        article.new_version('Kittens', make_body(30))
+        article.new_version('Kittens', make_body(20))
+        article.new_version('Kittens', u'')
+        versions = sorted(article.version_set, key=lambda v: v.id)
+
+        versions[1].delete()
+        self.assertEqual(self.chunk_count(),
+                         self.version_chunk_count(versions[2]))
+
+        article = self.article_model.by_url(
+            '/kittens', project_with_version=False)
+        model.HistoryCompaction.compact(article, RetentionPolicy(1))
+        self.assertEqual(self.chunk_count(), 0)
@@ -0,0 +1,111 @@
+import gzip
+import zlib
+from StringIO import StringIO
+# Third-party imports
+from webob import Request
+# Internal project imports
+from base import BaseTestCase
+
+
+class CompressionTest(BaseTestCase):
+    def setUp(self):
+        super(CompressionTest, self).setUp()
+        # Bob signs up and creates an article, big enough to be compressed.
+        self.create_article('/kittens', body='<p>Meow!</p>' * 200)
+
+    def raw_get(self, url, **headers):
+        # Unlike TestApp, does not decode compressed response.
+        return Request.blank(url, headers=headers).get_response(
+            self.testapp.app)
+
+    def test_response_is_gzipped_when_client_accepts_it(self):
+        plain = self.raw_get('/kittens')
+        response = self.raw_get('/kittens', Accept_Encoding='gzip, deflate')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        body = gzip.GzipFile(fileobj=StringIO(response.body)).read()
+        self.assertEqual(body, plain.body)
+        self.assertLess(len(response.body), len(plain.body))
+
+    def test_deflate_is_used_when_gzip_is_not_accepted(self):
+        plain = self.raw_get('/kittens')
+        response = self.raw_get(
+            '/kittens', Accept_Encoding='gzip;q=0, deflate')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(response.body), plain.body)
+
+    def test_response_is_not_compressed_by_default(self):
+        response = self.raw_get('/kittens')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+
+    def test_compressed_representation_has_its_own_etag(self):
+        plain = self.raw_get('/_recent')
+        response = self.raw_get('/_recent', Accept_Encoding='gzip')
+        etag = response.headers['ETag']
+        self.assertEqual(etag, plain.headers['ETag'][:-1] + '-gzip"')
+
+        # Compressed ETag works for conditional requests, and is the one sent
+        # back with 304.
+        response = self.raw_get(
+            '/_recent', Accept_Encoding='gzip', If_None_Match=etag)
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        # Uncompressed ETag stays as it is.
+        response = self.raw_get(
+            '/_recent', Accept_Encoding='gzip',
+            If_None_Match=plain.headers['ETag'])
+        self.assertEqual(response.status_int, 304)
+        self.assertEqual(response.headers['ETag'], plain.headers['ETag'])
+
+    def test_cached_compressed_body_is_not_compressed_again(self):
+        import compression
+        calls = []
+        original_compress = compression.compress
+
+        def compress(*args, **kwargs):
+            calls.append(args)
+            return original_compress(*args, **kwargs)
+
+        compression.compress = compress
+        try:
+            for _ in range(3):
+                response = self.raw_get('/_recent', Accept_Encoding='gzip')
+                self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        finally:
+            compression.compress = original_compress
+        self.assertEqual(len(calls), 1)
+
+    def test_streamed_files_are_not_buffered(self):
+        # Bob attaches a text file to the article.
+        url = '/_files/kittens/notes.txt'
+        upload_id = self.testapp.post(url).json['upload']
+        self.testapp.post('{}?upload={}&offset=0'.format(url, upload_id),
+                          'Purr ' * 1000,
+                          content_type='application/octet-stream')
+        self.testapp.post('{}?upload={}&finish=1'.format(url, upload_id))
+
+        response = self.raw_get(url, Accept_Encoding='gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.body, 'Purr ' * 1000)
+
+    def test_responses_over_the_limit_are_passed_through(self):
+        import compression
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return ['a' * 600, 'b' * 600]
+
+        original_size = compression.MAX_COMPRESSED_SIZE
+        compression.MAX_COMPRESSED_SIZE = 1000
+        try:
+            response = Request.blank(
+                '/', headers={'Accept-Encoding': 'gzip'}).get_response(
+                compression.CompressionMiddleware(app))
+        finally:
+            compression.MAX_COMPRESSED_SIZE = original_size
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.body, 'a' * 600 + 'b' * 600)
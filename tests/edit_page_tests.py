@@ -1,4 +1,5 @@
 # coding=utf-8
+import time
 from base import BaseTestCase
 
 
@@ -233,6 +234,18 @@ class NewArticleTest(BaseTestCase):
         self.assertEqual(head.text(), 'I Do Not Exist')
         self.assertEqual(body.text(), 'This is some testing text.')
 
+    def test_existing_article_is_not_created_again(self):
+        # Bob and Alice save a new article at the same moment; Alice's save
+        # comes second.
+        first = self.article_model.new('/kittens', 'Kittens', u'<p>Bob</p>')
+        self.assertIsNone(
+            self.article_model.new('/kittens', 'Kittens', u'<p>Alice</p>'))
+
+        # Bob's article is kept with its version.
+        self.assertEqual(self.fetch_version_ids('/kittens'),
+                         [first.version.id])
+        self.assertIn('Bob', self.testapp.get('/kittens').body)
+
     def test_can_edit_article_once_it_has_been_created(self):
         # Bob signs up and creates a new article right away.
         self.sign_up()
@@ -459,4 +472,90 @@ class VersionEditTest(BaseTestCase):
         # The first version of the article is opened for editing.
         form = response.form
         self.assertEqual(form['head'].value, 'Moon')
-        self.assertEqual(form['body'].value, '<div>Goddess of mystery.</div>')
\ No newline at end of file
+        self.assertEqual(form['body'].value, '<div>Goddess of mystery.</div>')
+
+
+class EditCoalescingTest(BaseTestCase):
+    def setUp(self):
+        super(EditCoalescingTest, self).setUp()
+        import model
+        self.model = model
+        self.window = model.EDIT_COALESCE_WINDOW
+        model.EDIT_COALESCE_WINDOW = 60
+
+    def tearDown(self):
+        self.model.EDIT_COALESCE_WINDOW = self.window
+        super(EditCoalescingTest, self).tearDown()
+
+    def test_rapid_saves_by_the_same_user_overwrite_their_version(self):
+        # Bob creates an article and saves it several times in a row.
+        self.create_article('/kittens', body='<p>Kittens</p>')
+        self.edit_article('/kittens', body='<p>Kittens are cute.</p>')
+        page = self.edit_article(
+            '/kittens', body='<p>Kittens are <a href="/kittens">cute</a>.</p>')
+
+        # There is still a single version, that has the latest content and
+        # up-to-date links.
+        self.assertEqual(len(self.fetch_version_ids('/kittens')), 1)
+        self.assertEqual(page.pyquery('#wiki-body').text(),
+                         'Kittens are cute.')
+        self.assertEqual(
+            page.pyquery('#wiki-body a').attr('class'), 'internal-link')
+
+    def test_overwritten_version_is_moved_up_in_recent_changes(self):
+        # Bob creates two articles and saves the first one once more.
+        self.create_article('/kittens', head='Kittens')
+        self.create_article('/puppies', sign_up=False, head='Puppies')
+        etag = self.testapp.get('/_recent').headers['ETag']
+        feed_etag = self.testapp.get('/_recent.atom').headers['ETag']
+        self.edit_article('/kittens', head='Cute Kittens')
+
+        # The save is on top of recent changes, still as the creation of the
+        # article, and is not listed twice.
+        recent = self.testapp.get(
+            '/_recent', headers={'If-None-Match': etag}, status=200)
+        changes = recent.pyquery('#recent-changes>li')
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(
+            changes.eq(0).find('.change-article-link').text(), 'Cute Kittens')
+        self.assertIn('(new article)', changes.eq(0).text())
+        self.testapp.get('/_recent.atom',
+                         headers={'If-None-Match': feed_etag}, status=200)
+
+    def test_saves_by_another_user_create_a_new_version(self):
+        # Bob creates an article.
+        self.create_article('/kittens')
+        self.testapp.get('/logout')
+
+        # Alice edits it right away; her save creates a new version.
+        self.sign_up(username='alice', password='test123', verify='test123')
+        self.edit_article('/kittens', body='<p>Kittens are cute.</p>')
+        version_ids = self.fetch_version_ids('/kittens')
+        self.assertEqual(len(version_ids), 2)
+        version = self.model.Version.by_id(version_ids[1])
+        self.assertEqual(version.author.name, 'alice')
+
+    def test_saves_after_the_window_create_a_new_version(self):
+        self.model.EDIT_COALESCE_WINDOW = 0.01
+        self.create_article('/kittens')
+        time.sleep(0.02)
+
+        self.edit_article('/kittens', body='<p>Kittens are cute.</p>')
+        self.assertEqual(len(self.fetch_version_ids('/kittens')), 2)
+
+    def test_system_writes_do_not_move_the_window(self):
+        from model import Reprocessing
+
+        self.create_article('/kittens')
+        version = self.model.Version.by_id(
+            self.fetch_version_ids('/kittens')[0])
+        saved = version.saved
+        self.assertIsNotNone(saved)
+
+        # The version is reprocessed, which doesn't count as a save.
+        version.pipeline_id = None
+        version.put()
+        Reprocessing.run()
+        version = self.model.Version.by_id(version.id)
+        self.assertIsNotNone(version.pipeline_id)
+        self.assertEqual(version.saved, saved)
@@ -0,0 +1,28 @@
+import unittest
+# Internal project imports
+import hashutils
+from hashutils import check_against_hash, encrypt, make_hash, needs_rehash
+
+
+class PasswordHashTest(unittest.TestCase):
+    def test_hash_matches_only_the_original_string(self):
+        h = make_hash('bobtest123')
+        self.assertTrue(h.startswith('pbkdf2_sha256$'))
+        self.assertTrue(check_against_hash('bobtest123', h))
+        self.assertFalse(check_against_hash('bobtest124', h))
+
+    def test_hash_records_its_iterations(self):
+        h = make_hash('bobtest123', iterations=1000)
+        self.assertEqual(h.split('$')[1], '1000')
+        self.assertTrue(check_against_hash('bobtest123', h))
+
+    def test_legacy_hashes_are_checked_and_need_rehash(self):
+        legacy = encrypt('bobtest123' + 'salt') + '|salt'
+        self.assertTrue(check_against_hash('bobtest123', legacy))
+        self.assertFalse(check_against_hash('bobtest124', legacy))
+        self.assertTrue(needs_rehash(legacy))
+
+    def test_hashes_with_other_iterations_need_rehash(self):
+        self.assertFalse(needs_rehash(make_hash('bobtest123')))
+        iterations = hashutils.PBKDF2_ITERATIONS + 1
+        self.assertTrue(needs_rehash(make_hash('bobtest123', iterations)))
@@ -0,0 +1,59 @@
+# Internal project imports
+from base import BaseTestCase
+
+
+class IndexPageTest(BaseTestCase):
+    def setUp(self):
+        super(IndexPageTest, self).setUp()
+        import model
+        self.model = model
+        self.default_page_size = model.ARTICLE_INDEX_PAGE_SIZE
+
+    def tearDown(self):
+        self.model.ARTICLE_INDEX_PAGE_SIZE = self.default_page_size
+        super(IndexPageTest, self).tearDown()
+
+    def test_articles_are_listed_alphabetically(self):
+        # Bob signs up and creates several articles in random order.
+        self.create_article('/kittens')
+        self.create_article('/dogs', sign_up=False)
+        self.create_article('/dogs/puppies', sign_up=False)
+
+        # He opens the index page; all articles are listed there sorted by url.
+        index = self.testapp.get('/_index')
+        self.assertTitleEqual(index, 'MyWiki *** All Articles')
+        links = index.pyquery('.index-article-link')
+        self.assertEqual([a.text for a in links],
+                         ['/dogs', '/dogs/puppies', '/kittens'])
+
+    def test_index_is_paginated(self):
+        self.model.ARTICLE_INDEX_PAGE_SIZE = 2
+
+        # Bob signs up and creates three articles.
+        for url in ['/a', '/b', '/c']:
+            self.create_article(url, sign_up=(url == '/a'))
+
+        # First page of index lists only two of them.
+        index = self.testapp.get('/_index')
+        links = index.pyquery('.index-article-link')
+        self.assertEqual([a.text for a in links], ['/a', '/b'])
+
+        # Next page shows the rest and has no link further.
+        next_page = index.click(linkid='next-page-link')
+        links = next_page.pyquery('.index-article-link')
+        self.assertEqual([a.text for a in links], ['/c'])
+        self.assertEqual(len(next_page.pyquery('#next-page-link')), 0)
+
+    def test_new_article_shows_up_in_cached_index(self):
+        # Bob signs up, creates an article and opens the index.
+        self.create_article('/b')
+        self.testapp.get('/_index')
+
+        # Bob creates one more article. It shows up in the index at once.
+        self.create_article('/a', sign_up=False)
+        index = self.testapp.get('/_index')
+        links = index.pyquery('.index-article-link')
+        self.assertEqual([a.text for a in links], ['/a', '/b'])
+
+    def test_bad_cursor_is_rejected(self):
+        self.testapp.get('/_index?cursor=garbage', status=400)
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+import unittest
+# Internal project imports
+import jinjacfg
+from tools.compile_templates import compile_templates
+
+
+class CompiledTemplatesTest(unittest.TestCase):
+    def setUp(self):
+        self.templates_dir = tempfile.mkdtemp()
+        self.compiled_dir = os.path.join(tempfile.mkdtemp(), 'compiled')
+        self.write_template('Hello, {{ name }}!')
+        self.addCleanup(shutil.rmtree, self.templates_dir)
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.compiled_dir))
+
+    def write_template(self, source):
+        with open(os.path.join(self.templates_dir, 'hello.html'), 'w') as f:
+            f.write(source)
+
+    def is_current(self):
+        return jinjacfg.compiled_templates_are_current(
+            self.compiled_dir, self.templates_dir)
+
+    def test_templates_are_current_until_their_sources_change(self):
+        self.assertFalse(self.is_current())
+
+        compile_templates(self.compiled_dir, self.templates_dir)
+        self.assertTrue(self.is_current())
+
+        # A template is edited after compilation, so its sources are used.
+        self.write_template('Goodbye, {{ name }}!')
+        self.assertFalse(self.is_current())
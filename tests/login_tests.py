@@ -39,6 +39,39 @@ class LoginTest(BaseTestCase):
         username = login_submit_response.pyquery('#username').text()
         self.assertEqual(username, 'bob')
 
+    def test_username_is_case_insensitive(self):
+        # Bob signs up as "Bob" and logs out.
+        self.sign_up(username='Bob', password='test123', verify='test123')
+        self.testapp.get('/logout')
+
+        # He logs in as "bob".
+        login_page = self.testapp.get('/login')
+        form = self.fill_form(login_page, username='bob', password='test123')
+        login_submit_response = form.submit().follow()
+
+        # His name is shown as he entered it at signup.
+        username = login_submit_response.pyquery('#username').text()
+        self.assertEqual(username, 'Bob')
+
+    def test_legacy_password_hash_is_replaced_on_login(self):
+        from hashutils import encrypt, needs_rehash
+        from model import User
+
+        # Bob signed up, when passwords were hashed with plain SHA-256.
+        User.create('bob', encrypt('bobtest123' + 'salt') + '|salt')
+
+        # He logs in with his password.
+        login_page = self.testapp.get('/login')
+        form = self.fill_form(login_page, username='bob', password='test123')
+        self.assertEqual(form.submit().status_int, 302)
+
+        # His password hash is upgraded, and he can still log in.
+        self.assertFalse(needs_rehash(User.by_name('bob').password_hash))
+        self.testapp.get('/logout')
+        login_page = self.testapp.get('/login')
+        form = self.fill_form(login_page, username='bob', password='test123')
+        self.assertEqual(form.submit().status_int, 302)
+
     def test_login_page_offers_to_sign_up(self):
         # Bob opens the login page.
         login_page = self.testapp.get('/login')
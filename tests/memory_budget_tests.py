@@ -0,0 +1,17 @@
+import os
+import unittest
+# Internal project imports
+from benchmarks import memory
+
+
+# Without tracemalloc the peak is reset via /proc/self/clear_refs, which is not
+# writable in some containers.
+@unittest.skipUnless(
+    memory.tracemalloc or os.access('/proc/self/clear_refs', os.W_OK),
+    'Memory can be measured on Linux or with tracemalloc only')
+class MemoryBudgetTest(unittest.TestCase):
+    def test_handlers_stay_within_memory_budgets(self):
+        # Small articles keep the test fast; budgets scale with data size.
+        results = list(memory.run(memory.HANDLERS, [5], [50000]))
+        self.assertEqual(len(results), len(memory.HANDLERS))
+        self.assertEqual(memory.over_budget(results), [])
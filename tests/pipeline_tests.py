@@ -0,0 +1,132 @@
+import unittest
+# Internal project imports
+from base import BaseTestCase
+import pipeline
+
+
+class SanitizeTest(unittest.TestCase):
+    def test_allowed_markup_is_kept(self):
+        html = (u'<h2 id="top">Kittens</h2><p>Kittens <em>purr</em>.</p>'
+                u'<img src="/_files/kittens/a.png" alt="A kitten">')
+        self.assertEqual(pipeline.sanitize(html), html)
+
+    def test_scripts_and_handlers_are_removed(self):
+        self.assertEqual(
+            pipeline.sanitize(u'<p onclick="steal()">Hi<script>steal()'
+                              u'</script></p><iframe src="/x"></iframe>'),
+            u'<p>Hi</p>')
+
+    def test_dangerous_urls_are_removed(self):
+        for url in [u'javascript:steal()', u'JavaScript:steal()',
+                    u'java\nscript:1', u'data:text/html,<script>']:
+            self.assertEqual(
+                pipeline.sanitize(u'<a href="{}">x</a>'.format(url)),
+                u'<a>x</a>', url)
+        self.assertEqual(pipeline.sanitize(u'<a href="/kittens">x</a>'),
+                         u'<a href="/kittens">x</a>')
+
+    def test_text_is_escaped_and_tags_are_closed(self):
+        self.assertEqual(
+            pipeline.sanitize(u'<div><p>1 < 2 &amp; &copy;<b>bold'),
+            u'<div><p>1 &lt; 2 &amp; &copy;<b>bold</b></p></div>')
+        self.assertEqual(pipeline.sanitize(u'</p>stray<br/>'), u'stray<br>')
+
+
+class ProcessTest(unittest.TestCase):
+    def test_external_links_are_not_followed(self):
+        self.assertEqual(
+            pipeline.process(u'<a href="http://example.com">x</a>'
+                             u'<a href="/kittens">y</a>'),
+            u'<a href="http://example.com" rel="nofollow noopener">x</a>'
+            u'<a href="/kittens">y</a>')
+
+
+class PipelineTest(BaseTestCase):
+    def test_readers_are_shown_processed_body_and_authors_the_source(self):
+        # Bob creates an article with a script in it.
+        body = u'<p>Meow!</p><script>alert("meow")</script>'
+        page = self.create_article('/kittens', body=body)
+        self.assertNotIn('alert', page.body)
+        self.assertIn('<p>Meow!</p>', page.body)
+
+        # The source is kept for editing.
+        edit_page = self.testapp.get('/_edit/kittens')
+        self.assertEqual(edit_page.form['body'].value, body)
+
+    def test_versions_of_older_pipelines_are_reprocessed(self):
+        from model import Reprocessing, Version
+
+        self.article_model.new('/kittens', 'Kittens', u'<p>Meow!</p>')
+        self.article_model.new('/puppies', 'Puppies', u'<p>Woof!</p>')
+        # Versions were stored by an older pipeline.
+        for version in Version.all():
+            version.html = u'<p>Old</p>'
+            version.pipeline_id = pipeline.PIPELINE_ID - 1
+            version.put()
+
+        # Until they are reprocessed, processing is done on view.
+        page = self.testapp.get('/kittens')
+        self.assertIn('<p>Meow!</p>', page.body)
+        self.assertNotIn('Old', page.body)
+
+        processed, finished = Reprocessing.run(batch_size=1)
+        self.assertEqual((processed, finished), (2, True))
+        for version in Version.all():
+            self.assertEqual(version.pipeline_id, pipeline.PIPELINE_ID)
+            self.assertNotIn('Old', version.html)
+
+        # Nothing is left to do, until the pipeline changes.
+        with self.assertMaxDatastoreCalls(1):
+            self.assertEqual(Reprocessing.run(), (0, True))
+
+    def test_interrupted_reprocessing_is_resumed(self):
+        from model import Reprocessing, Version
+
+        for url in ['/kittens', '/puppies', '/parrots']:
+            self.article_model.new(url, 'Pets', u'<p>Pets</p>')
+        for version in Version.all():
+            version.pipeline_id = None
+            version.put()
+
+        processed, finished = Reprocessing.run(batch_size=1, deadline=0)
+        self.assertEqual((processed, finished), (1, False))
+        self.testapp.get('/_cron/reprocess')
+        self.assertEqual(
+            [v.pipeline_id for v in Version.all()], [pipeline.PIPELINE_ID] * 3)
+
+    def test_versions_saved_meanwhile_are_not_reprocessed(self):
+        from model import Reprocessing, Version
+
+        self.article_model.new('/kittens', 'Kittens', u'<p>Meow!</p>')
+        version = Version.all().get()
+        version.pipeline_id = None
+        version.put()
+
+        # Bob saves the version again after reprocessing has fetched it.
+        saved = Version.get(version.key())
+        saved.body = u'<p>Purr!</p>'
+        saved.process()
+        saved.put()
+        self.assertFalse(Reprocessing.reprocess(version.key()))
+        self.assertEqual(Version.get(version.key()).body, u'<p>Purr!</p>')
+
+    def test_versions_waiting_for_reprocessing_are_processed_once(self):
+        from model import Version
+
+        self.article_model.new('/kittens', 'Kittens', u'<p>Meow!</p>')
+        version = Version.all().get()
+        version.pipeline_id = None
+        version.put()
+        calls = []
+        original_process = pipeline.process
+
+        def process(*args):
+            calls.append(args)
+            return original_process(*args)
+        pipeline.process = process
+        self.addCleanup(setattr, pipeline, 'process', original_process)
+
+        # Readers view the article before it is reprocessed.
+        for _ in range(3):
+            self.assertIn('<p>Meow!</p>', self.testapp.get('/kittens').body)
+        self.assertEqual(len(calls), 1)
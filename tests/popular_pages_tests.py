@@ -0,0 +1,104 @@
+# Internal project imports
+from base import BaseTestCase
+
+
+class PopularPagesTest(BaseTestCase):
+    def setUp(self):
+        super(PopularPagesTest, self).setUp()
+        import counters
+        self.counters = counters
+        self.counters.reset()
+
+    def test_views_are_not_written_on_every_hit(self):
+        # Bob signs up and creates an article. He views it several times.
+        self.create_article('/kittens')
+        for _ in range(3):
+            self.testapp.get('/kittens')
+
+        # Views are still aggregated in memory.
+        from model import PageViewCounter
+        self.assertEqual(PageViewCounter.all().count(), 0)
+
+        # Once flushed, they are stored. Redirect after article creation counts
+        # as a view too.
+        self.counters.flush()
+        self.assertEqual(sum(c.count for c in PageViewCounter.all()), 4)
+
+    def test_views_are_written_by_a_task(self):
+        from google.appengine.ext import deferred, testbed
+        from model import PageViewCounter
+
+        # Bob creates an article; views are flushed on every hit.
+        self.create_article('/kittens')
+        self.counters.FLUSH_INTERVAL = 0
+        self.addCleanup(setattr, self.counters, 'FLUSH_INTERVAL', 10)
+        self.testapp.get('/kittens')
+
+        # The page is shown before views are written.
+        self.assertEqual(PageViewCounter.all().count(), 0)
+        taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        for task in taskqueue.get_filtered_tasks():
+            deferred.run(task.payload)
+        self.assertEqual(sum(c.count for c in PageViewCounter.all()), 2)
+
+    def test_failed_flush_keeps_views(self):
+        from model import PageViewCounter
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('Task queue is down')
+        self.create_article('/kittens')
+        self.counters.FLUSH_INTERVAL = 0
+        self.addCleanup(setattr, self.counters, 'FLUSH_INTERVAL', 10)
+        original_defer = self.counters.deferred.defer
+        self.counters.deferred.defer = fail
+        self.addCleanup(setattr, self.counters.deferred, 'defer',
+                        original_defer)
+
+        # Alice still sees the page, and her view is written later.
+        self.testapp.get('/kittens')
+        self.counters.flush()
+        self.assertEqual(sum(c.count for c in PageViewCounter.all()), 2)
+
+    def test_most_viewed_articles_go_first(self):
+        # Bob signs up and creates two articles. He views the second one more
+        # often.
+        self.create_article('/kittens')
+        self.create_article('/puppies', sign_up=False)
+        for _ in range(3):
+            self.testapp.get('/puppies')
+
+        # Popular pages are recomputed by cron.
+        self.testapp.get('/_cron/popular')
+
+        # Bob opens most popular pages.
+        popular = self.testapp.get('/_popular')
+        self.assertTitleEqual(popular, 'MyWiki *** Most Popular')
+        links = popular.pyquery('.popular-page-link')
+        self.assertEqual([a.text for a in links], ['/puppies', '/kittens'])
+        counts = popular.pyquery('.view-count')
+        self.assertEqual([c.text for c in counts], ['4', '1'])
+
+    def test_interrupted_recomputation_is_resumed(self):
+        from model import (
+            PageViewCounter, PopularPages, PopularPagesComputation)
+
+        # Views of three articles are spread over several shards.
+        views = {'/kittens': 3, '/puppies': 5, '/birds': 1}
+        for _ in range(2):
+            PageViewCounter.add_views(views)
+        shards = PageViewCounter.all().count()
+
+        # The first run is out of time after a batch; nothing is published.
+        counted, finished = PopularPagesComputation.run(
+            limit=2, batch_size=1, deadline=0)
+        self.assertEqual((counted, finished), (1, False))
+        self.assertEqual(PopularPages.fetch(), [])
+
+        # The next one picks up, where the first has stopped, and keeps the
+        # most viewed articles only.
+        counted, finished = PopularPagesComputation.run(limit=2, batch_size=1)
+        self.assertEqual((counted, finished), (shards, True))
+        self.assertEqual(PopularPages.fetch(), [
+            {'url': '/puppies', 'views': 10}, {'url': '/kittens', 'views': 6}])
+        self.assertIsNone(PopularPagesComputation.get_by_key_name(
+            PopularPagesComputation.KEY_NAME))
@@ -0,0 +1,96 @@
+import marshal
+# Internal project imports
+from base import BaseTestCase
+
+
+class ProfilingTest(BaseTestCase):
+    def setUp(self):
+        super(ProfilingTest, self).setUp()
+        import profiling
+        self.profiling = profiling
+        self.secret = profiling.SECRET
+        profiling.SECRET = 'test secret'
+
+    def tearDown(self):
+        self.profiling.SECRET = self.secret
+        super(ProfilingTest, self).tearDown()
+
+    def test_signed_request_is_profiled(self):
+        # Bob signs up and creates an article.
+        self.create_article('/kittens')
+
+        # Admin requests the article with a profiling token.
+        token = self.profiling.make_token('/kittens')
+        page = self.testapp.get('/kittens', headers={'X-Profile': token})
+        self.assertIn('kittens', page.body)
+        profile_id = page.headers['X-Profile-Id']
+
+        # The profile is listed and its report can be read.
+        profiles = self.testapp.get('/_profile').json
+        self.assertEqual(profiles[0]['id'], int(profile_id))
+        self.assertEqual(profiles[0]['handler'], 'ViewPage')
+        profile = self.testapp.get('/_profile/' + profile_id)
+        self.assertIn('function calls', profile.body)
+        self.assertIn('main.py', profile.body)
+
+        # Raw pstats data is available too.
+        raw = self.testapp.get('/_profile/' + profile_id + '?format=pstats')
+        self.assertTrue(marshal.loads(raw.body))
+
+    def test_token_is_accepted_as_query_parameter(self):
+        token = self.profiling.make_token('/signup')
+        page = self.testapp.get('/signup?_profile=' + token)
+        self.assertIn('X-Profile-Id', page.headers)
+
+    def test_invalid_tokens_are_ignored(self):
+        # Token for another path.
+        token = self.profiling.make_token('/login')
+        page = self.testapp.get('/signup', headers={'X-Profile': token})
+        self.assertNotIn('X-Profile-Id', page.headers)
+
+        # Expired token.
+        token = self.profiling.make_token('/signup', lifetime=-1)
+        page = self.testapp.get('/signup', headers={'X-Profile': token})
+        self.assertNotIn('X-Profile-Id', page.headers)
+
+        # Forged signature.
+        page = self.testapp.get(
+            '/signup', headers={'X-Profile': '9999999999.abc'})
+        self.assertNotIn('X-Profile-Id', page.headers)
+
+    def test_profiling_is_disabled_without_secret(self):
+        token = self.profiling.make_token('/signup')
+        self.profiling.SECRET = None
+        page = self.testapp.get('/signup', headers={'X-Profile': token})
+        self.assertNotIn('X-Profile-Id', page.headers)
+
+    def test_missing_profile(self):
+        self.testapp.get('/_profile/12345', status=404)
+
+    def test_profile_too_big_for_an_entity_is_cut(self):
+        sizes = self.profiling.MAX_STATS_SIZE, self.profiling.MAX_REPORT_SIZE
+        self.profiling.MAX_STATS_SIZE = self.profiling.MAX_REPORT_SIZE = 100
+        self.addCleanup(setattr, self.profiling, 'MAX_STATS_SIZE', sizes[0])
+        self.addCleanup(setattr, self.profiling, 'MAX_REPORT_SIZE', sizes[1])
+
+        token = self.profiling.make_token('/signup')
+        profile_id = self.testapp.get(
+            '/signup', headers={'X-Profile': token}).headers['X-Profile-Id']
+        report = self.testapp.get('/_profile/' + profile_id).body
+        self.assertTrue(report.startswith('Raw stats of'))
+        self.assertTrue(report.endswith('[cut]'))
+        self.testapp.get('/_profile/' + profile_id + '?format=pstats',
+                         status=404)
+
+    def test_failure_to_store_profile_does_not_fail_request(self):
+        from model import RequestProfile
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('Datastore is down')
+        # Inherited put is restored by deleting the override.
+        RequestProfile.put = fail
+        self.addCleanup(delattr, RequestProfile, 'put')
+
+        token = self.profiling.make_token('/signup')
+        page = self.testapp.get('/signup', headers={'X-Profile': token})
+        self.assertNotIn('X-Profile-Id', page.headers)
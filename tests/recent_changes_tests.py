@@ -0,0 +1,86 @@
+# coding=utf-8
+# Internal project imports
+from base import BaseTestCase
+
+
+class RecentChangesPageTest(BaseTestCase):
+    def test_recent_changes_list_latest_edits_first(self):
+        # Bob signs up, creates an article and edits it.
+        self.create_article('/kittens', head='Kittens')
+        self.edit_article('/kittens', head='Cute Kittens')
+
+        # Bob opens recent changes page.
+        recent = self.testapp.get('/_recent')
+        self.assertTitleEqual(recent, 'MyWiki *** Recent Changes')
+
+        # The latest edit goes first, article creation goes next.
+        changes = recent.pyquery('#recent-changes>li')
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(
+            changes.eq(0).find('.change-article-link').text(), 'Cute Kittens')
+        self.assertIn('(new article)', changes.eq(1).text())
+
+    def test_deleted_versions_are_listed(self):
+        # Bob signs up, creates an article, edits it and deletes the first
+        # version.
+        self.create_article('/kittens')
+        self.edit_article('/kittens', head='Puppies')
+        first_version_id = self.fetch_version_ids('/kittens')[0]
+        self.testapp.get('/_delete/kittens/_version/{}'.format(
+            first_version_id))
+
+        # Deletion is on top of recent changes.
+        recent = self.testapp.get('/_recent')
+        latest = recent.pyquery('#recent-changes>li').eq(0)
+        self.assertIn('(version deleted)', latest.text())
+
+    def test_unchanged_recent_changes_are_not_sent_again(self):
+        # Bob signs up and creates an article.
+        self.create_article('/kittens')
+
+        # He opens recent changes page and receives an ETag.
+        recent = self.testapp.get('/_recent')
+        etag = recent.headers['ETag']
+
+        # Nothing has changed since then, so repeated request is answered with
+        # 304.
+        response = self.testapp.get(
+            '/_recent', headers={'If-None-Match': etag}, status=304)
+        self.assertEqual(response.body, '')
+
+        # After an edit the page is delivered again.
+        self.edit_article('/kittens', head='Puppies')
+        self.testapp.get(
+            '/_recent', headers={'If-None-Match': etag}, status=200)
+
+
+class RecentChangesFeedTest(BaseTestCase):
+    def test_feed_contains_recent_changes(self):
+        # Bob signs up and creates two articles.
+        self.create_article('/kittens', head='Kittens')
+        self.create_article('/puppies', sign_up=False, head='Puppies')
+
+        # Atom feed lists both of them, the latest first.
+        feed = self.testapp.get('/_recent.atom')
+        self.assertEqual(feed.content_type, 'application/atom+xml')
+        titles = [e.text for e in feed.xml.findall(
+            '{http://www.w3.org/2005/Atom}entry/'
+            '{http://www.w3.org/2005/Atom}title')]
+        self.assertEqual(
+            titles, ['Puppies (new article)', 'Kittens (new article)'])
+
+    def test_feed_supports_etag(self):
+        feed = self.testapp.get('/_recent.atom')
+        self.testapp.get('/_recent.atom',
+                         headers={'If-None-Match': feed.headers['ETag']},
+                         status=304)
+
+    def test_empty_feed_has_update_time(self):
+        # Nothing has been changed yet, still the feed tells, when it was
+        # updated, as Atom requires.
+        feed = self.testapp.get('/_recent.atom')
+        self.assertEqual(
+            feed.xml.findall('{http://www.w3.org/2005/Atom}entry'), [])
+        self.assertEqual(
+            feed.xml.find('{http://www.w3.org/2005/Atom}updated').text,
+            '1970-01-01T00:00:00Z')
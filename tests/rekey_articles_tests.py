@@ -0,0 +1,65 @@
+# Internal project imports
+from base import BaseTestCase
+
+
+class RekeyArticlesTest(BaseTestCase):
+    def create_unkeyed_article(self, url, body):
+        from model import Article, Version, global_parent
+
+        article = Article(url=url, parent=global_parent())
+        article.put()
+        version = Version(article=article, head='Kittens', body=body,
+                          parent=global_parent())
+        version.process()
+        version.put()
+        article.first_version = article.latest_version = version
+        article.put()
+        return article
+
+    def test_articles_stored_by_id_are_moved_to_url_keys(self):
+        from model import Article, Attachment, Version
+        from tools.rekey_articles import rekey_articles
+
+        # Bob created an article and attached a file to it, before articles
+        # were keyed by url.
+        self.sign_up()
+        old = self.create_unkeyed_article('/kittens', u'<p>Meow!</p>')
+        self.assertIn('Meow!', self.testapp.get('/kittens').body)
+        upload = self.testapp.post('/_files/kittens/notes.txt').json
+        self.testapp.post(
+            '/_files/kittens/notes.txt?upload={}&offset=0'.format(
+                upload['upload']),
+            'Purr', content_type='application/octet-stream')
+        self.testapp.post('/_files/kittens/notes.txt?upload={}&finish=1'
+                          .format(upload['upload']))
+        # He edits it once more.
+        self.edit_article('/kittens', body=u'<p>Purr!</p>')
+        self.article_model.new('/puppies', 'Puppies', u'<p>Other</p>')
+        self.create_unkeyed_article('/puppies', u'<p>Woof!</p>')
+
+        moved, conflicts = rekey_articles()
+        self.assertEqual(moved, ['/kittens'])
+        self.assertEqual(conflicts, ['/puppies'])
+        self.assertIsNone(Article.get(old.key()))
+
+        # The article keeps its history and its file.
+        article = Article.get_by_key_name('/kittens', parent=old.parent_key())
+        self.assertEqual(Version.all().filter('article =', old).count(), 0)
+        self.assertEqual(article.all_versions().count(), 2)
+        self.assertIn('Purr!', self.testapp.get('/kittens').body)
+        self.assertEqual(Attachment.by_name('/kittens', 'notes.txt').size, 4)
+        self.assertEqual(Article.index_page()[0], ['/kittens', '/puppies'])
+
+        # Running again has nothing to move.
+        self.assertEqual(rekey_articles(), ([], ['/puppies']))
+
+    def test_urls_too_long_for_keys_are_rejected(self):
+        from model import MAX_KEY_NAME_BYTES
+
+        self.sign_up()
+        url = '/' + 'a' * MAX_KEY_NAME_BYTES
+        self.testapp.get('/_edit' + url, status=400)
+        self.testapp.post('/_edit' + url, {'head': 'A', 'body': ''},
+                          status=400)
+        with self.assertRaises(ValueError):
+            self.article_model.new(url, 'A', u'')
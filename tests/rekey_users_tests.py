@@ -0,0 +1,66 @@
+# Internal project imports
+from base import BaseTestCase
+
+
+class RekeyUsersTest(BaseTestCase):
+    def test_users_stored_by_id_are_moved_to_named_keys(self):
+        from hashutils import make_hash
+        from model import Session, User, global_parent
+        from tools.rekey_users import rekey_users
+
+        # Bob and BOB signed up, before users were keyed by name; Bob has a
+        # session.
+        bob = User(name='Bob', password_hash=make_hash('Bob' + 'test123'),
+                   parent=global_parent())
+        bob.put()
+        Session(sid='abc', user=bob, parent=global_parent()).put()
+        User(name='BOB', password_hash=make_hash('BOB' + 'test456'),
+             parent=global_parent()).put()
+
+        moved, conflicts = rekey_users()
+        self.assertEqual(moved, ['Bob'])
+        self.assertEqual(conflicts, ['BOB'])
+
+        # Bob's session belongs to the moved user, and he can log in.
+        session = Session.by_prop('sid', 'abc')
+        self.assertEqual(session.user.key(), User.by_name('bob').key())
+        login_page = self.testapp.get('/login')
+        form = self.fill_form(login_page, username='bob', password='test123')
+        self.assertEqual(form.submit().status_int, 302)
+
+    def test_users_are_found_before_they_are_moved(self):
+        from google.appengine.api import datastore
+        from hashutils import make_hash
+        from model import User, global_parent
+
+        # Names of such users are indexed.
+        entity = datastore.Entity('User', parent=global_parent())
+        entity.update(
+            {'name': 'Bob', 'password_hash': make_hash('Bob' + 'test123')})
+        datastore.Put(entity)
+
+        # Bob can log in, and nobody can take his name.
+        login_page = self.testapp.get('/login')
+        form = self.fill_form(login_page, username='Bob', password='test123')
+        self.assertEqual(form.submit().status_int, 302)
+        self.testapp.get('/logout')
+        self.assertIsNone(User.create('Bob', make_hash('Bob' + 'other')))
+
+    def test_interrupted_move_is_completed(self):
+        from hashutils import make_hash
+        from model import User, Version, global_parent
+        from tools.rekey_users import rekey_users
+
+        # Bob edited an article, before users were keyed by name.
+        bob = User(name='Bob', password_hash=make_hash('Bob' + 'test123'),
+                   parent=global_parent())
+        bob.put()
+        self.article_model.new('/kittens', 'Kittens', u'', author=bob)
+        # A run was interrupted after the keyed user had been created.
+        User(key_name='bob', name='Bob', password_hash=bob.password_hash,
+             parent=global_parent()).put()
+
+        self.assertEqual(rekey_users(), (['Bob'], []))
+        version = Version.all().get()
+        self.assertEqual(version.author.key().name(), 'bob')
+        self.assertIsNone(User.get(bob.key()))
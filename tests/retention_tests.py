@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import unittest
+# Internal project imports
+from base import BaseTestCase
+from retention import RetentionPolicy
+
+NOW = datetime(2015, 6, 30, 12)
+
+
+def hours_ago(*hours):
+    return [('v{0}'.format(h), NOW - timedelta(hours=h)) for h in hours]
+
+
+class RetentionPolicyTest(unittest.TestCase):
+    def test_latest_versions_are_kept(self):
+        policy = RetentionPolicy(3)
+        versions = hours_ago(1, 2, 3, 4, 5)
+        deleted = list(policy.deletions(versions, 'v5', NOW))
+        # The first version is kept too.
+        self.assertEqual(deleted, ['v4'])
+
+    def test_older_versions_are_thinned_to_daily_and_weekly_checkpoints(self):
+        policy = RetentionPolicy(1, daily_days=3, weekly_weeks=4)
+        versions = hours_ago(
+            1,            # kept as one of the latest
+            2,            # same day as the latest
+            30, 31,       # yesterday, latest kept
+            24 * 10,      # 10 days ago, one per week
+            24 * 11,
+            24 * 20,
+            24 * 60,      # older than 4 weeks
+            24 * 70)      # the first one
+        deleted = list(policy.deletions(versions, 'v1680', NOW))
+        self.assertEqual(deleted, ['v2', 'v31', 'v264', 'v1440'])
+
+    def test_policy_is_parsed_from_string(self):
+        policy = RetentionPolicy.parse('100,30,52')
+        self.assertEqual(
+            (policy.keep_last, policy.daily_days, policy.weekly_weeks),
+            (100, 30, 52))
+        self.assertEqual(str(RetentionPolicy.parse('10')), '10,0,0')
+        for value in ('', 'a,b', '0', '10,-1'):
+            self.assertRaises(ValueError, RetentionPolicy.parse, value)
+
+
+class HistoryCompactionTest(BaseTestCase):
+    def create_history(self, url, count, retention_policy=None):
+        self.article_model.new(url, 'Head', '<p>0</p>')
+        article = self.article_model.by_url(url, project_with_version=False)
+        for i in range(1, count):
+            article.new_version('Head', '<p>{0}</p>'.format(i))
+        # Versions were created daily.
+        versions = sorted(article.version_set, key=lambda v: v.id)
+        start = datetime.now() - timedelta(days=count)
+        for i, version in enumerate(versions):
+            version.created = start + timedelta(days=i)
+            version.put()
+        if retention_policy is not None:
+            article.retention_policy = retention_policy
+            article.put()
+        return [v.id for v in versions]
+
+    def test_versions_are_deleted_according_to_policy(self):
+        from model import HistoryCompaction
+
+        version_ids = self.create_history('/kittens', 10)
+        article = self.article_model.by_url(
+            '/kittens', project_with_version=False)
+        deleted = HistoryCompaction.compact(
+            article, RetentionPolicy(3), batch_size=2)
+        self.assertEqual(deleted, 6)
+
+        # The first one and three latest versions remain, and the article
+        # still points to them.
+        self.assertEqual(self.fetch_version_ids('/kittens'),
+                         [version_ids[0]] + version_ids[-3:])
+        article = self.article_model.by_url('/kittens')
+        self.assertEqual(article.first_version.id, version_ids[0])
+        self.assertEqual(article.latest_version.id, version_ids[-1])
+
+        # Bob can still view the article and its history.
+        self.testapp.get('/kittens')
+        history = self.testapp.get('/_history/kittens')
+        self.assertEqual(len(history.pyquery('#versions li')), 4)
+
+    def test_cron_job_applies_per_article_policies(self):
+        from model import HistoryCompaction
+
+        kittens = self.create_history('/kittens', 6, retention_policy='2')
+        puppies = self.create_history('/puppies', 6)
+
+        # Without a wiki-wide policy all versions of /puppies are kept.
+        self.testapp.get('/_cron/compact')
+        self.assertEqual(self.fetch_version_ids('/kittens'),
+                         [kittens[0]] + kittens[-2:])
+        self.assertEqual(self.fetch_version_ids('/puppies'), puppies)
+        self.assertIsNone(HistoryCompaction.get_by_key_name('checkpoint'))
+
+    def test_compaction_stops_after_the_article_past_the_deadline(self):
+        from model import HistoryCompaction
+
+        for url in ['/kittens', '/parrots', '/puppies']:
+            self.create_history(url, 4, retention_policy='1')
+
+        # The deadline has passed after the first article of a batch.
+        deleted, finished = HistoryCompaction.run(deadline=0)
+        self.assertEqual((deleted, finished), (2, False))
+        self.assertEqual(len(self.fetch_version_ids('/kittens')), 2)
+        self.assertEqual(len(self.fetch_version_ids('/parrots')), 4)
+
+        # The next run goes on from the next article.
+        self.assertEqual(HistoryCompaction.run(), (6, True))
+        for url in ['/kittens', '/parrots', '/puppies']:
+            self.assertEqual(len(self.fetch_version_ids(url)), 2)
@@ -0,0 +1,64 @@
+import re
+import unittest
+# Internal project imports
+from routing import ArticleRoute
+
+# Routes, that ArticleRoute replaces; it must produce the same results.
+ARTICLE_RE = r'((?:/[a-zA-Z0-9_-]*)+?)/?'
+REFERENCE_ROUTES = [
+    (r'/_delete' + ARTICLE_RE + r'_version/' + r'(\d+)', 'delete'),
+    (r'/_edit' + ARTICLE_RE + r'_version/' + r'(\d+)', 'edit'),
+    (r'/_edit' + ARTICLE_RE, 'edit'),
+    (r'/_history' + ARTICLE_RE, 'history'),
+    (ARTICLE_RE + r'_version/' + r'(\d+)', 'view'),
+    (ARTICLE_RE, 'view')
+]
+
+
+def reference_match(path):
+    for regex, target in REFERENCE_ROUTES:
+        match = re.match('^' + regex + '$', path)
+        if match:
+            return target, match.groups()
+
+
+class ArticleRouteTest(unittest.TestCase):
+    def setUp(self):
+        self.route = ArticleRoute(
+            view='view', edit='edit', history='history', delete='delete')
+
+    def assertMatchesReference(self, path):
+        self.assertEqual(
+            self.route.match_path(path), reference_match(path), path)
+
+    def test_same_results_as_regexp_routes(self):
+        paths = [
+            '/', '//', '/kittens', '/kittens/', '/kittens//', '/a/b/c',
+            '/a-b/c_d', '/_version/5', '/kittens/_version/5',
+            '/kittens_version/5', '/kittens/_version/', '/kittens/_version/x',
+            '/kittens/_version/5/', '/a/_version/1/_version/2',
+            '/a__version/3', '/_edit', '/_edit/', '/_edit/kittens',
+            '/_edit/kittens/', '/_edit/_version/3', '/_edit/kittens/_version/3',
+            '/_editkittens', '/_history', '/_history/', '/_history/kittens',
+            '/_history/kittens/_version/3', '/_delete/kittens',
+            '/_delete/kittens/_version/3', '/_delete/_version/3',
+            '/_delete/kittens/_version/', '/kit tens', '/kittens!',
+            'kittens', '', '/_edit/kit.tens', '/' + 'a/' * 50 + '_version/7',
+        ]
+        for path in paths:
+            self.assertMatchesReference(path)
+
+    def test_returns_route_of_matched_handler(self):
+        class Request(object):
+            path = '/_history/kittens'
+
+        route, args, kwargs = self.route.match(Request())
+        self.assertEqual(route.handler, 'history')
+        self.assertEqual(args, ('/kittens',))
+        self.assertEqual(kwargs, {})
+
+    def test_non_article_paths_do_not_match(self):
+        class Request(object):
+            path = '/kittens.html'
+
+        self.assertIsNone(self.route.match(Request()))
@@ -0,0 +1,83 @@
+# Internal project imports
+from base import BaseTestCase
+
+
+# Maximum number of datastore RPCs per request. Counts don't depend on the
+# number of versions or links, so N+1 regressions break these budgets.
+VIEW_BUDGET = 8
+VERSIONED_VIEW_BUDGET = 8
+HISTORY_BUDGET = 8
+EDIT_FORM_BUDGET = 5
+EDIT_BUDGET = 11
+# Includes queries for users, that are not yet keyed by name.
+SIGNUP_BUDGET = 8
+LOGIN_BUDGET = 2
+DELETE_BUDGET = 12
+
+
+class DatastoreBudgetTest(BaseTestCase):
+    def setUp(self):
+        super(DatastoreBudgetTest, self).setUp()
+        # Pending page views must not be flushed inside a measured request.
+        import counters
+        counters.reset()
+
+    def create_article_with_versions(self, url, count=5):
+        self.create_article(url, body='<p><a href="/cats">Cats</a></p>')
+        for i in range(count - 1):
+            self.edit_article(url, body='<p><a href="/dogs_{0}">Dogs</a></p>'
+                              .format(i))
+
+    def test_view(self):
+        # Bob creates an article with several versions and views it.
+        self.create_article_with_versions('/kittens')
+        self.testapp.get('/kittens')
+        with self.assertMaxDatastoreCalls(VIEW_BUDGET):
+            self.testapp.get('/kittens')
+
+    def test_versioned_view(self):
+        self.create_article_with_versions('/kittens')
+        version_id = self.fetch_version_ids('/kittens')[1]
+        url = '/kittens/_version/{0}'.format(version_id)
+        with self.assertMaxDatastoreCalls(VERSIONED_VIEW_BUDGET):
+            self.testapp.get(url)
+
+    def test_history(self):
+        self.create_article_with_versions('/kittens', count=10)
+        with self.assertMaxDatastoreCalls(HISTORY_BUDGET):
+            self.testapp.get('/_history/kittens')
+
+    def test_edit(self):
+        self.create_article_with_versions('/kittens')
+        with self.assertMaxDatastoreCalls(EDIT_FORM_BUDGET):
+            edit_page = self.testapp.get('/_edit/kittens')
+        form = self.fill_form(edit_page, body='<p>Kittens are cute.</p>')
+        with self.assertMaxDatastoreCalls(EDIT_BUDGET):
+            form.submit()
+
+    def test_signup(self):
+        signup_page = self.testapp.get('/signup')
+        form = self.fill_form(
+            signup_page, username='bob', password='test123', verify='test123')
+        with self.assertMaxDatastoreCalls(SIGNUP_BUDGET):
+            form.submit()
+
+    def test_login(self):
+        self.sign_up()
+        self.testapp.get('/logout')
+        login_page = self.testapp.get('/login')
+        form = self.fill_form(login_page, username='bob', password='test123')
+        with self.assertMaxDatastoreCalls(LOGIN_BUDGET):
+            form.submit()
+
+    def test_delete(self):
+        self.create_article_with_versions('/kittens')
+        version_id = self.fetch_version_ids('/kittens')[2]
+        url = '/_delete/kittens/_version/{0}'.format(version_id)
+        with self.assertMaxDatastoreCalls(DELETE_BUDGET):
+            self.testapp.get(url)
+
+    def test_budget_violation_fails(self):
+        with self.assertRaises(AssertionError):
+            with self.assertMaxDatastoreCalls(0):
+                self.sign_up()
@@ -0,0 +1,89 @@
+import unittest
+# Internal project imports
+from base import BaseTestCase
+from sections import SectionConflict, merge_section, split_sections
+
+BODY = (u'<p>Intro</p>\n'
+        u'<h2>Black</h2>\n<p>Black kittens</p>\n'
+        u'<H2 id="white">White</H2>\n<p>White kittens</p>\n')
+
+
+class SplitSectionsTest(unittest.TestCase):
+    def test_body_is_split_at_headings(self):
+        sections = split_sections(BODY)
+        self.assertEqual(sections, [
+            u'<p>Intro</p>\n',
+            u'<h2>Black</h2>\n<p>Black kittens</p>\n',
+            u'<H2 id="white">White</H2>\n<p>White kittens</p>\n'])
+        self.assertEqual(u''.join(sections), BODY)
+
+    def test_body_starting_with_heading_has_empty_first_section(self):
+        self.assertEqual(split_sections(u'<h1>A</h1><p>a</p>'),
+                         [u'', u'<h1>A</h1><p>a</p>'])
+        self.assertEqual(split_sections(u''), [u''])
+
+    def test_section_is_merged_into_changed_body(self):
+        latest = BODY.replace(u'Intro', u'Introduction')
+        merged = merge_section(BODY, latest, 2, u'<h2>White</h2>\n')
+        self.assertEqual(merged, u'<p>Introduction</p>\n'
+                                 u'<h2>Black</h2>\n<p>Black kittens</p>\n'
+                                 u'<h2>White</h2>\n')
+
+    def test_changed_section_conflicts(self):
+        latest = BODY.replace(u'Black kittens', u'Dark kittens')
+        self.assertRaises(SectionConflict, merge_section,
+                          BODY, latest, 1, u'<h2>Black</h2>\n')
+        self.assertRaises(SectionConflict, merge_section,
+                          BODY, u'<p>Intro</p>', 1, u'<h2>Black</h2>\n')
+
+
+class SectionEditTest(BaseTestCase):
+    def setUp(self):
+        super(SectionEditTest, self).setUp()
+        self.create_article('/kittens', head='Kittens', body=BODY)
+
+    def test_only_the_section_is_edited(self):
+        # Bob opens the second section of the article for editing.
+        edit_page = self.testapp.get('/_edit/kittens?section=1')
+        self.assertEqual(edit_page.form['body'].value,
+                         u'<h2>Black</h2>\n<p>Black kittens</p>\n')
+
+        # He changes it and saves the article; the rest stays intact.
+        edit_page.form['body'] = u'<h2>Black</h2>\n<p>Cute kittens</p>\n'
+        page = edit_page.form.submit().follow()
+        self.assertIn('Cute kittens', page.pyquery('#wiki-body').text())
+        self.assertIn('White kittens', page.pyquery('#wiki-body').text())
+        self.assertEqual(len(self.fetch_version_ids('/kittens')), 2)
+
+    def test_edit_of_another_section_is_merged(self):
+        # Bob opens the second section; meanwhile the third one is changed.
+        edit_page = self.testapp.get('/_edit/kittens?section=1')
+        self.edit_article('/kittens', body=BODY.replace('White', 'Snowy'))
+
+        edit_page.form['body'] = u'<h2>Black</h2>\n<p>Cute kittens</p>\n'
+        page = edit_page.form.submit().follow()
+        text = page.pyquery('#wiki-body').text()
+        self.assertIn('Cute kittens', text)
+        self.assertIn('Snowy kittens', text)
+
+    def test_concurrent_edit_of_the_same_section_conflicts(self):
+        # Bob opens the second section; meanwhile it is changed.
+        edit_page = self.testapp.get('/_edit/kittens?section=1')
+        self.edit_article(
+            '/kittens', body=BODY.replace('Black kittens', 'Dark kittens'))
+
+        # His save is rejected.
+        edit_page.form['body'] = u'<h2>Black</h2>\n<p>Cute kittens</p>\n'
+        response = edit_page.form.submit()
+        self.assertEqual(response.status_int, 200)
+        self.assertIn('changed by somebody else',
+                      response.pyquery('.form-errors').text())
+        self.assertEqual(len(self.fetch_version_ids('/kittens')), 2)
+
+        # Saving again replaces the section.
+        page = response.form.submit().follow()
+        self.assertIn('Cute kittens', page.pyquery('#wiki-body').text())
+
+    def test_bad_section_numbers(self):
+        self.testapp.get('/_edit/kittens?section=3', status=404)
+        self.testapp.get('/_edit/kittens?section=x', status=400)
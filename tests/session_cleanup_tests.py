@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+# Third-party imports
+from google.appengine.api import datastore
+# Internal project imports
+from base import BaseTestCase
+
+
+class SessionCleanupTest(BaseTestCase):
+    def setUp(self):
+        super(SessionCleanupTest, self).setUp()
+        from model import Session, SessionCleanup, User, global_parent
+        self.session_model = Session
+        self.cleanup = SessionCleanup
+        self.user = User.create('bob', 'hash')
+        self.parent = global_parent()
+
+    def add_sessions(self, count, age_days, legacy=False):
+        created = datetime.now() - timedelta(days=age_days)
+        for i in range(count):
+            session = self.session_model(
+                sid='{0}-{1}-{2}'.format(age_days, legacy, i), user=self.user,
+                created=created, parent=self.parent)
+            session.put()
+            if legacy:
+                # Sessions, stored before expiry time was recorded.
+                entity = datastore.Get(session.key())
+                del entity['expires']
+                datastore.Put(entity)
+
+    def sids(self):
+        return sorted(s.sid for s in self.session_model.all())
+
+    def test_only_expired_sessions_are_deleted(self):
+        self.add_sessions(3, age_days=0)
+        self.add_sessions(4, age_days=3)
+        self.add_sessions(2, age_days=0, legacy=True)
+        self.add_sessions(2, age_days=3, legacy=True)
+        fresh = ['0-False-0', '0-False-1', '0-False-2', '0-True-0', '0-True-1']
+
+        deleted, finished = self.cleanup.run(batch_size=3)
+        self.assertEqual((deleted, finished), (6, True))
+        self.assertEqual(self.sids(), fresh)
+        self.assertIsNone(self.cleanup.get_by_key_name('checkpoint'))
+
+    def test_interrupted_run_is_resumed(self):
+        self.add_sessions(5, age_days=3)
+
+        # The first run is stopped after one batch.
+        deleted, finished = self.cleanup.run(batch_size=2, deadline=0)
+        self.assertEqual((deleted, finished), (2, False))
+        self.assertEqual(len(self.sids()), 3)
+
+        # The next one continues from the checkpoint.
+        deleted, finished = self.cleanup.run(batch_size=2)
+        self.assertEqual((deleted, finished), (5, True))
+        self.assertEqual(self.sids(), [])
+
+    def test_sessions_expire_after_their_lifetime(self):
+        self.add_sessions(1, age_days=1)
+        self.add_sessions(1, age_days=3, legacy=True)
+        fresh, legacy = self.session_model.all().order('created').fetch(2)[::-1]
+        self.assertFalse(fresh.has_expired())
+        self.assertTrue(legacy.has_expired())
+
+    def test_cron_job_deletes_expired_sessions(self):
+        # Alice signs up; an old session of Bob has expired.
+        self.sign_up(username='alice', password='test123', verify='test123')
+        self.add_sessions(1, age_days=3)
+
+        self.testapp.get('/_cron/sessions')
+        self.assertEqual(self.session_model.all().count(), 1)
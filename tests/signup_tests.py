@@ -180,6 +180,28 @@ class UsernameValidationTest(BaseTestCase):
         form = signup_submit_response.form
         self.assertEqual(form['username'].value, 'bob')
 
+    def test_usernames_differing_only_in_case_are_the_same(self):
+        # Bob signs up as "bob" and logs out.
+        self.sign_up()
+        self.testapp.get('/logout')
+
+        # Somebody tries to sign up as "Bob".
+        signup_page = self.testapp.get('/signup')
+        form = self.fill_form(
+            signup_page, username='Bob', password='test456', verify='test456')
+        signup_submit_response = form.submit()
+
+        # The name is taken.
+        self.assertHasFormError(
+            signup_submit_response, 'User "Bob" already exists!')
+
+    def test_user_is_not_created_twice_if_name_is_taken_after_validation(self):
+        from model import User
+
+        self.assertIsNotNone(User.create('bob', 'hash'))
+        self.assertIsNone(User.create('BOB', 'other hash'))
+        self.assertEqual(User.by_name('Bob').password_hash, 'hash')
+
 
 class PasswordValidationTest(BaseTestCase):
     def test_can_not_create_user_without_password(self):
@@ -0,0 +1,76 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+# Internal project imports
+from base import BaseTestCase
+
+
+class SnapshotTest(BaseTestCase):
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        from tools.snapshot import snapshot
+        self.snapshot = snapshot
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        super(SnapshotTest, self).tearDown()
+
+    def read(self, path):
+        with open(os.path.join(self.output_dir, path)) as f:
+            return f.read().decode('utf-8')
+
+    def test_every_article_is_rendered_into_a_file(self):
+        # Bob signs up and creates two articles, one of them links to a
+        # missing one.
+        self.create_article('/kittens', head='Kittens')
+        self.create_article('/kittens/black', sign_up=False,
+                            body='<a href="/puppies">Puppies</a>')
+
+        rendered = self.snapshot(self.output_dir, processes=2)
+
+        self.assertItemsEqual(rendered, ['/kittens', '/kittens/black'])
+        kittens = self.read('kittens/index.html')
+        self.assertIn(u'<title>MyWiki — Kittens</title>', kittens)
+        black = self.read('kittens/black/index.html')
+        self.assertIn('class="missing-link"', black)
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.output_dir, 'stylesheets', 'wiki_styles.css')))
+
+    def test_incremental_snapshot_renders_only_changed_articles(self):
+        # Bob signs up and creates two articles. A snapshot is taken.
+        self.create_article('/kittens')
+        self.create_article('/puppies', sign_up=False)
+        self.snapshot(self.output_dir, processes=1)
+
+        # Nothing changed, so nothing is rendered.
+        self.assertEqual(
+            self.snapshot(self.output_dir, incremental=True, processes=1), [])
+
+        # Bob edits one of the articles; only it is rendered again.
+        self.edit_article('/puppies', head='Dogs')
+        rendered = self.snapshot(
+            self.output_dir, incremental=True, processes=1)
+        self.assertEqual(rendered, ['/puppies'])
+        self.assertIn('<title>MyWiki — Dogs</title>',
+                      self.read('puppies/index.html').encode('utf-8'))
+
+    def test_overwritten_version_is_rendered_again(self):
+        import model
+
+        window, model.EDIT_COALESCE_WINDOW = model.EDIT_COALESCE_WINDOW, 60
+        try:
+            # Bob creates an article; a snapshot is taken. He saves the
+            # article again right away, which overwrites its only version.
+            self.create_article('/kittens')
+            self.snapshot(self.output_dir, processes=1)
+            self.edit_article('/kittens', head='Cats')
+        finally:
+            model.EDIT_COALESCE_WINDOW = window
+
+        rendered = self.snapshot(
+            self.output_dir, incremental=True, processes=1)
+        self.assertEqual(rendered, ['/kittens'])
+        self.assertIn('<title>MyWiki — Cats</title>',
+                      self.read('kittens/index.html').encode('utf-8'))
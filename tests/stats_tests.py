@@ -0,0 +1,53 @@
+# Internal project imports
+from base import BaseTestCase
+
+
+class StatsTest(BaseTestCase):
+    def setUp(self):
+        super(StatsTest, self).setUp()
+        import perfstats
+        self.perfstats = perfstats
+        self.sample_rate = perfstats.SAMPLE_RATE
+        perfstats.SAMPLE_RATE = 1
+        perfstats.reset()
+
+    def tearDown(self):
+        self.perfstats.SAMPLE_RATE = self.sample_rate
+        super(StatsTest, self).tearDown()
+
+    def test_requests_are_recorded_per_handler(self):
+        # Bob signs up, creates an article and views it twice.
+        self.create_article('/kittens')
+        self.testapp.get('/kittens')
+        page = self.testapp.get('/kittens')
+
+        # Admin opens the statistics.
+        stats = self.testapp.get('/_stats').json['handlers']
+        view = stats['ViewPage']
+        # Redirect after article creation is a view too.
+        self.assertEqual(view['wall_ms']['count'], 3)
+        self.assertGreater(view['rpc_count']['max'], 0)
+        self.assertGreater(view['render_ms']['max'], 0)
+        self.assertEqual(view['response_bytes']['max'], len(page.body))
+        self.assertIn('SignupPage', stats)
+        self.assertIn('EditPage', stats)
+
+    def test_unsampled_requests_are_not_recorded(self):
+        self.perfstats.SAMPLE_RATE = 0
+        self.testapp.get('/signup')
+        self.assertEqual(self.perfstats.summary(), {})
+
+
+class HistogramTest(BaseTestCase):
+    def test_percentiles(self):
+        from perfstats import Histogram
+
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.add(value)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['max'], 100)
+        self.assertAlmostEqual(summary['mean'], 50.5)
+        for p in (50, 95, 99):
+            self.assertLessEqual(abs(summary['p%d' % p] - p) / p, 0.2)
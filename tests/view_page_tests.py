@@ -280,4 +280,78 @@ class VersionsTest(BaseTestCase):
             '/vita_nostra_brevis_est/_version/{}'.format(fake_version_id))
 
         # Current version is delivered to him.
-        self.assertTitleEqual(response, u'MyWiki — Brevi Finietur')
\ No newline at end of file
+        self.assertTitleEqual(response, u'MyWiki — Brevi Finietur')
+
+
+class LinkAnnotationTest(BaseTestCase):
+    def test_links_to_existing_and_missing_articles_are_distinguished(self):
+        # Bob signs up and creates an article about cats.
+        self.create_article('/cats')
+
+        # Then he creates an article, that links both to cats and dogs.
+        # There's no article about dogs yet.
+        article = self.create_article(
+            '/pets', sign_up=False,
+            body='<a href="/cats">Cats</a> and <a href="/dogs/">dogs</a>. '
+                 '<a href="http://example.com/cats">External</a>')
+
+        # Link to cats is marked as an existing internal link, link to dogs is
+        # marked as missing. External link stays untouched.
+        self.assertEqual(
+            article.pyquery('#wiki-body a[href="/cats"]').attr('class'),
+            'internal-link')
+        self.assertEqual(
+            article.pyquery('#wiki-body a[href="/dogs/"]').attr('class'),
+            'missing-link')
+        self.assertIsNone(
+            article.pyquery('#wiki-body a[href^="http"]').attr('class'))
+
+    def test_link_becomes_existing_when_linked_article_is_created(self):
+        # Bob signs up and creates an article, that links to a missing one.
+        article = self.create_article(
+            '/pets', body='<a class="animal" href="/dogs">Dogs</a>')
+        link = article.pyquery('#wiki-body a')
+        self.assertEqual(link.attr('class'), 'animal missing-link')
+
+        # Bob creates the missing article.
+        self.create_article('/dogs', sign_up=False)
+
+        # Link to the new article is not marked as missing anymore.
+        article = self.testapp.get('/pets')
+        link = article.pyquery('#wiki-body a')
+        self.assertEqual(link.attr('class'), 'animal internal-link')
+
+    def test_links_to_service_pages_are_not_annotated(self):
+        # Bob signs up and creates an article, that links to login page and
+        # to the history of the homepage.
+        article = self.create_article(
+            '/help',
+            body='<a href="/login">Sign in</a> <a href="/_history/">History</a>')
+
+        # None of the links is annotated.
+        for link in article.pyquery('#wiki-body a').items():
+            self.assertIsNone(link.attr('class'))
+
+    def test_links_are_checked_in_batches(self):
+        import model
+
+        batch_size = model.LINK_CHECK_BATCH_SIZE
+        model.LINK_CHECK_BATCH_SIZE = 2
+        self.addCleanup(setattr, model, 'LINK_CHECK_BATCH_SIZE', batch_size)
+
+        # Bob signs up and creates an article, that links to more articles,
+        # than are checked at once; only the last of them exists.
+        self.create_article('/fish')
+        article = self.create_article(
+            '/pets', sign_up=False,
+            body=''.join('<a href="/{}">{}</a>'.format(url, url) for url in
+                         ['cats', 'dogs', 'birds', 'fish']))
+
+        classes = [link.attr('class')
+                   for link in article.pyquery('#wiki-body a').items()]
+        self.assertEqual(classes, ['missing-link'] * 3 + ['internal-link'])
+
+        # Creating any of the missing articles updates the links to it.
+        self.create_article('/birds', sign_up=False)
+        link = self.testapp.get('/pets').pyquery('#wiki-body a[href="/birds"]')
+        self.assertEqual(link.attr('class'), 'internal-link')
@@ -0,0 +1,16 @@
+# Internal project imports
+from base import BaseTestCase
+
+
+class WarmupTest(BaseTestCase):
+    def test_warmup_preloads_templates(self):
+        import jinjacfg
+
+        response = self.testapp.get('/_ah/warmup')
+        self.assertEqual(response.status_int, 200)
+
+        # All templates are loaded into environment's cache.
+        cache = jinjacfg.get_environment().cache
+        for name in ['wiki/view_page.html', 'wiki/history.html',
+                     'auth/signup.html']:
+            self.assertIn(name, cache)
@@ -0,0 +1,145 @@
+import unittest
+# Internal project imports
+from base import BaseTestCase
+from wikimarkup import split_blocks, to_html, wiki_url
+
+
+class WikiMarkupTest(unittest.TestCase):
+    def test_blocks(self):
+        source = u'\n'.join([
+            u'# Kittens', u'Kittens *purr*', u'and **sleep**.', u'',
+            u'- one', u'- two', u'', u'1. first', u'2. second', u'',
+            u'> Meow', u'', u'```', u'<b>', u'', u'```', u'---'])
+        self.assertEqual(to_html(source), u'\n'.join([
+            u'<h1>Kittens</h1>',
+            u'<p>Kittens <em>purr</em>\nand <strong>sleep</strong>.</p>',
+            u'<ul><li>one</li><li>two</li></ul>',
+            u'<ol><li>first</li><li>second</li></ol>',
+            u'<blockquote><p>Meow</p></blockquote>',
+            u'<pre><code>&lt;b&gt;\n</code></pre>',
+            u'<hr>']))
+
+    def test_inline_markup(self):
+        self.assertEqual(
+            to_html(u'See [[Kitten Care]], [[pets/dogs|dogs]], '
+                    u'[docs](http://example.com) and `**a** <b>`'),
+            u'<p>See <a href="/Kitten_Care">Kitten Care</a>, '
+            u'<a href="/pets/dogs">dogs</a>, '
+            u'<a href="http://example.com">docs</a> and '
+            u'<code>**a** &lt;b&gt;</code></p>')
+
+    def test_wiki_urls_mirror_heads_of_new_articles(self):
+        from main import EditPage
+
+        for title in [u'Kitten Care', u'Kittens']:
+            self.assertEqual(
+                EditPage.form_head_from_path(wiki_url(title)), title)
+        self.assertEqual(wiki_url(u'What? Kittens!'), u'/What_Kittens')
+
+    def test_headings_and_fenced_code_are_separate_blocks(self):
+        self.assertEqual(
+            split_blocks(u'Intro\n## Part\nText\n\n```\na\n\nb\n```\nEnd'),
+            [u'Intro', u'## Part', u'Text', u'```\na\n\nb\n```', u'End'])
+        self.assertEqual(split_blocks(u'```python\nx = 1\n```\nEnd'),
+                         [u'```python\nx = 1\n```', u'End'])
+
+    def test_lists_right_after_text_are_separate_blocks(self):
+        self.assertEqual(
+            split_blocks(u'Pets:\n- cats\n- dogs\n  too\n1. first'),
+            [u'Pets:', u'- cats\n- dogs\n  too', u'1. first'])
+        self.assertEqual(
+            to_html(u'Pets:\n- cats\n- dogs'),
+            u'<p>Pets:</p>\n<ul><li>cats</li><li>dogs</li></ul>')
+
+    def test_fence_closed_on_the_same_line_is_not_a_code_block(self):
+        self.assertEqual(split_blocks(u'```x```\nText\n\n# Part'),
+                         [u'```x```\nText', u'# Part'])
+        self.assertEqual(to_html(u'```x```'), u'<p>``<code>x</code>``</p>')
+
+
+class MarkdownArticleTest(BaseTestCase):
+    def test_markdown_article_is_shown_as_html(self):
+        # Bob writes an article in markdown, linking to another one.
+        page = self.create_article(
+            '/kittens', body=u'# Care\nSee [[Kitten Food]].',
+            markup='markdown')
+        self.assertEqual(page.pyquery('#wiki-body h1').text(), 'Care')
+        link = page.pyquery('#wiki-body a')
+        self.assertEqual(link.attr('href'), '/Kitten_Food')
+        self.assertIn('missing-link', link.attr('class'))
+
+        # The source is edited in the same markup.
+        edit_page = self.testapp.get('/_edit/kittens')
+        self.assertEqual(edit_page.form['markup'].value, 'markdown')
+        self.assertEqual(edit_page.form['body'].value,
+                         u'# Care\nSee [[Kitten Food]].')
+
+    def test_markdown_sections_are_edited_separately(self):
+        self.create_article('/kittens', body=u'Intro\n# Food\nFish\n# Toys\n',
+                            markup='markdown')
+        edit_page = self.testapp.get('/_edit/kittens?section=1')
+        self.assertEqual(edit_page.form['body'].value, u'# Food\nFish\n')
+        page = self.fill_form(edit_page, body=u'# Food\nMilk\n').submit()
+        page = page.follow()
+        self.assertEqual(page.pyquery('#wiki-body p').eq(1).text(), 'Milk')
+
+
+class PreviewTest(BaseTestCase):
+    def setUp(self):
+        super(PreviewTest, self).setUp()
+        self.sign_up()
+        import pipeline
+        self.processed = []
+        self.original_process = pipeline.process
+
+        def process(body, markup='html'):
+            self.processed.append(body)
+            return self.original_process(body, markup)
+        pipeline.process = process
+
+    def tearDown(self):
+        import pipeline
+        pipeline.process = self.original_process
+        super(PreviewTest, self).tearDown()
+
+    def preview(self, body, known=()):
+        return self.testapp.post('/_preview', {
+            'body': body, 'markup': 'markdown', 'known': ','.join(known)}).json
+
+    def test_only_changed_blocks_are_processed(self):
+        first = self.preview(u'# Kittens\nThey *purr*.')
+        self.assertEqual([b['html'] for b in first['blocks']],
+                         [u'<h1>Kittens</h1>', u'<p>They <em>purr</em>.</p>'])
+
+        # Bob edits the second block; the heading is neither processed
+        # again, nor sent back.
+        del self.processed[:]
+        second = self.preview(u'# Kittens\nThey *sleep*.',
+                              known=[first['blocks'][0]['hash']])
+        self.assertEqual(self.processed, [u'They *sleep*.'])
+        self.assertEqual([b['html'] for b in second['blocks']],
+                         [None, u'<p>They <em>sleep</em>.</p>'])
+        self.assertEqual(second['blocks'][0]['hash'],
+                         first['blocks'][0]['hash'])
+
+        # Blocks, processed before, are taken from cache.
+        del self.processed[:]
+        self.preview(u'# Kittens\nThey *purr*.')
+        self.assertEqual(self.processed, [])
+
+    def test_blocks_are_processed_again_after_pipeline_changes(self):
+        import pipeline
+
+        first = self.preview(u'They *purr*.')
+        pipeline.PIPELINE_ID += 1
+        self.addCleanup(setattr, pipeline, 'PIPELINE_ID',
+                        pipeline.PIPELINE_ID - 1)
+        del self.processed[:]
+        second = self.preview(u'They *purr*.',
+                              known=[first['blocks'][0]['hash']])
+        self.assertEqual(self.processed, [u'They *purr*.'])
+        self.assertIsNotNone(second['blocks'][0]['html'])
+
+    def test_anonymous_users_cannot_preview(self):
+        self.testapp.get('/logout')
+        self.testapp.post('/_preview', {'body': 'x'}, status=403)
@@ -0,0 +1,57 @@
+"""Picks the number of PBKDF2 iterations, that makes one password hash take
+the target time on this machine. Run it on hardware comparable to production
+instances and put the result into PASSWORD_HASH_ITERATIONS in app.yaml.
+
+Usage:
+    python tools/calibrate_hash.py [--target-ms 50] [--samples 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from hashutils import make_salt, pbkdf2
+
+PROBE_ITERATIONS = 10000
+
+
+def hash_time(iterations, samples):
+    """Returns the best time of hashing with given iterations, seconds."""
+    salt = make_salt()
+    timings = []
+    for _ in range(samples):
+        start = time.time()
+        pbkdf2('bobtest123', salt, iterations)
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def calibrate(target, samples):
+    iterations = PROBE_ITERATIONS
+    # Hashing time is linear in iterations; the second round refines the
+    # estimate made from a short probe.
+    for _ in range(2):
+        elapsed = hash_time(iterations, samples)
+        iterations = max(1000, int(iterations * target / elapsed))
+    return iterations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Pick PBKDF2 iterations for the target hashing time.')
+    parser.add_argument('--target-ms', type=float, default=50)
+    parser.add_argument('--samples', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    iterations = calibrate(args.target_ms / 1000.0, args.samples)
+    elapsed = hash_time(iterations, args.samples)
+    print('{} iterations take {:.1f} ms'.format(iterations, elapsed * 1000))
+    print("env_variables:\n  PASSWORD_HASH_ITERATIONS: '{}'".format(iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Deletes expired sessions, like the /_cron/sessions job does, resuming an
+interrupted run.
+
+Usage:
+    python tools/cleanup_sessions.py [--server HOST] [--batch-size 500]
+
+With --server the datastore of a deployed application (or of a local
+development server, e.g. localhost:8080 with --insecure) is updated via
+remote_api; otherwise the datastore must already be configured (e.g. by a
+testbed).
+"""
+import argparse
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Delete expired sessions.')
+    parser.add_argument('--server',
+                        help='update datastore of an application via '
+                             'remote_api, e.g. '
+                             'udacity-webdev-final.appspot.com')
+    parser.add_argument('--insecure', action='store_true',
+                        help='connect over HTTP, for the development server')
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.server:
+        from google.appengine.ext.remote_api import remote_api_stub
+        remote_api_stub.ConfigureRemoteApiForOAuth(
+            args.server, '/_ah/remote_api', secure=not args.insecure)
+
+    from model import SessionCleanup
+    kwargs = {'batch_size': args.batch_size} if args.batch_size else {}
+    deleted, _ = SessionCleanup.run(**kwargs)
+    print('Deleted {} expired session(s)'.format(deleted))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Compiles all templates into Python modules, loaded by jinja2.ModuleLoader
+in production. Must be run before every deployment: compiled templates are
+stored with a hash of their sources, and production falls back to the sources,
+if they don't match.
+
+Usage:
+    python tools/compile_templates.py
+"""
+import os
+import shutil
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import jinja2
+from jinjacfg import (
+    COMPILED_TEMPLATES_DIR, SOURCES_HASH_FILE, TEMPLATES_DIR,
+    make_environment, sources_hash)
+
+
+def compile_templates(target=COMPILED_TEMPLATES_DIR, source=TEMPLATES_DIR):
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    environment = make_environment(jinja2.FileSystemLoader(source))
+    compiled = []
+    environment.compile_templates(
+        target, zip=None, ignore_errors=False, log_function=compiled.append)
+    with open(os.path.join(target, SOURCES_HASH_FILE), 'w') as f:
+        f.write(sources_hash(source))
+    return compiled
+
+
+def main():
+    for line in compile_templates():
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""Prints a token, that makes the application profile a request to the given
+path. PROFILE_SECRET environment variable must hold the same secret, as the
+application has.
+
+Usage:
+    PROFILE_SECRET=... python tools/profile_token.py /Some_page [lifetime]
+
+Then request the page with the token in X-Profile header (or _profile query
+parameter) and open /_profile/<id> with id from X-Profile-Id response header.
+"""
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import profiling
+
+
+def main(argv):
+    if not profiling.SECRET:
+        sys.exit('PROFILE_SECRET is not set')
+    lifetime = int(argv[2]) if len(argv) > 2 else profiling.TOKEN_LIFETIME
+    print(profiling.make_token(argv[1], lifetime))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,104 @@
+"""Moves articles, stored before they were keyed by url, to keyed entities
+and points their versions, chunks and uploads to the new entities.
+Articles, whose url already has a keyed article with another history, can't
+be moved and are reported.
+
+Usage:
+    python tools/rekey_articles.py [--server HOST]
+
+With --server the datastore of a deployed application is updated via
+remote_api; otherwise the datastore must already be configured (e.g. by a
+testbed). An interrupted run is completed by running the tool again.
+"""
+import argparse
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+BATCH_SIZE = 500
+
+
+def repoint(query, prop_name, new_key):
+    """Sets prop_name of entities, that query returns, to new_key."""
+    from google.appengine.ext import db
+
+    batch = []
+    for entity in query.run(batch_size=BATCH_SIZE):
+        setattr(entity, prop_name, new_key)
+        batch.append(entity)
+        if len(batch) == BATCH_SIZE:
+            # Model.put of versions is bypassed, their texts stay as they are.
+            db.put(batch)
+            batch = []
+    db.put(batch)
+
+
+def rekey_article(old):
+    from model import (
+        Article, AttachmentUpload, Version, VersionChunk,
+        forget_missing_link, global_parent, invalidate_article_index)
+
+    new = Article.get_by_key_name(old.url, parent=global_parent())
+    if new is None:
+        new = Article(key_name=old.url, url=old.url,
+                      first_version=old.first_version_key(),
+                      latest_version=old.latest_version_key(),
+                      retention_policy=old.retention_policy,
+                      parent=global_parent())
+        new.put()
+    elif new.first_version_key() != old.first_version_key():
+        return False
+
+    new_key = new.key()
+    repoint(Version.all().ancestor(global_parent()).filter('article =', old),
+            'article', new_key)
+    repoint(VersionChunk.all().ancestor(global_parent()).filter(
+        'article =', old), 'article', new_key)
+    repoint(AttachmentUpload.all().filter('article =', old), 'article',
+            new_key)
+    old.delete()
+    # Links to the url were shown as missing.
+    forget_missing_link(old.url)
+    invalidate_article_index()
+    return True
+
+
+def rekey_articles():
+    """Returns a tuple of lists of urls: moved and conflicting articles."""
+    from model import Article, global_parent
+
+    moved, conflicts = [], []
+    for article in Article.all().ancestor(global_parent()):
+        if article.key().name() is not None:
+            continue
+        if rekey_article(article):
+            moved.append(article.url)
+        else:
+            conflicts.append(article.url)
+    return moved, conflicts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Key articles by url.')
+    parser.add_argument('--server',
+                        help='update datastore of a deployed application via '
+                             'remote_api, e.g. '
+                             'udacity-webdev-final.appspot.com')
+    args = parser.parse_args(argv)
+
+    if args.server:
+        from google.appengine.ext.remote_api import remote_api_stub
+        remote_api_stub.ConfigureRemoteApiForOAuth(
+            args.server, '/_ah/remote_api')
+
+    moved, conflicts = rekey_articles()
+    print('Moved {} article(s)'.format(len(moved)))
+    for url in conflicts:
+        print('Not moved, url is taken: {}'.format(url))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Moves users, stored before they were keyed by normalized name, to keyed
+entities and points their sessions, versions, uploads and attachments to the
+new entities. Users, whose names differ only in case from an already keyed
+user, can't be moved and are reported. An interrupted run is completed by
+running the tool again.
+
+Usage:
+    python tools/rekey_users.py [--server HOST]
+
+With --server the datastore of a deployed application is updated via
+remote_api; otherwise the datastore must already be configured (e.g. by a
+testbed).
+"""
+import argparse
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def rekey_user(old):
+    from google.appengine.ext import db
+    from model import (
+        Attachment, AttachmentUpload, Session, User, Version, global_parent)
+    from tools.rekey_articles import repoint
+
+    def create():
+        new = User.get_by_key_name(User.key_name_for(old.name),
+                                   parent=global_parent())
+        if new is None:
+            new = User(key_name=User.key_name_for(old.name), name=old.name,
+                       password_hash=old.password_hash, email=old.email,
+                       parent=global_parent())
+            new.put()
+        # The same hash means, that an interrupted run has created it.
+        elif new.password_hash != old.password_hash:
+            return None
+        return new
+
+    new = db.run_in_transaction(create)
+    if new is None:
+        return False
+    new_key = new.key()
+    repoint(Session.all().ancestor(global_parent()).filter('user =', old),
+            'user', new_key)
+    repoint(Version.all().ancestor(global_parent()).filter('author =', old),
+            'author', new_key)
+    repoint(AttachmentUpload.all().filter('author =', old), 'author', new_key)
+    repoint(Attachment.all().filter('author =', old), 'author', new_key)
+    old.delete()
+    return True
+
+
+def rekey_users():
+    """Returns a tuple of lists of names: moved and conflicting users."""
+    from model import User, global_parent
+
+    moved, conflicts = [], []
+    for user in User.all().ancestor(global_parent()):
+        if user.key().name() is not None:
+            continue
+        if rekey_user(user):
+            moved.append(user.name)
+        else:
+            conflicts.append(user.name)
+    return moved, conflicts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Key users by normalized name.')
+    parser.add_argument('--server',
+                        help='update datastore of a deployed application via '
+                             'remote_api, e.g. '
+                             'udacity-webdev-final.appspot.com')
+    args = parser.parse_args(argv)
+
+    if args.server:
+        from google.appengine.ext.remote_api import remote_api_stub
+        remote_api_stub.ConfigureRemoteApiForOAuth(
+            args.server, '/_ah/remote_api')
+
+    moved, conflicts = rekey_users()
+    print('Moved {} user(s)'.format(len(moved)))
+    for name in conflicts:
+        print('Not moved, name is taken: {}'.format(name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+# --coding:utf-8--
+"""Renders the latest version of every article into a directory of static
+HTML files.
+
+Usage:
+    python tools/snapshot.py OUTPUT_DIR [--incremental] [--server HOST]
+
+With --server the datastore of a deployed application is read via
+remote_api; otherwise the datastore must already be configured (e.g. by a
+testbed). With --incremental only articles, whose latest version has changed
+since the last snapshot, are rendered again.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import wikilinks
+
+
+MANIFEST_NAME = 'manifest.json'
+BATCH_SIZE = 100
+BODY_CHUNK_SIZE = 32 * 1024  # characters
+
+
+class SnapshotVersion(object):
+    # Stands for Version in templates, so that workers don't touch datastore.
+    def __init__(self, version_id, body, is_first):
+        self.id = version_id
+        self._body = body
+        self._is_first = is_first
+
+    def is_first(self):
+        return self._is_first
+
+    def is_latest(self):
+        return True
+
+    def annotated_body(self):
+        return self._body
+
+    def annotated_body_chunks(self):
+        return wikilinks.split_at_tags(self._body, BODY_CHUNK_SIZE)
+
+
+class SnapshotArticle(object):
+    def __init__(self, url, head, modified, version):
+        self.url = url
+        self.head = head
+        self.modified = modified
+        self.version = version
+
+
+def path_for_url(url):
+    return os.path.join(*(url.strip('/').split('/') + ['index.html']))
+
+
+def render_article(task):
+    """Renders one article into output directory. Runs in a worker process."""
+    from jinjacfg import get_template
+
+    output_dir, data = task
+    version = SnapshotVersion(
+        data['version_id'], data['body'], data['is_first'])
+    article = SnapshotArticle(
+        data['url'], data['head'], data['modified'], version)
+    html = get_template('wiki/view_page.html').render(
+        mode='view', article=article, user=None,
+        title=u'MyWiki — {}'.format(article.head))
+
+    path = path_for_url(data['url'])
+    full_path = os.path.join(output_dir, path)
+    if not os.path.isdir(os.path.dirname(full_path)):
+        os.makedirs(os.path.dirname(full_path))
+    with open(full_path, 'wb') as f:
+        f.write(html.encode('utf-8'))
+    return data['url'], data['version_id'], data['saved'], path
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except IOError:
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def saved_timestamp(version):
+    # Versions, stored before saves were coalesced, have no saved time.
+    return version.saved.isoformat() if version.saved else None
+
+
+def iter_changed_articles(manifest, batch_size=BATCH_SIZE):
+    """Yields lists of render data for articles, whose latest version is not
+    in manifest, or has been overwritten since. Articles are read page by page
+    with a cursor; latest versions of every page are fetched with one batch
+    get."""
+    from google.appengine.ext import db
+    from model import Article, global_parent
+
+    q = Article.all().ancestor(global_parent()).order('__key__')
+    articles = q.fetch(batch_size)
+    while articles:
+        latest = db.get([Article.latest_version.get_value_for_datastore(a)
+                         for a in articles])
+        changed = []
+        for a, version in zip(articles, latest):
+            entry = manifest.get(a.url, {})
+            if (entry.get('version') != version.key().id() or
+                    entry.get('saved') != saved_timestamp(version)):
+                changed.append((a, version))
+        versions = [version for _, version in changed]
+
+        # Existence of all linked articles is checked at once for the page.
+        urls = set()
+        html = dict((version.key(), u''.join(version.html_pieces()))
+                    for version in versions)
+        for version in versions:
+            urls.update(wikilinks.internal_urls(html[version.key()]))
+        link_status = Article.existing_urls(list(urls)) if urls else {}
+
+        first_version = Article.first_version.get_value_for_datastore
+        yield [{
+            'url': a.url, 'head': version.head, 'modified': version.created,
+            'version_id': version.key().id(), 'saved': saved_timestamp(version),
+            'is_first': first_version(a) == version.key(),
+            'body': wikilinks.annotate_links(html[version.key()], link_status)
+        } for a, version in changed]
+
+        articles = q.with_cursor(q.cursor()).fetch(batch_size)
+
+
+def snapshot(output_dir, incremental=False, processes=None):
+    """Renders articles into output_dir. Returns a list of urls of rendered
+    articles."""
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    manifest = load_manifest(output_dir) if incremental else {}
+
+    stylesheets = os.path.join(output_dir, 'stylesheets')
+    if os.path.isdir(stylesheets):
+        shutil.rmtree(stylesheets)
+    shutil.copytree(os.path.join(PROJECT_ROOT, 'stylesheets'), stylesheets)
+
+    rendered = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for batch in iter_changed_articles(manifest):
+            tasks = [(output_dir, data) for data in batch]
+            for url, version_id, saved, path in pool.imap_unordered(
+                    render_article, tasks):
+                manifest[url] = {
+                    'version': version_id, 'saved': saved, 'path': path}
+                rendered.append(url)
+    finally:
+        pool.close()
+        pool.join()
+
+    save_manifest(output_dir, manifest)
+    return rendered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Render all articles into static HTML files.')
+    parser.add_argument('output_dir')
+    parser.add_argument('--incremental', action='store_true',
+                        help='render only articles changed since the last '
+                             'snapshot')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of rendering processes (default: number '
+                             'of CPUs)')
+    parser.add_argument('--server',
+                        help='read datastore of a deployed application via '
+                             'remote_api, e.g. '
+                             'udacity-webdev-final.appspot.com')
+    args = parser.parse_args(argv)
+
+    if args.server:
+        from google.appengine.ext.remote_api import remote_api_stub
+        remote_api_stub.ConfigureRemoteApiForOAuth(
+            args.server, '/_ah/remote_api')
+
+    rendered = snapshot(args.output_dir, args.incremental, args.processes)
+    print('Rendered {} article(s) into {}'.format(
+        len(rendered), args.output_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import re
+
+
+LINK_TAG_RE = re.compile(r'<a\b[^>]*>', re.IGNORECASE)
+HREF_RE = re.compile(
+    r'''\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+CLASS_RE = re.compile(r'''\bclass\s*=\s*(["'])(.*?)\1''', re.IGNORECASE)
+ARTICLE_URL_RE = re.compile(r'^(?:/[a-zA-Z0-9_-]*)+$')
+VERSION_SUFFIX_RE = re.compile(r'/?_version/\d+$')
+
+EXISTING_LINK_CLASS = 'internal-link'
+MISSING_LINK_CLASS = 'missing-link'
+# Paths, served by handlers other than ViewPage.
+RESERVED_URLS = ('/signup', '/login', '/logout')
+RESERVED_PREFIXES = ('/_', '/stylesheets/')
+
+
+def article_url_from_href(href):
+    """Returns url of the article, that href points to, or None, if href does
+    not point to an article of this wiki."""
+    href = href.strip().split('#', 1)[0].split('?', 1)[0]
+    if not href.startswith('/') or href.startswith('//'):
+        return None
+    url = VERSION_SUFFIX_RE.sub('', href) or '/'
+    if len(url) > 1:
+        url = url.rstrip('/') or '/'
+    if url in RESERVED_URLS or url.startswith(RESERVED_PREFIXES):
+        return None
+    if not ARTICLE_URL_RE.match(url):
+        return None
+    return url
+
+
+def split_at_tags(html, size, at_most=False):
+    """Yields consecutive slices of html, cut right before a '<'.
+
+    By default slices are at least size characters long (except the last
+    one), so that no tag is ever split; this is what link annotation needs.
+    With at_most slices are at most size characters long, e.g. to fit an
+    entity, and text without a '<' to cut before is cut anywhere.
+    """
+    start = 0
+    while len(html) - start > size:
+        if at_most:
+            end = html.rfind('<', start + 1, start + size + 1)
+            if end == -1:
+                end = start + size
+        else:
+            end = html.find('<', start + size)
+            if end == -1:
+                break
+        yield html[start:end]
+        start = end
+    yield html[start:]
+
+
+def tag_href(tag):
+    match = HREF_RE.search(tag)
+    if match is not None:
+        return next(g for g in match.groups() if g is not None)
+
+
+def internal_urls(body):
+    """Returns a list of unique article urls linked from body, in order of
+    their first appearance."""
+    urls = []
+    seen = set()
+    for tag in LINK_TAG_RE.findall(body or ''):
+        href = tag_href(tag)
+        url = article_url_from_href(href) if href is not None else None
+        if url is not None and url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def _add_class(tag, css_class):
+    match = CLASS_RE.search(tag)
+    if match is not None:
+        classes = match.group(2).split()
+        if css_class in classes:
+            return tag
+        value = u' '.join(classes + [css_class])
+        return u'{0}class={1}{2}{1}{3}'.format(
+            tag[:match.start()], match.group(1), value, tag[match.end():])
+    end = -2 if tag.endswith('/>') else -1
+    return u'{0} class="{1}"{2}'.format(
+        tag[:end].rstrip(), css_class, tag[end:])
+
+
+def annotate_links(body, link_status):
+    """Marks internal links in body as pointing to existing or missing
+    articles. link_status maps article urls to booleans."""
+    def annotate(match):
+        tag = match.group(0)
+        href = tag_href(tag)
+        url = article_url_from_href(href) if href is not None else None
+        if url not in link_status:
+            return tag
+        if link_status[url]:
+            return _add_class(tag, EXISTING_LINK_CLASS)
+        return _add_class(tag, MISSING_LINK_CLASS)
+
+    if not body:
+        return body
+    return LINK_TAG_RE.sub(annotate, body)
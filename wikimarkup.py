@@ -0,0 +1,149 @@
+"""Markdown-like wiki markup.
+
+Blocks are separated by blank lines: paragraphs, headings ('#' to '######'),
+lists ('-', '*' or '1.'), block quotes ('>'), fenced code ('```') and
+horizontal rules ('---'). Inside them: **strong**, *emphasis*, `code`,
+[text](url) links and wiki links: [[Page Name]] or [[Page Name|text]] point
+to /Page_Name. Text is escaped; HTML is not passed through.
+
+Every block is rendered independently of the others, so that a preview
+re-renders only the blocks, that have changed.
+"""
+from cgi import escape
+import re
+
+
+FENCE = '```'
+# Only a fence with an optional language name opens fenced code.
+OPENING_FENCE_RE = re.compile(r'```[\w+-]*\Z')
+HEADING_RE = re.compile(r'(#{1,6})\s+(.*?)\s*#*\s*\Z')
+RULE_RE = re.compile(r'(?:-{3,}|\*{3,})\s*\Z')
+UNORDERED_ITEM_RE = re.compile(r'[-*]\s+(.*)\Z')
+ORDERED_ITEM_RE = re.compile(r'\d+\.\s+(.*)\Z')
+QUOTE_RE = re.compile(r'>\s?(.*)\Z')
+CODE_SPAN_RE = re.compile(r'`([^`]+)`')
+WIKI_LINK_RE = re.compile(r'\[\[([^\]|]+)(?:\|([^\]]+))?\]\]')
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+STRONG_RE = re.compile(r'\*\*(.+?)\*\*')
+EMPHASIS_RE = re.compile(r'\*(.+?)\*')
+URL_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_/-]')
+
+
+def wiki_url(title):
+    """Returns url of the article with title; the reverse of
+    EditPage.form_head_from_path."""
+    path = '/'.join('_'.join(part.split()) for part in title.split('/'))
+    return '/' + URL_UNSAFE_RE.sub('', path).strip('/')
+
+
+def _list_item_re(line):
+    """Returns the regexp of list items, that line matches, or None."""
+    for item_re in (UNORDERED_ITEM_RE, ORDERED_ITEM_RE):
+        if item_re.match(line):
+            return item_re
+
+
+def split_blocks(source):
+    """Returns a list of block sources. Headings and fenced code are blocks
+    of their own; a list starts a new block, even if no blank line separates
+    it from the text above."""
+    blocks = []
+    lines = []
+
+    def end_block():
+        if lines:
+            blocks.append(u'\n'.join(lines))
+            del lines[:]
+
+    in_fence = False
+    for line in (source or u'').replace(u'\r\n', u'\n').split(u'\n'):
+        stripped = line.strip()
+        if in_fence:
+            lines.append(line)
+            if stripped == FENCE:
+                in_fence = False
+                end_block()
+        elif OPENING_FENCE_RE.match(stripped):
+            end_block()
+            lines.append(line)
+            in_fence = True
+        elif not stripped:
+            end_block()
+        elif HEADING_RE.match(stripped):
+            end_block()
+            lines.append(line)
+            end_block()
+        else:
+            item_re = _list_item_re(stripped)
+            if (item_re is not None and lines and
+                    _list_item_re(lines[0].strip()) is not item_re):
+                end_block()
+            lines.append(line)
+    end_block()
+    return blocks
+
+
+def _wiki_link(match):
+    title, text = match.group(1).strip(), match.group(2)
+    return u'<a href="{}">{}</a>'.format(
+        wiki_url(title), (text or title).strip())
+
+
+def _render_text(text):
+    # text is escaped already.
+    text = WIKI_LINK_RE.sub(_wiki_link, text)
+    text = LINK_RE.sub(r'<a href="\2">\1</a>', text)
+    text = STRONG_RE.sub(r'<strong>\1</strong>', text)
+    return EMPHASIS_RE.sub(r'<em>\1</em>', text)
+
+
+def render_inline(text):
+    parts = CODE_SPAN_RE.split(escape(text, quote=True))
+    # Odd parts are contents of code spans.
+    return u''.join(
+        u'<code>{}</code>'.format(part) if i % 2 else _render_text(part)
+        for i, part in enumerate(parts))
+
+
+def _render_list(lines, item_re, tag):
+    items = []
+    for line in lines:
+        match = item_re.match(line.strip())
+        if match is not None or not items:
+            items.append(match.group(1) if match is not None else line)
+        else:
+            # Continuation of the previous item.
+            items[-1] += u'\n' + line.strip()
+    return u'<{0}>{1}</{0}>'.format(tag, u''.join(
+        u'<li>{}</li>'.format(render_inline(item)) for item in items))
+
+
+def render_block(block):
+    lines = block.split(u'\n')
+    first = lines[0].strip()
+    if OPENING_FENCE_RE.match(first):
+        if len(lines) > 1 and lines[-1].strip() == FENCE:
+            lines = lines[:-1]
+        return u'<pre><code>{}</code></pre>'.format(
+            escape(u'\n'.join(lines[1:])))
+    match = HEADING_RE.match(first)
+    if match is not None:
+        level = len(match.group(1))
+        return u'<h{0}>{1}</h{0}>'.format(level, render_inline(match.group(2)))
+    if len(lines) == 1 and RULE_RE.match(first):
+        return u'<hr>'
+    if UNORDERED_ITEM_RE.match(first):
+        return _render_list(lines, UNORDERED_ITEM_RE, 'ul')
+    if ORDERED_ITEM_RE.match(first):
+        return _render_list(lines, ORDERED_ITEM_RE, 'ol')
+    if all(QUOTE_RE.match(line.strip()) for line in lines):
+        text = u'\n'.join(QUOTE_RE.match(line.strip()).group(1)
+                          for line in lines)
+        return u'<blockquote><p>{}</p></blockquote>'.format(
+            render_inline(text))
+    return u'<p>{}</p>'.format(render_inline(u'\n'.join(
+        line.strip() for line in lines)))
+
+
+def to_html(source):
+    return u'\n'.join(render_block(block) for block in split_blocks(source))